@@ -0,0 +1,232 @@
+"""JSON API for published posts.
+
+GET api/posts/ lists posts newest first with the same cursor pagination as
+the HTML listings; GET api/posts/<slug>/ returns one post. ``?fields=`` picks
+a sparse fieldset (e.g. ``?fields=slug,title,like_count``) and only the
+columns those fields need are loaded.
+
+Both endpoints answer conditional GETs. The ETag comes from a query of the
+post ids and timestamps only: ``updated_at`` for edits and
+``counters_updated_at`` for views, likes, bookmarks and comments. Signals
+stamp ``updated_at`` when a post's tags change or its category or author is
+renamed, since those show up in the body too. When
+nothing changed the client gets a 304 after that one query, before any
+post is loaded or serialized. The detail also sends Last-Modified; the list
+does not, since no timestamp records a post deleted or unpublished from it.
+
+POST api/posts/<id>/like/ and .../bookmark/ toggle the current user's
+state and return it with the new count, for pages that update in place.
+"""
+import hashlib
+
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition, require_POST, require_safe
+
+from .engagement import set_engagement
+from .models import Post
+from .pagination import get_page_size, paginate
+
+# Public field name -> model columns it reads
+FIELDS = {
+    'id': ['id'],
+    'slug': ['slug'],
+    'title': ['title'],
+    'excerpt': ['excerpt'],
+    'content': ['content'],
+    'status': ['status'],
+    'author': ['author__username'],
+    'category': ['category__name'],
+    'tags': [],
+    'created_at': ['created_at'],
+    'updated_at': ['updated_at'],
+    'read_time': ['read_time'],
+    'word_count': ['word_count'],
+    'views': ['views'],
+    'like_count': ['like_count'],
+    'bookmark_count': ['bookmark_count'],
+    'comment_count': ['comment_count'],
+}
+LIST_FIELDS = [name for name in FIELDS if name != 'content']
+DETAIL_FIELDS = list(FIELDS)
+VALIDATOR_COLUMNS = ['id', 'created_at', 'updated_at', 'counters_updated_at']
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def published_posts():
+    return Post.objects.filter(status='published')
+
+
+def requested_fields(request, default):
+    raw = request.GET.get('fields')
+    if not raw:
+        return default
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = [name for name in names if name not in FIELDS]
+    if unknown:
+        raise BadRequest(f'Unknown fields: {", ".join(unknown)}')
+    return names
+
+
+def load_posts(queryset, fields):
+    """Apply the joins, prefetches and column list that ``fields`` needs."""
+    columns = {'id', 'created_at'}
+    for name in fields:
+        columns.update(FIELDS[name])
+    if 'author' in fields:
+        queryset = queryset.select_related('author')
+    if 'category' in fields:
+        queryset = queryset.select_related('category')
+    if 'tags' in fields:
+        queryset = queryset.prefetch_related('tags')
+    return queryset.only(*columns)
+
+
+def serialize_post(post, fields):
+    data = {}
+    for name in fields:
+        if name == 'author':
+            data[name] = post.author.username
+        elif name == 'category':
+            data[name] = post.category.name if post.category_id else None
+        elif name == 'tags':
+            data[name] = [tag.name for tag in post.tags.all()]
+        else:
+            data[name] = getattr(post, name)
+    return data
+
+
+def last_changed(post):
+    if post.counters_updated_at and post.counters_updated_at > post.updated_at:
+        return post.counters_updated_at
+    return post.updated_at
+
+
+def make_etag(request, rows):
+    digest = hashlib.sha1(request.get_full_path().encode())
+    for row in rows:
+        digest.update(f'|{row.pk}:{row.updated_at.timestamp()}:'.encode())
+        if row.counters_updated_at:
+            digest.update(str(row.counters_updated_at.timestamp()).encode())
+    return digest.hexdigest()
+
+
+def validators(request, compute):
+    """Run ``compute`` once per request; condition() asks for the ETag and
+    Last-Modified separately."""
+    if not hasattr(request, '_api_validators'):
+        request._api_validators = compute(request)
+    return request._api_validators
+
+
+# Detail
+
+def _detail_state(request):
+    row = (
+        published_posts()
+        .filter(slug=request.resolver_match.kwargs['slug'])
+        .only(*VALIDATOR_COLUMNS)
+        .first()
+    )
+    if row is None:
+        return None
+    return {'etag': make_etag(request, [row]), 'last_modified': last_changed(row)}
+
+
+def _detail_etag(request, slug):
+    state = validators(request, _detail_state)
+    return state and state['etag']
+
+
+def _detail_last_modified(request, slug):
+    state = validators(request, _detail_state)
+    return state and state['last_modified']
+
+
+@require_safe
+@condition(etag_func=_detail_etag, last_modified_func=_detail_last_modified)
+def post_detail(request, slug):
+    try:
+        fields = requested_fields(request, DETAIL_FIELDS)
+    except BadRequest as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    post = get_object_or_404(load_posts(published_posts(), fields), slug=slug)
+    return JsonResponse(serialize_post(post, fields))
+
+
+# List
+
+def _list_queryset(request):
+    posts = published_posts()
+    category_id = request.GET.get('category')
+    if category_id:
+        if not category_id.isdigit():
+            raise BadRequest('category must be an id')
+        posts = posts.filter(category_id=category_id)
+    return posts
+
+
+def _list_state(request):
+    # The page is fetched as bare keys and timestamps; the view loads the
+    # full rows for exactly these ids, so the body always matches the ETag
+    try:
+        page = paginate(
+            _list_queryset(request).only(*VALIDATOR_COLUMNS),
+            cursor=request.GET.get('cursor'),
+            page_size=get_page_size(request),
+        )
+    except BadRequest:
+        return None
+    return {'page': page, 'etag': make_etag(request, page)}
+
+
+def _list_etag(request):
+    state = validators(request, _list_state)
+    return state and state['etag']
+
+
+def page_url(request, cursor):
+    if not cursor:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+
+@require_safe
+@condition(etag_func=_list_etag)
+def post_list(request):
+    try:
+        fields = requested_fields(request, LIST_FIELDS)
+        _list_queryset(request)
+    except BadRequest as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    page = validators(request, _list_state)['page']
+    posts = load_posts(published_posts(), fields).in_bulk([row.pk for row in page])
+    return JsonResponse({
+        'results': [serialize_post(posts[row.pk], fields) for row in page if row.pk in posts],
+        'next': page_url(request, page.next_cursor),
+        'previous': page_url(request, page.previous_cursor),
+    })
+
+
+# Like / bookmark toggles
+
+STATES = {'on': True, 'off': False, '': None}
+
+
+@require_POST
+def toggle_engagement(request, post_id, kind):
+    """POST flips the state; ``state=on|off`` sets it, so retries are harmless."""
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    state = request.POST.get('state', '')
+    if state not in STATES:
+        return JsonResponse({'error': 'state must be on or off'}, status=400)
+    if not Post.objects.filter(pk=post_id).exists():
+        return JsonResponse({'error': 'Not found'}, status=404)
+    active, count = set_engagement(kind, post_id, request.user, STATES[state])
+    return JsonResponse({'post': post_id, kind: active, 'count': count})
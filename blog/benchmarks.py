@@ -0,0 +1,305 @@
+"""Helpers shared by the bench_* management commands.
+
+Benchmarks never touch the configured database: they run against a scratch
+test database created for the run and destroyed afterwards. seed_site()
+fills one with a synthetic site through bulk_create; the seed_bench command
+runs it against the configured database.
+"""
+import contextlib
+import itertools
+import random
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import related, search
+from .content import analyze_html
+from .models import Bookmark, Category, Comment, Like, Post, Profile, Tag
+from .trending import recompute
+
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ne', 'su', 'ta', 'ri', 'po', 'de', 'gu',
+    'va', 'ze', 'chi', 'bo', 'fa', 'ly', 'nu', 'ro', 'se', 'ti',
+]
+
+
+@contextlib.contextmanager
+def scratch_database(using='default'):
+    connection = connections[using]
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def time_calls(func, args_list):
+    """Call ``func(*args)`` for each args tuple and return latencies in ms."""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+class TextGenerator:
+    """Deterministic pseudo-words with a Zipf-like frequency distribution."""
+
+    def __init__(self, seed=0, vocabulary_size=5000):
+        self.rng = random.Random(seed)
+        words = []
+        for length in (2, 3, 4):
+            for parts in itertools.product(SYLLABLES, repeat=length):
+                words.append(''.join(parts))
+                if len(words) >= vocabulary_size:
+                    break
+            if len(words) >= vocabulary_size:
+                break
+        self.words = words
+        self.cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+    def sample(self, count):
+        return self.rng.choices(self.words, cum_weights=self.cum_weights, k=count)
+
+    def sentence(self, count):
+        return ' '.join(self.sample(count)).capitalize()
+
+    def html(self, paragraphs=4, words_per_paragraph=60):
+        return ''.join(
+            f'<p>{self.sentence(words_per_paragraph)}.</p>' for _ in range(paragraphs)
+        )
+
+    def rare_word(self):
+        # Drawn uniformly, so mostly from the long tail
+        return self.rng.choice(self.words)
+
+    def paragraph(self, words):
+        words = self.sample(words)
+        words[0] = words[0].capitalize()
+        for markup in ('<a href="https://example.com/{0}">{0}</a>', '<strong>{0}</strong>', '<em>{0}</em>'):
+            if self.rng.random() < 0.3:
+                index = self.rng.randrange(len(words))
+                words[index] = markup.format(words[index])
+        return f'<p>{" ".join(words)}.</p>'
+
+    def article(self, sections=3):
+        """A post body shaped like CKEditor output: headings, paragraphs, lists, quotes and code."""
+        parts = []
+        for _ in range(sections):
+            parts.append(f'<h2>{self.sentence(self.rng.randint(3, 7))}</h2>')
+            parts.extend(self.paragraph(self.rng.randint(30, 120)) for _ in range(self.rng.randint(1, 4)))
+            roll = self.rng.random()
+            if roll < 0.25:
+                items = ''.join(f'<li>{self.sentence(self.rng.randint(3, 12))}</li>' for _ in range(self.rng.randint(3, 6)))
+                parts.append(f'<ul>{items}</ul>')
+            elif roll < 0.4:
+                parts.append(f'<blockquote><p>{self.sentence(self.rng.randint(10, 30))}.</p></blockquote>')
+            elif roll < 0.5:
+                lines = '\n'.join(f'{word} = {self.rng.randint(0, 99)}' for word in self.sample(self.rng.randint(2, 8)))
+                parts.append(f'<pre><code class="language-python">{lines}</code></pre>')
+        return '\n'.join(parts)
+
+
+def zipf_weights(count, exponent, rng):
+    """Popularity weights following a power law, in random order."""
+    weights = [1 / rank ** exponent for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return weights
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the given auto_now/auto_now_add values instead of now()."""
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+SEED_COUNTS = {
+    'users': 200,
+    'categories': 12,
+    'tags': 150,
+    'posts': 5000,
+    'comments': 20000,
+    'likes': 50000,
+    'bookmarks': 10000,
+}
+BENCH_PASSWORD = 'bench'
+
+
+def add_seed_arguments(parser, counts=SEED_COUNTS):
+    for name, default in counts.items():
+        parser.add_argument(f'--{name}', type=int, default=default)
+    parser.add_argument('--days', type=int, default=365, help='Spread posts over this many days back.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1000)
+
+
+def tag_name(word, prefix, number):
+    """A tag name unique to this run's ``prefix`` that fits the column."""
+    suffix = f'-{prefix}{number}'
+    max_length = Tag._meta.get_field('name').max_length
+    if len(suffix) >= max_length:
+        raise ValueError(f'Prefix {prefix!r} leaves no room in {max_length}-character tag names')
+    return word[:max_length - len(suffix)] + suffix
+
+
+def engagement_pairs(count, post_weights, user_count, rng):
+    """Up to ``count`` distinct (post index, user index) pairs, popular posts first in line."""
+    pairs = set()
+    cum_weights = list(itertools.accumulate(post_weights))
+    limit = min(count, sum(1 for weight in post_weights if weight) * user_count)
+    while len(pairs) < limit:
+        needed = limit - len(pairs)
+        posts = rng.choices(range(len(post_weights)), cum_weights=cum_weights, k=needed)
+        pairs.update(zip(posts, (rng.randrange(user_count) for _ in range(needed))))
+    return list(pairs)
+
+
+def seed_site(users, categories, tags, posts, comments, likes, bookmarks,
+              days=365, seed=0, batch_size=1000, prefix='bench', now=None, log=None):
+    """Bulk-insert a synthetic site and bring the derived tables up to date.
+
+    Authors, categories, tags and engagement follow power laws, posts are
+    dated over the last ``days`` days (more of them recent), and every user
+    has the password BENCH_PASSWORD. Returns {stage: seconds}.
+    """
+    rng = random.Random(seed)
+    text = TextGenerator(seed)
+    now = now or timezone.now()
+    span = days * 24 * 60 * 60
+    timings = {}
+
+    @contextlib.contextmanager
+    def stage(name):
+        start = time.perf_counter()
+        yield
+        timings[name] = time.perf_counter() - start
+        if log:
+            log(f'{name}: {timings[name]:.1f}s')
+
+    def after(moment):
+        return moment + (now - moment) * rng.random()
+
+    with transaction.atomic(), explicit_timestamps(User, Post, Comment, Like, Bookmark):
+        with stage('users'):
+            password = make_password(BENCH_PASSWORD)
+            User.objects.bulk_create([
+                User(username=f'{prefix}-user{i}', email=f'{prefix}-user{i}@example.com', password=password,
+                     date_joined=now - timedelta(seconds=span * rng.random()))
+                for i in range(users)
+            ], batch_size=batch_size)
+            user_ids = list(User.objects.filter(username__startswith=f'{prefix}-user').order_by('pk')
+                            .values_list('pk', flat=True))
+            # bulk_create skips the signal that makes profiles
+            Profile.objects.bulk_create([Profile(user_id=pk) for pk in user_ids], batch_size=batch_size)
+
+        with stage('categories and tags'):
+            owner = user_ids[0]
+            names = dict.fromkeys(f'{prefix} {word.capitalize()} {i}' for i, word in enumerate(text.sample(categories)))
+            Category.objects.bulk_create([Category(user_id=owner, name=name, slug=slugify(name)) for name in names])
+            category_ids = list(Category.objects.filter(user_id=owner).order_by('pk').values_list('pk', flat=True))
+            Tag.objects.bulk_create(
+                [Tag(user_id=owner, name=tag_name(word, prefix, i)) for i, word in enumerate(text.sample(tags))],
+                batch_size=batch_size,
+            )
+            tag_ids = list(Tag.objects.filter(user_id=owner).order_by('pk').values_list('pk', flat=True))
+
+        with stage('posts'):
+            author_weights = list(itertools.accumulate(zipf_weights(len(user_ids), 1.1, rng)))
+            category_weights = list(itertools.accumulate(zipf_weights(len(category_ids), 0.8, rng)))
+            popularity = zipf_weights(posts, 0.9, rng)
+            published = [rng.random() < 0.9 for _ in range(posts)]
+            post_weights = [weight if live else 0 for weight, live in zip(popularity, published)]
+            like_pairs = engagement_pairs(likes, post_weights, len(user_ids), rng)
+            bookmark_pairs = engagement_pairs(bookmarks, post_weights, len(user_ids), rng)
+            comment_posts = rng.choices(range(posts), weights=post_weights, k=comments) if any(post_weights) else []
+            counts = {
+                'like_count': Counter(post for post, _ in like_pairs),
+                'bookmark_count': Counter(post for post, _ in bookmark_pairs),
+                'comment_count': Counter(comment_posts),
+            }
+
+            rows = []
+            for i in range(posts):
+                title = text.sentence(rng.randint(4, 9))
+                content = text.article(sections=rng.randint(1, 6))
+                stats = analyze_html(content)
+                created = now - timedelta(seconds=span * rng.random() ** 2)
+                rows.append(Post(
+                    author_id=user_ids[rng.choices(range(len(user_ids)), cum_weights=author_weights)[0]],
+                    title=title,
+                    slug=f'{slugify(title)[:30]}-{prefix}{i}',
+                    content=content,
+                    category_id=(category_ids[rng.choices(range(len(category_ids)), cum_weights=category_weights)[0]]
+                                 if category_ids and rng.random() < 0.9 else None),
+                    status='published' if published[i] else 'draft',
+                    created_at=created,
+                    updated_at=after(created),
+                    views=int(popularity[i] * 20000 * rng.random()) if published[i] else 0,
+                    word_count=stats.word_count,
+                    read_time=stats.read_time,
+                    excerpt=stats.excerpt,
+                    **{field: counted[i] for field, counted in counts.items()},
+                ))
+            Post.objects.bulk_create(rows, batch_size=batch_size)
+            by_slug = dict(Post.objects.filter(author_id__in=user_ids).values_list('slug', 'pk'))
+            post_ids = [by_slug[row.slug] for row in rows]
+            post_times = [row.created_at for row in rows]
+
+            tag_weights = list(itertools.accumulate(zipf_weights(len(tag_ids), 1.0, rng)))
+            through = Post.tags.through
+            links = {
+                (post_id, tag_ids[index])
+                for post_id in post_ids if tag_ids
+                for index in rng.choices(range(len(tag_ids)), cum_weights=tag_weights, k=rng.randint(0, 5))
+            }
+            through.objects.bulk_create([through(post_id=post, tag_id=tag) for post, tag in links],
+                                        batch_size=batch_size)
+
+        with stage('comments, likes and bookmarks'):
+            Comment.objects.bulk_create([
+                Comment(post_id=post_ids[post], user_id=rng.choice(user_ids),
+                        content=text.sentence(rng.randint(5, 40)) + '.', created_at=after(post_times[post]))
+                for post in comment_posts
+            ], batch_size=batch_size)
+            for model, pairs in ((Like, like_pairs), (Bookmark, bookmark_pairs)):
+                model.objects.bulk_create([
+                    model(post_id=post_ids[post], user_id=user_ids[user], created_at=after(post_times[post]))
+                    for post, user in pairs
+                ], batch_size=batch_size)
+
+    with stage('search index'):
+        for batch in search.document_batches(Post.objects.filter(author_id__in=user_ids), batch_size):
+            search.write_documents(batch)
+    with stage('trending'):
+        recompute(full=True, now=now)
+    with stage('related posts'):
+        related.build()
+    return timings
@@ -0,0 +1,93 @@
+"""Fragment cache for blog_detail.
+
+The parts of the detail page that look the same to every visitor (post body
+and comment list) are rendered once and cached under keys that embed a
+per-post version. Saving or deleting a Post, Comment, Like or Bookmark, or
+renaming a user shown in them, replaces that version (see blog.signals), so
+stale fragments are never read again and simply age out of the cache.
+
+Versions are fresh time-based values rather than counters, so losing a
+version key to eviction can't bring an older fragment back. They also date
+the last change: a request reading from a replica renders from data that
+may predate it, so its misses aren't cached until BLOG_REPLICA_PIN_SECONDS,
+the lag replicas are expected to stay within, have passed.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from .replicas import read_replica
+
+VERSION_KEY = 'blog:post:{}:version'
+FRAGMENT_KEY = 'blog:post:{}:{}:{}'
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def fragment_timeout():
+    return getattr(settings, 'BLOG_FRAGMENT_CACHE_TIMEOUT', 600)
+
+
+def post_version(post_id):
+    key = VERSION_KEY.format(post_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_post(post_id):
+    cache.set(VERSION_KEY.format(post_id), time.time_ns(), None)
+
+
+def invalidate_posts(post_ids):
+    version = time.time_ns()
+    cache.set_many({VERSION_KEY.format(post_id): version for post_id in post_ids}, None)
+
+
+def replica_may_lag(version):
+    """Whether a render for the current request may predate the change that set ``version``."""
+    if not read_replica():
+        return False
+    lag = getattr(settings, 'BLOG_REPLICA_PIN_SECONDS', 10) * 1_000_000_000
+    return time.time_ns() - version < lag
+
+
+def cached_fragment(post_id, name, render):
+    """Return the cached HTML for fragment ``name`` of a post, rendering on a miss."""
+    version = post_version(post_id)
+    key = FRAGMENT_KEY.format(post_id, version, name)
+    html = cache.get(key)
+    hit = html is not None
+    if not hit:
+        html = render()
+        if not replica_may_lag(version):
+            cache.set(key, html, fragment_timeout())
+    with _stats_lock:
+        _stats[(name, 'hits' if hit else 'misses')] += 1
+    return mark_safe(html)
+
+
+def fragment_stats():
+    """Hit/miss counters for this process, per fragment and overall."""
+    with _stats_lock:
+        stats = dict(_stats)
+    report = {}
+    for name in sorted({name for name, _ in stats}):
+        hits = stats.get((name, 'hits'), 0)
+        misses = stats.get((name, 'misses'), 0)
+        report[name] = {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses)}
+    hits = sum(r['hits'] for r in report.values())
+    misses = sum(r['misses'] for r in report.values())
+    report['total'] = {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+    }
+    return report
@@ -0,0 +1,117 @@
+"""Plain-text analysis of post bodies.
+
+CKEditor stores HTML, so counting ``content.split()`` counts tags and
+attributes as words. TextExtractor walks the HTML once, in chunks, and
+produces the word count, a plain-text excerpt and optionally the full text
+(for the search index) without building an intermediate stripped copy.
+"""
+from collections import namedtuple
+from html.parser import HTMLParser
+
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 300
+CHUNK_SIZE = 8192
+
+# Text inside these is never shown to readers
+SKIP_TAGS = {'script', 'style', 'template', 'head', 'noscript'}
+# These end a word even without surrounding whitespace: <p>a</p><p>b</p>
+BREAK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+    'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'img', 'li', 'ol', 'p', 'pre', 'section', 'table', 'td',
+    'th', 'tr', 'ul',
+}
+
+ContentStats = namedtuple('ContentStats', ['word_count', 'read_time', 'excerpt', 'text'])
+
+
+class TextExtractor(HTMLParser):
+    def __init__(self, excerpt_length=EXCERPT_LENGTH, keep_text=False):
+        super().__init__(convert_charrefs=True)
+        self.excerpt_length = excerpt_length
+        self.keep_text = keep_text
+        self.word_count = 0
+        self._excerpt = []
+        self._excerpt_size = 0
+        self._text = []
+        self._skip_depth = 0
+        self._in_word = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BREAK_TAGS:
+            self._break()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BREAK_TAGS:
+            self._break()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BREAK_TAGS:
+            self._break()
+
+    def handle_data(self, data):
+        if self._skip_depth or not data:
+            return
+        words = data.split()
+        if words:
+            # A word cut in two by a chunk boundary or an inline tag counts once
+            continues_word = self._in_word and not data[0].isspace()
+            self.word_count += len(words) - continues_word
+            self._add_excerpt(words, continues_word)
+        if self.keep_text:
+            self._text.append(data)
+        self._in_word = not data[-1].isspace()
+
+    def _break(self):
+        self._in_word = False
+        if self.keep_text:
+            self._text.append(' ')
+
+    def _add_excerpt(self, words, continues_word):
+        if self._excerpt_size > self.excerpt_length:
+            return
+        for i, word in enumerate(words):
+            if i == 0 and continues_word and self._excerpt:
+                self._excerpt[-1] += word
+            else:
+                self._excerpt.append(word)
+            self._excerpt_size += len(word) + 1
+            if self._excerpt_size > self.excerpt_length:
+                break
+
+    @property
+    def excerpt(self):
+        excerpt = ' '.join(self._excerpt)
+        if len(excerpt) <= self.excerpt_length and self.word_count <= len(self._excerpt):
+            return excerpt
+        cut = excerpt[:self.excerpt_length]
+        # Drop the word the limit runs into; a single overlong word is cut short
+        cut = cut.rsplit(' ', 1)[0] if ' ' in cut else cut[:-1]
+        return cut + '…'
+
+    @property
+    def text(self):
+        return ' '.join(''.join(self._text).split())
+
+
+def analyze_html(html, excerpt_length=EXCERPT_LENGTH, keep_text=False):
+    """Return ContentStats for an HTML body; ``text`` is None unless ``keep_text``."""
+    extractor = TextExtractor(excerpt_length, keep_text)
+    html = html or ''
+    for start in range(0, len(html), CHUNK_SIZE):
+        extractor.feed(html[start:start + CHUNK_SIZE])
+    extractor.close()
+    return ContentStats(
+        word_count=extractor.word_count,
+        read_time=max(1, round(extractor.word_count / WORDS_PER_MINUTE)),
+        excerpt=extractor.excerpt,
+        text=extractor.text if keep_text else None,
+    )
+
+
+def html_to_text(html):
+    return analyze_html(html, excerpt_length=0, keep_text=True).text
@@ -0,0 +1,185 @@
+"""Post counters: the write-behind view buffer and denormalized engagement counts.
+
+blog_detail records a view in memory; a background thread flushes the
+buffer every BLOG_VIEW_FLUSH_INTERVAL seconds as a handful of atomic
+``UPDATE ... SET views = views + n`` statements, one per distinct n. Hot
+posts therefore cost one write per interval instead of one per request, and
+concurrent increments can't overwrite each other.
+
+The buffer is flushed at interpreter exit so a graceful shutdown loses no
+counts. A failed flush puts its batch back in the buffer for the next try.
+
+Like, bookmark and comment totals live on Post as like_count,
+bookmark_count and comment_count. Code that creates or deletes those rows
+calls adjust_counts() in the same transaction; the reconcile_counters
+command repairs any drift (e.g. from cascading user deletes).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest, Now
+
+logger = logging.getLogger(__name__)
+
+UPDATE_BATCH_SIZE = 500
+
+
+class ViewCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._oldest = None
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+        self.last_flush = None
+        self.flushed_views = 0
+
+    @property
+    def interval(self):
+        return getattr(settings, 'BLOG_VIEW_FLUSH_INTERVAL', 5)
+
+    def record(self, post_id, count=1):
+        if self.interval <= 0:
+            # Write-through mode
+            self._write({post_id: count})
+            return
+        with self._lock:
+            self._pending[post_id] += count
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        self._ensure_thread()
+
+    def pending_for(self, post_id):
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush_lag(self):
+        """Seconds the oldest unflushed view has been waiting, 0 when empty."""
+        with self._lock:
+            if self._oldest is None:
+                return 0.0
+            return time.monotonic() - self._oldest
+
+    def stats(self):
+        with self._lock:
+            pending_posts = len(self._pending)
+            pending_views = sum(self._pending.values())
+            flushed_views, last_flush = self.flushed_views, self.last_flush
+        return {
+            'pending_posts': pending_posts,
+            'pending_views': pending_views,
+            'flush_lag': self.flush_lag(),
+            'flushed_views': flushed_views,
+            'last_flush': last_flush,
+        }
+
+    def flush(self):
+        """Write buffered views to the database and return how many posts changed."""
+        with self._lock:
+            batch, oldest = self._pending, self._oldest
+            self._pending, self._oldest = Counter(), None
+        if not batch:
+            return 0
+        try:
+            self._write(batch)
+        except Exception:
+            logger.exception('Flushing %d post view counts failed; will retry', len(batch))
+            with self._lock:
+                self._pending.update(batch)
+                if oldest is not None and (self._oldest is None or oldest < self._oldest):
+                    self._oldest = oldest
+            return 0
+        with self._lock:
+            self.last_flush = time.time()
+            self.flushed_views += sum(batch.values())
+        return len(batch)
+
+    def _write(self, batch):
+        from .models import Post
+
+        by_amount = defaultdict(list)
+        for post_id, count in batch.items():
+            by_amount[count].append(post_id)
+        with transaction.atomic():
+            for count, post_ids in by_amount.items():
+                for start in range(0, len(post_ids), UPDATE_BATCH_SIZE):
+                    Post.objects.filter(
+                        pk__in=post_ids[start:start + UPDATE_BATCH_SIZE]
+                    ).update(views=F('views') + count, counters_updated_at=Now())
+
+    def _ensure_thread(self):
+        # A forked worker doesn't inherit the parent's thread
+        if self._thread_running():
+            return
+        with self._lock:
+            if self._thread_running():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name='blog-view-counter', daemon=True
+            )
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _thread_running(self):
+        return (
+            self._thread is not None
+            and self._thread_pid == os.getpid()
+            and self._thread.is_alive()
+        )
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                self.flush()
+        finally:
+            connection.close()
+
+    def shutdown(self):
+        self._stop.set()
+        if self._thread_running():
+            self._thread.join(timeout=10)
+        self.flush()
+
+
+view_counter = ViewCounter()
+atexit.register(view_counter.shutdown)
+
+
+def adjust_counts(post_id, **deltas):
+    """Atomically add to denormalized counters, e.g. ``adjust_counts(pk, like_count=1)``."""
+    from .models import Post
+
+    Post.objects.filter(pk=post_id).update(counters_updated_at=Now(), **{
+        field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items()
+    })
+
+
+def engagement_counters():
+    """Map each denormalized Post counter to the model whose rows it counts."""
+    from .models import Bookmark, Comment, Like
+
+    return {'like_count': Like, 'bookmark_count': Bookmark, 'comment_count': Comment}
+
+
+def actual_count(model):
+    """Subquery counting ``model`` rows for the outer Post."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(post=OuterRef('pk'))
+            .order_by()
+            .values('post')
+            .annotate(n=Count('pk'))
+            .values('n'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
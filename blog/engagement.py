@@ -0,0 +1,92 @@
+"""Race-free like and bookmark toggles.
+
+A toggle first deletes the user's row and looks at the rowcount; only if
+nothing was deleted does it insert, inside a savepoint so that losing a
+race against a concurrent insert of the same (post, user) pair surfaces as
+"already set" rather than an IntegrityError. The counter on Post moves only
+when this request actually deleted or inserted the row, so concurrent
+clicks can never push it out of step with the table.
+
+Listings show the same per-user state through attach_user_state(), which
+looks up a whole page of posts at once.
+"""
+import asyncio
+
+from django.db import IntegrityError, transaction
+
+from .counters import adjust_counts
+from .models import Bookmark, Like, Post
+
+KINDS = {
+    'like': (Like, 'like_count'),
+    'bookmark': (Bookmark, 'bookmark_count'),
+}
+STATE_ATTRIBUTES = {'like': 'is_liked', 'bookmark': 'is_bookmarked'}
+
+
+def set_engagement(kind, post_id, user, active=None):
+    """Turn a like/bookmark on or off (``active=None`` flips it).
+
+    Returns ``(active, count)``: the user's new state and the post's counter.
+    """
+    model, counter = KINDS[kind]
+    with transaction.atomic():
+        changed = 0
+        if active is not True:
+            deleted, _ = model.objects.filter(post_id=post_id, user=user).delete()
+            if deleted:
+                changed = -1
+                active = False
+        if changed == 0 and active is not False:
+            try:
+                with transaction.atomic():
+                    model.objects.create(post_id=post_id, user=user)
+                changed = 1
+            except IntegrityError:
+                pass  # Set by a concurrent request; it moved the counter
+            active = True
+        if changed:
+            adjust_counts(post_id, **{counter: changed})
+        count = Post.objects.filter(pk=post_id).values_list(counter, flat=True).first()
+    return active, count
+
+
+def _state_queries(posts, user, kinds):
+    post_ids = [post.pk for post in posts]
+    return {
+        kind: KINDS[kind][0].objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True)
+        for kind in kinds
+    }
+
+
+def _apply_state(posts, found, kinds):
+    for post in posts:
+        for kind in kinds:
+            setattr(post, STATE_ATTRIBUTES[kind], post.pk in found.get(kind, ()))
+    return posts
+
+
+def attach_user_state(posts, user, kinds=tuple(KINDS)):
+    """Set ``is_liked``/``is_bookmarked`` on a page of posts with one IN query per kind.
+
+    Anonymous users get False everywhere without a query.
+    """
+    posts = list(posts)
+    if not posts or not user.is_authenticated:
+        return _apply_state(posts, {}, kinds)
+    found = {kind: set(query) for kind, query in _state_queries(posts, user, kinds).items()}
+    return _apply_state(posts, found, kinds)
+
+
+async def aattach_user_state(posts, user, kinds=tuple(KINDS)):
+    """Async version of attach_user_state()."""
+    posts = list(posts)
+    if not posts or not user.is_authenticated:
+        return _apply_state(posts, {}, kinds)
+    queries = _state_queries(posts, user, kinds)
+
+    async def post_ids(query):
+        return {post_id async for post_id in query}
+
+    results = await asyncio.gather(*(post_ids(query) for query in queries.values()))
+    return _apply_state(posts, dict(zip(queries, results)), kinds)
@@ -0,0 +1,202 @@
+"""Resized, re-encoded variants of uploaded images.
+
+Profile pictures and the images embedded in posts are stored as uploaded,
+often multi-megabyte phone photos. For each one the pipeline writes a set
+of variants, square avatars or content widths, as WebP plus a JPEG fallback
+(PNG when the source has transparency), never larger than the source, and
+records them in a ProcessedImage row. Templates then offer the variants
+through srcset and let the browser fetch the smallest that fills the slot
+(see blog.templatetags.responsive).
+
+Variants are stored under the SHA-256 of the source bytes, so the same photo
+uploaded twice, by anyone, is only decoded and encoded once. Processing
+runs after the upload commits, in a pool of BLOG_IMAGE_WORKERS threads
+(Pillow releases the GIL while decoding, resizing and encoding); 0
+processes inline.
+"""
+import atexit
+import hashlib
+import logging
+from collections import namedtuple
+from html.parser import HTMLParser
+from io import BytesIO
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .caching import invalidate_post
+from .models import ProcessedImage
+from .workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Square avatars, and widths for images in post bodies (which are at most
+# CONTENT_WIDTH CSS pixels wide)
+SIZES = {
+    'avatar': (48, 96, 160, 320),
+    'content': (480, 960, 1440, 1920),
+}
+CONTENT_WIDTH = 960
+ENCODERS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', {'optimize': True}),
+}
+VARIANT_DIR = 'variants'
+ORIENTATION_TAG = 0x0112
+# EXIF orientations that swap width and height
+ROTATED = {5, 6, 7, 8}
+
+Variant = namedtuple('Variant', ['format', 'width', 'height', 'name', 'size'])
+
+
+def variant_sizes(kind, limit):
+    """Sizes to produce for a source whose relevant side is ``limit`` pixels."""
+    top = min(limit, SIZES[kind][-1])
+    return [size for size in SIZES[kind] if size < top] + [top]
+
+
+def has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def resize(image, kind, size):
+    # reducing_gap shrinks by whole factors first, then resamples the rest with Lanczos
+    if kind == 'avatar':
+        side = min(image.size)
+        left, top = (image.width - side) // 2, (image.height - side) // 2
+        box = (left, top, left + side, top + side)
+        return image.resize((size, size), Image.LANCZOS, box=box, reducing_gap=3.0)
+    height = max(1, round(image.height * size / image.width))
+    return image.resize((size, height), Image.LANCZOS, reducing_gap=3.0)
+
+
+def encode(image, fmt):
+    encoder, options = ENCODERS[fmt]
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, encoder, **options)
+    return buffer.getvalue()
+
+
+def render_variants(data, kind, digest, storage):
+    """Write the variants of one source image and return (width, height, [Variant])."""
+    image = Image.open(BytesIO(data))
+    width, height = image.size
+    rotated = image.getexif().get(ORIENTATION_TAG) in ROTATED
+    if rotated:
+        width, height = height, width
+    if image.format == 'JPEG':
+        # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that still covers the
+        # largest variant. The draft sees the stored pixels, before
+        # exif_transpose, so a rotated photo's width is its stored height
+        largest = SIZES[kind][-1]
+        if kind == 'avatar':
+            image.draft('RGB', (largest, largest))
+        else:
+            image.draft('RGB', (1, largest) if rotated else (largest, 1))
+    image = ImageOps.exif_transpose(image)
+    alpha = has_alpha(image)
+    image = image.convert('RGBA' if alpha else 'RGB')
+
+    variants = []
+    limit = min(image.size) if kind == 'avatar' else image.width
+    # Largest first, each size resampled from the one before rather than the full image
+    for size in sorted(variant_sizes(kind, limit), reverse=True):
+        image = resize(image, kind, size)
+        for fmt in ('webp', 'png' if alpha else 'jpeg'):
+            name = f'{VARIANT_DIR}/{digest[:2]}/{digest}/{kind}-{size}.{fmt}'
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(encode(image, fmt)))
+            variants.append(Variant(fmt, image.width, image.height, name, storage.size(name)))
+    variants.sort(key=lambda variant: variant.width)
+    return width, height, variants
+
+
+def process_image(source, kind, storage=None):
+    """Create (or reuse) the variants of the stored image ``source``."""
+    storage = storage or default_storage
+    with storage.open(source, 'rb') as handle:
+        data = handle.read()
+    digest = hashlib.sha256(data).hexdigest()
+    twin = ProcessedImage.objects.filter(digest=digest, kind=kind).exclude(source=source).first()
+    if twin is not None:
+        width, height, variants = twin.width, twin.height, twin.variants
+    else:
+        width, height, variants = render_variants(data, kind, digest, storage)
+        variants = [variant._asdict() for variant in variants]
+    image, _ = ProcessedImage.objects.update_or_create(
+        source=source,
+        defaults={
+            'kind': kind,
+            'digest': digest,
+            'width': width,
+            'height': height,
+            'size': len(data),
+            'variants': variants,
+        },
+    )
+    return image
+
+
+def process_images(sources, kind, post_id=None):
+    """Process the ``sources`` that have no variants yet; then refresh a post's cached body."""
+    done = set(ProcessedImage.objects.filter(source__in=sources).values_list('source', flat=True))
+    for source in sources:
+        if source in done:
+            continue
+        try:
+            process_image(source, kind)
+        except (OSError, Image.DecompressionBombError, ValueError):
+            logger.exception('Could not make variants of %s', source)
+    if post_id is not None:
+        invalidate_post(post_id)
+
+
+image_workers = WorkerPool('BLOG_IMAGE_WORKERS', 2, name='blog-images')
+atexit.register(image_workers.shutdown)
+
+
+def queue_images(sources, kind, post_id=None, using='default'):
+    """Process ``sources`` (storage names) in the pool once the transaction commits."""
+    sources = list(dict.fromkeys(sources))
+    if sources:
+        transaction.on_commit(lambda: image_workers.submit(process_images, sources, kind, post_id), using=using)
+
+
+class ImageCollector(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sources = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'img':
+            src = dict(attrs).get('src')
+            if src:
+                self.sources.append(src)
+
+
+def media_name(url):
+    """The storage name behind a MEDIA_URL link, or None for other URLs."""
+    path = unquote(urlsplit(url).path)
+    if not settings.MEDIA_URL or not path.startswith(settings.MEDIA_URL):
+        return None
+    name = path[len(settings.MEDIA_URL):]
+    if not name or name.startswith(f'{VARIANT_DIR}/') or '..' in name.split('/'):
+        return None
+    return name
+
+
+def content_images(html):
+    """Storage names of the uploaded images an HTML body embeds, in order."""
+    if not html or '<img' not in html:
+        return []
+    collector = ImageCollector()
+    collector.feed(html)
+    collector.close()
+    return [name for name in map(media_name, collector.sources) if name]
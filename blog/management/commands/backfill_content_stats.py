@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from blog.content import analyze_html
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recompute word count, read time and excerpt for existing posts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--missing-only', action='store_true',
+                            help='Only posts that have no excerpt yet.')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.only('pk', 'content').order_by('pk')
+        if options['missing_only']:
+            posts = posts.filter(excerpt='')
+
+        batch_size = options['batch_size']
+        updated = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            for post in batch:
+                stats = analyze_html(post.content)
+                post.word_count = stats.word_count
+                post.read_time = stats.read_time
+                post.excerpt = stats.excerpt
+            with transaction.atomic():
+                Post.objects.bulk_update(batch, ['word_count', 'read_time', 'excerpt'])
+            updated += len(batch)
+            self.stdout.write(f'{updated} posts updated', ending='\r')
+
+        self.stdout.write(self.style.SUCCESS(f'Updated content stats for {updated} posts.'))
@@ -0,0 +1,181 @@
+import random
+import re
+import shutil
+import tempfile
+import time
+from html.parser import HTMLParser
+from io import BytesIO
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+from PIL import Image, ImageDraw, ImageFilter
+
+from blog.benchmarks import scratch_database
+from blog.images import VARIANT_DIR, process_images
+from blog.models import Post, ProcessedImage
+from blog.workers import WorkerPool
+
+# (label, viewport width in CSS px, device pixel ratio)
+SCREENS = (('desktop', 1280, 1), ('phone', 390, 3))
+SIZES_RE = re.compile(r'\(max-width:\s*(\d+)px\)\s*100vw,\s*(\d+)px|(\d+)px')
+
+
+def photo(rng, width, height):
+    """A JPEG that compresses about as badly as a phone photo."""
+    image = Image.new('RGB', (width, height), tuple(rng.randrange(256) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        radius = rng.randrange(width // 20, width // 3)
+        draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(width // 200))
+    grain = Image.effect_noise((width, height), 24).convert('RGB')
+    image = Image.blend(image, grain, 0.12)
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def slot_width(sizes, viewport):
+    match = SIZES_RE.search(sizes or '')
+    if match is None:
+        return viewport
+    if match.group(3):
+        return int(match.group(3))
+    breakpoint, fixed = int(match.group(1)), int(match.group(2))
+    return viewport if viewport <= breakpoint else fixed
+
+
+class ImageFetches(HTMLParser):
+    """Media files a browser with the given screen would download for a page."""
+
+    def __init__(self, viewport, dpr):
+        super().__init__(convert_charrefs=True)
+        self.viewport = viewport
+        self.dpr = dpr
+        self.urls = []
+        self._picked = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'picture':
+            self._picked = False
+        elif tag == 'source' and attrs.get('type') == 'image/webp' and not self._picked:
+            self.urls.append(self.pick(attrs['srcset'], attrs.get('sizes')))
+            self._picked = True
+        elif tag == 'img':
+            if not self._picked:
+                self.urls.append(self.pick(attrs['srcset'], attrs.get('sizes')) if attrs.get('srcset') else attrs['src'])
+            self._picked = False
+
+    def handle_endtag(self, tag):
+        if tag == 'picture':
+            self._picked = False
+
+    def pick(self, srcset, sizes):
+        needed = slot_width(sizes, self.viewport) * self.dpr
+        candidates = sorted((int(width[:-1]), url) for url, width in (item.split() for item in srcset.split(',')))
+        return next((url for width, url in candidates if width >= needed), candidates[-1][1])
+
+
+def served_bytes(html, viewport, dpr):
+    parser = ImageFetches(viewport, dpr)
+    parser.feed(html)
+    return sum(default_storage.size(unquote(url)[len(settings.MEDIA_URL):]) for url in parser.urls)
+
+
+class Command(BaseCommand):
+    help = 'Measure image bytes per page before and after resizing, and the time the variants take.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=6, help='Images embedded in the benchmark post.')
+        parser.add_argument('--width', type=int, default=4032)
+        parser.add_argument('--height', type=int, default=3024)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=5)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        media_root = tempfile.mkdtemp(prefix='bench-media-')
+        try:
+            with scratch_database(), override_settings(
+                ALLOWED_HOSTS=['*'], MEDIA_ROOT=media_root, BLOG_IMAGE_WORKERS=0,
+            ):
+                self.run(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        uploads = [
+            default_storage.save(f'uploads/bench-{i}.jpg', ContentFile(photo(rng, options['width'], options['height'])))
+            for i in range(options['images'])
+        ]
+        author = User.objects.create_user('bench-author')
+        profile = author.profile
+        profile.profile_pic = default_storage.save('profiles/bench.jpg', ContentFile(photo(rng, 3024, 3024)))
+        profile.save()
+        # bulk_create skips the signal that would resize the photos right away
+        post, = Post.objects.bulk_create([Post(
+            author=author,
+            title='Bench photos',
+            slug='bench-photos',
+            content=''.join(f'<p><img alt="Photo {i}" src="/media/{name}"></p>' for i, name in enumerate(uploads)),
+            status='published',
+        )])
+        total = sum(default_storage.size(name) for name in uploads)
+        self.stdout.write(
+            f'Stored {len(uploads)} photos ({total / len(uploads) / 1e6:.1f} MB each) and an avatar '
+            f'in {time.perf_counter() - start:.1f}s'
+        )
+
+        client = Client()
+        client.force_login(author)
+        pages = {
+            'blog_detail': reverse('blog_detail', args=[post.slug]),
+            'view_profile': reverse('view_profile'),
+        }
+        before = {name: client.get(url).content.decode() for name, url in pages.items()}
+
+        jobs = [(name, 'content') for name in uploads] + [(profile.profile_pic.name, 'avatar')]
+        for workers in (0, options['workers']):
+            ProcessedImage.objects.all().delete()
+            shutil.rmtree(default_storage.path(VARIANT_DIR), ignore_errors=True)
+            pool = WorkerPool(workers=workers, name='blog-images')
+            start = time.perf_counter()
+            futures = [pool.submit(process_images, [name], kind) for name, kind in jobs]
+            for future in futures if workers else ():
+                future.result()
+            pool.shutdown()
+            self.stdout.write(f'Variants of {len(jobs)} images with {workers or "no"} worker threads: '
+                              f'{time.perf_counter() - start:.2f}s')
+
+        # The same photo uploaded again under another name
+        duplicate = default_storage.save('uploads/bench-copy.jpg', default_storage.open(uploads[0]))
+        start = time.perf_counter()
+        process_images([duplicate], 'content')
+        twin = ProcessedImage.objects.get(source=duplicate)
+        self.stdout.write(
+            f'Duplicate upload: {time.perf_counter() - start:.3f}s, shares variants with the original: '
+            f'{twin.variants == ProcessedImage.objects.get(source=uploads[0]).variants}'
+        )
+
+        cache.clear()
+        after = {name: client.get(url).content.decode() for name, url in pages.items()}
+        self.stdout.write(f'{"page":>14} {"screen":>8} {"before KB":>10} {"after KB":>9} {"saved":>6}')
+        for name in pages:
+            for label, viewport, dpr in SCREENS:
+                old = served_bytes(before[name], viewport, dpr)
+                new = served_bytes(after[name], viewport, dpr)
+                self.stdout.write(
+                    f'{name:>14} {label:>8} {old / 1024:>10.0f} {new / 1024:>9.0f} {1 - new / old:>6.0%}'
+                )
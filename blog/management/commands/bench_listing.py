@@ -0,0 +1,80 @@
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+
+from blog.benchmarks import TextGenerator, scratch_database
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Measure memory and bytes fetched per listing request as the post table grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--body-kb', type=int, default=20,
+                            help='Approximate size of each post body.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        with scratch_database(), override_settings(ALLOWED_HOSTS=['*']):
+            self.run(options)
+
+    def run(self, options):
+        text = TextGenerator(seed=3)
+        author = User.objects.create_user('bench-author')
+        client = Client()
+        client.force_login(author)
+        paragraphs = max(1, options['body_kb'] * 1024 // 400)
+
+        self.stdout.write(
+            f'{"posts":>8} {"route":>14} {"projection":>10} {"peak KB":>9} {"row text KB":>11}'
+        )
+        created = 0
+        for size in sorted(options['sizes']):
+            while created < size:
+                count = min(options['batch_size'], size - created)
+                Post.objects.bulk_create([
+                    Post(
+                        author=author,
+                        title=text.sentence(6),
+                        slug=f'bench-{created + i}',
+                        content=text.html(paragraphs=paragraphs),
+                        excerpt=text.sentence(40)[:300],
+                        status='published',
+                    )
+                    for i in range(count)
+                ])
+                created += count
+
+            for route in ('home', 'blog_list', 'user_dashboard'):
+                for projection in ('listing', 'full'):
+                    peak, fetched = self.measure(client, reverse(route), projection)
+                    self.stdout.write(
+                        f'{size:>8} {route:>14} {projection:>10} {peak / 1024:>9.1f} {fetched / 1024:>11.1f}'
+                    )
+
+    def measure(self, client, url, projection):
+        original = Post.objects._queryset_class.for_listing
+        if projection == 'full':
+            # What the views did before: the same joins, with the body column
+            Post.objects._queryset_class.for_listing = (
+                lambda qs: qs.select_related('category', 'author').prefetch_related('tags')
+            )
+        try:
+            client.get(url)  # warm up caches and imports
+            tracemalloc.start()
+            response = client.get(url)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            Post.objects._queryset_class.for_listing = original
+        fetched = sum(
+            len(post.title) + len(post.__dict__.get('content') or '') + len(post.excerpt)
+            for post in response.context['blogs']
+        )
+        return peak, fetched
@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.urls import reverse
+
+from blog import urls
+from blog.benchmarks import SEED_COUNTS, add_seed_arguments, percentile, scratch_database, seed_site
+from blog.models import Post
+from blog.pagination import COMMENT_ORDERING, paginate
+
+# A smaller site than seed_bench's default keeps a full run to a few minutes
+BENCH_COUNTS = {name: max(1, count // 5) for name, count in SEED_COUNTS.items()}
+ANONYMOUS_ROUTES = {'register', 'login'}
+# Ignore latency changes smaller than this, whatever the threshold
+NOISE_MS = 1.0
+NOISE_BYTES = 64 * 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Seed a scratch database and time every route in blog/urls.py through the test client: '
+            'latency, query count and peak memory per request. Write JSON with --output and compare '
+            'against an earlier run with --baseline.')
+
+    def add_arguments(self, parser):
+        add_seed_arguments(parser, BENCH_COUNTS)
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per route.')
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--route', action='append', dest='routes', help='Only these routes (repeatable).')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+        parser.add_argument('--baseline', help='JSON from an earlier run to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.5,
+                            help='Fractional p50 latency or peak memory growth counted as a regression; '
+                                 'query counts must not grow at all.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as handle:
+                baseline = json.load(handle)
+        names = [pattern.name for pattern in urls.urlpatterns]
+        unknown = set(options['routes'] or ()) - set(names)
+        if unknown:
+            raise CommandError(f'Unknown routes: {", ".join(sorted(unknown))}')
+
+        # Keep DEBUG off so only the captured request logs its queries
+        setup_test_environment(debug=False)
+        # The repeats blog.perf logs would interleave with the table; perf_report has them
+        logging.getLogger('blog.perf').setLevel(logging.ERROR)
+        with scratch_database(), override_settings(
+            ALLOWED_HOSTS=['*'], BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_PERF_DIR=None,
+        ):
+            counts = {name: options[name] for name in SEED_COUNTS}
+            self.stdout.write(f'Seeding {", ".join(f"{count} {name}" for name, count in counts.items())}')
+            seed_site(**counts, days=options['days'], seed=options['seed'], batch_size=options['batch_size'])
+            cache.clear()
+            results = self.run(options, [name for name in names if name in (options['routes'] or names)])
+
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'cpus': os.cpu_count(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'seed': options['seed'],
+                'counts': counts,
+            },
+            'routes': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f'Wrote {options["output"]}')
+        if baseline is not None:
+            self.compare(baseline, report, options['threshold'])
+
+    def run(self, options, names):
+        user = User.objects.annotate(posts=Count('post')).order_by('-posts', 'pk').first()
+        post = Post.objects.filter(status='published').order_by('-comment_count', 'pk').first()
+        cursor = paginate(post.comments.all(), ordering=COMMENT_ORDERING).next_cursor
+        patterns = {pattern.name: pattern for pattern in urls.urlpatterns}
+
+        self.stdout.write(
+            f'{"route":<20} {"status":>6} {"p50 ms":>8} {"p95 ms":>8} {"mean ms":>8} {"queries":>7} {"peak KB":>8}'
+        )
+        results = {}
+        for name in names:
+            pattern = patterns[name]
+            client = Client()
+            method = client.get
+
+            def prepare():
+                if name not in ANONYMOUS_ROUTES:
+                    client.force_login(user)  # logout logs the client out every time
+                target = post
+                if name == 'delete_blog':
+                    target = Post.objects.create(author=user, title='Bench doomed', content='<p>x</p>', status='draft')
+                kwargs = {key: target.slug if key == 'slug' else target.pk for key in pattern.pattern.converters}
+                return reverse(name, kwargs=kwargs), {'cursor': cursor} if name == 'comment_page' else None
+
+            def call(url, data):
+                start = time.perf_counter()
+                response = method(url, data)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                return response, (time.perf_counter() - start) * 1000
+
+            response, _ = call(*prepare())
+            if response.status_code == 405:
+                method = client.post
+            for _ in range(options['warmup']):
+                call(*prepare())
+            samples = [call(*prepare())[1] for _ in range(options['iterations'])]
+            request = prepare()
+            with CaptureQueriesContext(connection) as queries:
+                response, _ = call(*request)
+            # Count now: the next request's request_started clears the log the context slices
+            query_count = len(queries)
+            request = prepare()
+            tracemalloc.start()
+            try:
+                call(*request)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            results[name] = {
+                'status': response.status_code,
+                'p50_ms': percentile(samples, 50),
+                'p95_ms': percentile(samples, 95),
+                'mean_ms': statistics.fmean(samples),
+                'queries': query_count,
+                'peak_bytes': peak,
+            }
+            result = results[name]
+            self.stdout.write(
+                f'{name:<20} {result["status"]:>6} {result["p50_ms"]:>8.2f} {result["p95_ms"]:>8.2f} '
+                f'{result["mean_ms"]:>8.2f} {result["queries"]:>7} {peak / 1024:>8.0f}'
+            )
+        return results
+
+    def compare(self, baseline, report, threshold):
+        self.stdout.write(f'Against {baseline["meta"].get("revision") or "baseline"} '
+                          f'(threshold {threshold:.0%}):')
+        regressions = []
+        for name, result in report['routes'].items():
+            before = baseline['routes'].get(name)
+            if before is None:
+                self.stdout.write(f'{name:<20} new route')
+                continue
+            problems = []
+            latency = result['p50_ms'] - before['p50_ms']
+            if latency > max(NOISE_MS, before['p50_ms'] * threshold):
+                problems.append(f'p50 {before["p50_ms"]:.2f} -> {result["p50_ms"]:.2f} ms')
+            if result['queries'] > before['queries']:
+                problems.append(f'queries {before["queries"]} -> {result["queries"]}')
+            memory = result['peak_bytes'] - before['peak_bytes']
+            if memory > max(NOISE_BYTES, before['peak_bytes'] * threshold):
+                problems.append(f'peak {before["peak_bytes"] / 1024:.0f} -> {result["peak_bytes"] / 1024:.0f} KB')
+            if result['status'] != before['status']:
+                problems.append(f'status {before["status"]} -> {result["status"]}')
+            if problems:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(f'{name:<20} {"; ".join(problems)}'))
+            else:
+                self.stdout.write(f'{name:<20} ok (p50 {latency:+.2f} ms, queries {result["queries"] - before["queries"]:+d})')
+        if regressions:
+            raise CommandError(f'{len(regressions)} routes regressed: {", ".join(regressions)}')
+        self.stdout.write(self.style.SUCCESS('No regressions.'))
@@ -0,0 +1,64 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from blog import search
+from blog.benchmarks import TextGenerator, percentile, scratch_database, time_calls
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Measure search latency as the number of indexed posts grows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Post counts to measure at, e.g. 1000 10000 100000 1000000.')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Results fetched per query (one listing page).')
+        parser.add_argument('--backend', choices=['auto', 'fts5', 'terms'], default='auto')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with override_settings(BLOG_SEARCH_BACKEND=options['backend']), scratch_database():
+            self.run(options)
+
+    def run(self, options):
+        text = TextGenerator(seed=1)
+        author = User.objects.create_user('bench-author')
+        backend = search.get_backend()
+        self.stdout.write(f'backend={backend}')
+        self.stdout.write(f'{"posts":>10} {"query":>8} {"p50 ms":>8} {"p99 ms":>8}')
+
+        created = 0
+        for size in sorted(options['sizes']):
+            while created < size:
+                count = min(options['batch_size'], size - created)
+                posts = Post.objects.bulk_create([
+                    Post(
+                        author=author,
+                        title=text.sentence(6),
+                        slug=f'bench-{created + i}',
+                        content=text.html(),
+                        status='published',
+                    )
+                    for i in range(count)
+                ])
+                search.write_documents(
+                    (post.pk, search.build_document(post.title, post.content, tags=text.sample(3)))
+                    for post in posts
+                )
+                created += count
+
+            workloads = {
+                'rare': [(text.rare_word(),) for _ in range(options['queries'])],
+                'two-word': [(' '.join(text.sample(2)),) for _ in range(options['queries'])],
+            }
+            for name, queries in workloads.items():
+                samples = time_calls(
+                    lambda q: search.search_post_ids(q, limit=options['limit']), queries
+                )
+                self.stdout.write(
+                    f'{size:>10} {name:>8} {percentile(samples, 50):>8.2f} '
+                    f'{percentile(samples, 99):>8.2f}'
+                )
@@ -0,0 +1,51 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from blog.benchmarks import scratch_database
+from blog.models import Post
+from blog.slugs import base_slug, next_free_slug
+
+
+class Command(BaseCommand):
+    help = 'Create many posts with the same title and report slug allocation cost.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000)
+        parser.add_argument('--report-every', type=int, default=1000)
+        parser.add_argument('--title', default='Hello World')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.run(options)
+
+    def run(self, options):
+        author = User.objects.create_user('bench-author')
+        every = options['report_every']
+        base = base_slug(options['title'], Post._meta.get_field('slug').max_length, 'post')
+        self.stdout.write(f'{"posts":>8} {"save ms":>9} {"alloc ms":>9} {"legacy ms":>10}')
+
+        save_total = 0.0
+        for created in range(1, options['count'] + 1):
+            start = time.perf_counter()
+            Post.objects.create(
+                author=author, title=options['title'], content='<p>x</p>', status='published'
+            )
+            save_total += time.perf_counter() - start
+            if created % every == 0:
+                # Time the allocator alone at this collision depth
+                start = time.perf_counter()
+                next_free_slug(Post, base)
+                alloc_ms = (time.perf_counter() - start) * 1000
+                # The old allocator: one exists() query per taken suffix
+                start = time.perf_counter()
+                candidate, counter = base, 1
+                while Post.objects.filter(slug=candidate).exists():
+                    candidate = f'{base}-{counter}'
+                    counter += 1
+                legacy_ms = (time.perf_counter() - start) * 1000
+                self.stdout.write(
+                    f'{created:>8} {save_total / every * 1000:>9.3f} {alloc_ms:>9.3f} {legacy_ms:>10.1f}'
+                )
+                save_total = 0.0
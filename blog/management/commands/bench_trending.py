@@ -0,0 +1,147 @@
+import contextlib
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from blog.benchmarks import percentile, scratch_database, time_calls
+from blog.models import Bookmark, Category, Comment, Like, Post
+from blog.trending import recompute, top_posts
+
+# Share of generated events per kind
+EVENT_MIX = (('like', 0.45), ('comment', 0.35), ('bookmark', 0.20))
+MODELS = {'like': Like, 'comment': Comment, 'bookmark': Bookmark}
+
+
+@contextlib.contextmanager
+def explicit_timestamps(model):
+    # Keep the generated created_at instead of auto_now_add's "now"
+    field = model._meta.get_field('created_at')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic engagement history and time trending recomputes and top-N reads.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=1_000_000)
+        parser.add_argument('--posts', type=int, default=20_000)
+        parser.add_argument('--users', type=int, default=2_000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--days', type=int, default=30,
+                            help='Events are spread over this many days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.run(options)
+
+    def run(self, options):
+        if options['events'] > options['posts'] * options['users'] // 4:
+            raise CommandError('Too few posts x users for that many unique likes and bookmarks.')
+        rng = random.Random(options['seed'])
+        now = timezone.now()
+
+        start = time.perf_counter()
+        posts, categories = self.create_posts(options, rng, now)
+        users = User.objects.bulk_create([User(username=f'bench-{i}') for i in range(options['users'])])
+        user_ids = [user.pk for user in users]
+        self.stdout.write(f'Created {len(posts)} posts in {time.perf_counter() - start:.1f}s')
+
+        history_end = now - timedelta(hours=1)
+        start = time.perf_counter()
+        created = self.create_events(options['events'], posts, user_ids, rng, history_end, options)
+        self.stdout.write(f'Created {created} events in {time.perf_counter() - start:.1f}s')
+
+        run = recompute(full=True, now=history_end)
+        self.stdout.write(f'Full rebuild:  {run.events:>9} events (views included) -> {run.posts:>7} scores in {run.duration:.2f}s')
+
+        # One more hour of activity, 1% of the history
+        fresh = max(1, options['events'] // 100)
+        created = self.create_events(fresh, posts, user_ids, rng, now, options, window=timedelta(hours=1))
+        run = recompute(now=now)
+        self.stdout.write(f'Incremental:   {run.events:>9} events (views included) -> {run.posts:>7} scores in {run.duration:.2f}s')
+
+        queries = options['queries']
+        overall = time_calls(lambda: top_posts(20), [()] * queries)
+        per_category = time_calls(
+            lambda category_id: top_posts(20, category_id),
+            [(rng.choice(categories).pk,) for _ in range(queries)],
+        )
+        since = now - timedelta(days=1)
+        naive = time_calls(lambda: list(
+            Post.objects.annotate(recent=Count('likes', filter=Q(likes__created_at__gte=since)))
+            .order_by('-recent')[:20]
+        ), [()] * max(1, queries // 20))
+
+        self.stdout.write(f'{"top 20 query":>28} {"p50 ms":>8} {"p99 ms":>8}')
+        for label, samples in (
+            ('precomputed, all', overall),
+            ('precomputed, per category', per_category),
+            ('likes counted at query time', naive),
+        ):
+            self.stdout.write(f'{label:>28} {percentile(samples, 50):>8.2f} {percentile(samples, 99):>8.2f}')
+
+    def create_posts(self, options, rng, now):
+        author = User.objects.create_user('bench-author')
+        categories = Category.objects.bulk_create([
+            Category(name=f'bench-{i}', slug=f'bench-{i}') for i in range(options['categories'])
+        ])
+        posts = []
+        for start in range(0, options['posts'], options['batch_size']):
+            count = min(options['batch_size'], options['posts'] - start)
+            posts += Post.objects.bulk_create([
+                Post(
+                    author=author,
+                    title=f'Bench post {start + i}',
+                    slug=f'bench-post-{start + i}',
+                    content='<p>x</p>',
+                    status='published',
+                    category=rng.choice(categories),
+                    views=rng.randrange(1000),
+                )
+                for i in range(count)
+            ])
+        ages = [timedelta(seconds=rng.randrange(options['days'] * 86400)) for _ in posts]
+        for post, age in zip(posts, ages):
+            post.created_at = now - age
+        Post.objects.bulk_update(posts, ['created_at'], batch_size=options['batch_size'])
+        return posts, categories
+
+    def create_events(self, total, posts, user_ids, rng, end, options, window=None):
+        """Insert ``total`` events, skewed towards a few popular posts."""
+        window = window or timedelta(days=options['days'])
+        weights = [1 / rank for rank in range(1, len(posts) + 1)]
+        created = 0
+        for kind, share in EVENT_MIX:
+            model = MODELS[kind]
+            wanted = int(total * share)
+            # Likes and bookmarks are unique per (post, user)
+            seen = set(model.objects.values_list('post_id', 'user_id')) if kind != 'comment' else None
+            while wanted > 0:
+                batch = []
+                for post in rng.choices(posts, weights, k=min(options['batch_size'], wanted)):
+                    user_id = rng.choice(user_ids)
+                    if seen is not None:
+                        if (post.pk, user_id) in seen:
+                            continue
+                        seen.add((post.pk, user_id))
+                    row = model(post_id=post.pk, user_id=user_id, created_at=end - window * rng.random())
+                    if kind == 'comment':
+                        row.content = 'Nice'
+                    batch.append(row)
+                with explicit_timestamps(model):
+                    model.objects.bulk_create(batch, batch_size=options['batch_size'])
+                wanted -= len(batch)
+                created += len(batch)
+        return created
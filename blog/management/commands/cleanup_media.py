@@ -0,0 +1,51 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from blog.models import StoredFile
+from blog.storage import OBJECT_RE
+
+
+class Command(BaseCommand):
+    help = ('Remove content-addressed media files that no StoredFile row references, '
+            'such as those of saves that rolled back, and report rows whose file is gone.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, default=3600,
+                            help='Leave files younger than this many seconds; they may belong to saves in flight.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the orphaned files without removing them.')
+
+    def handle(self, *args, **options):
+        root = default_storage.location
+        cutoff = time.time() - options['grace']
+        candidates = {}
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                if (OBJECT_RE.match(name) or name.endswith('.partial')) and os.stat(path).st_mtime < cutoff:
+                    candidates[name] = path
+
+        known = set()
+        names = list(candidates)
+        for start in range(0, len(names), 500):
+            known.update(StoredFile.objects.filter(name__in=names[start:start + 500]).values_list('name', flat=True))
+        orphans = sorted(set(candidates) - known)
+        freed = 0
+        for name in orphans:
+            freed += os.stat(candidates[name]).st_size
+            if not options['dry_run']:
+                os.remove(candidates[name])
+            self.stdout.write(f'{"Would remove" if options["dry_run"] else "Removed"} {name}', self.style.WARNING)
+
+        missing = [name for name in StoredFile.objects.values_list('name', flat=True).iterator(chunk_size=2000)
+                   if not default_storage.exists(name)]
+        for name in missing:
+            self.stdout.write(f'Missing file for {name}; the next upload of the same bytes rewrites it',
+                              self.style.ERROR)
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(orphans)} orphaned files ({freed / 1e6:.1f} MB), {len(missing)} rows without a file.'
+        ))
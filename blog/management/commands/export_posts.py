@@ -0,0 +1,42 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from blog import transfer
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Stream posts with their tags and comments to a JSON Lines or CSV file ("-" writes stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='Defaults to csv for *.csv files, jsonl otherwise.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--status', choices=sorted(transfer.STATUSES))
+        parser.add_argument('--author', help='Only posts by this username.')
+        parser.add_argument('--no-comments', action='store_true',
+                            help='Leave comments out (CSV never includes them).')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or transfer.guess_format(path)
+        posts = Post.objects.all()
+        if options['status']:
+            posts = posts.filter(status=options['status'])
+        if options['author']:
+            posts = posts.filter(author__username=options['author'])
+        records = transfer.export_records(
+            posts,
+            chunk_size=options['chunk_size'],
+            comments=format == 'jsonl' and not options['no_comments'],
+        )
+        write = transfer.write_csv if format == 'csv' else transfer.write_jsonl
+
+        if path == '-':
+            write(records, sys.stdout)
+            return
+        with open(path, 'w', newline='', encoding='utf-8') as stream:
+            count = write(records, stream)
+        self.stdout.write(self.style.SUCCESS(f'Exported {count} posts to {path}.'))
@@ -0,0 +1,52 @@
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog import transfer
+
+
+class Command(BaseCommand):
+    help = 'Bulk import posts from a JSON Lines or CSV file ("-" reads stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=transfer.FORMATS,
+                            help='Defaults to csv for *.csv files, jsonl otherwise.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--author',
+                            help='Username to use for records without an author.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or transfer.guess_format(path)
+        default_author = None
+        if options['author']:
+            default_author = User.objects.filter(username=options['author']).first()
+            if default_author is None:
+                raise CommandError(f'No user named {options["author"]!r}.')
+
+        def progress(result):
+            self.stdout.write(f'{result.posts} posts imported', ending='\r')
+            self.stdout.flush()
+
+        if path == '-':
+            result = self.run(sys.stdin, format, options['batch_size'], default_author, progress)
+        else:
+            with open(path, newline='', encoding='utf-8') as stream:
+                result = self.run(stream, format, options['batch_size'], default_author, progress)
+
+        for line, message in result.errors:
+            self.stderr.write(f'line {line}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {result.posts} posts and {result.comments} comments, '
+            f'skipped {len(result.errors)} records.'
+        ))
+
+    def run(self, stream, format, batch_size, default_author, progress):
+        return transfer.import_posts(
+            transfer.read_records(stream, format),
+            batch_size=batch_size,
+            default_author=default_author,
+            progress=progress,
+        )
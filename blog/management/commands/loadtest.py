@@ -0,0 +1,74 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Fire concurrent GET requests at running servers and compare latency and throughput. '
+        'Start the same database under both servers first, e.g. '
+        '"gunicorn echomind.wsgi -w 1 --threads 8 -b :8000" and '
+        '"uvicorn echomind.asgi:application --port 8001", then run '
+        '"manage.py loadtest --target wsgi=http://localhost:8000 --target asgi=http://localhost:8001".'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='label=base URL; repeat to compare servers.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request (repeatable). Default: / and /blog/.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests per target and path.')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            label, sep, url = target.partition('=')
+            if not sep or not url:
+                raise CommandError(f'--target must look like label=http://host:port, got {target!r}')
+            targets.append((label, url.rstrip('/')))
+        paths = options['paths'] or ['/', '/blog/']
+
+        self.stdout.write(
+            f'{"target":>8} {"path":>24} {"ok":>6} {"errors":>6} {"p50 ms":>8} {"p99 ms":>8} {"req/s":>8}'
+        )
+        for label, base in targets:
+            for path in paths:
+                self.run(label, base, path, options)
+
+    def run(self, label, base, path, options):
+        url = base + path
+        timeout = options['timeout']
+
+        def fetch(_):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read()
+                ok = True
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - started
+
+        fetch(None)  # warm up the server's caches and connections
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(fetch, range(options['requests'])))
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(seconds * 1000 for ok, seconds in results if ok)
+        errors = len(results) - len(timings)
+        if not timings:
+            self.stdout.write(f'{label:>8} {path:>24} {0:>6} {errors:>6} {"-":>8} {"-":>8} {"-":>8}')
+            return
+        self.stdout.write(
+            f'{label:>8} {path:>24} {len(timings):>6} {errors:>6} '
+            f'{percentile(timings, 50):>8.1f} {percentile(timings, 99):>8.1f} {len(timings) / elapsed:>8.1f}'
+        )
@@ -0,0 +1,129 @@
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.perf import load_snapshots
+
+SORT_KEYS = {
+    'p95': lambda entry: entry['wall'].percentile(95),
+    'mean': lambda entry: entry['wall'].mean(),
+    'total': lambda entry: entry['wall'].total,
+    'queries': lambda entry: entry['queries'].mean(),
+}
+
+
+def merge_fragment_stats(processes):
+    """Add up each process's fragment cache hits and misses, 'total' last."""
+    counts = {}
+    for process in processes:
+        for name, entry in process['fragments'].items():
+            if name != 'total':
+                merged = counts.setdefault(name, {'hits': 0, 'misses': 0})
+                merged['hits'] += entry['hits']
+                merged['misses'] += entry['misses']
+    counts = dict(sorted(counts.items()))
+    counts['total'] = {key: sum(entry[key] for entry in counts.values()) for key in ('hits', 'misses')}
+    for entry in counts.values():
+        lookups = entry['hits'] + entry['misses']
+        entry['hit_rate'] = entry['hits'] / lookups if lookups else 0.0
+    return counts
+
+
+class Command(BaseCommand):
+    help = 'Show the slowest views and the most repeated query shapes recorded by blog.perf.PerformanceMiddleware.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=getattr(settings, 'BLOG_PERF_DIR', None),
+                            help='Directory holding the perf-*.json snapshots.')
+        parser.add_argument('--limit', type=int, default=10)
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='p95',
+                            help='Order views by 95th percentile, mean or total wall time, or mean queries.')
+        parser.add_argument('--json', action='store_true', help='Print the merged figures as JSON.')
+        parser.add_argument('--reset', action='store_true', help='Delete the snapshots after reporting.')
+
+    def handle(self, *args, **options):
+        directory = options['dir']
+        views, shapes, processes = load_snapshots(directory)
+        if not processes:
+            raise CommandError(f'No perf snapshots in {directory}; is blog.perf.PerformanceMiddleware enabled?')
+
+        fragments = merge_fragment_stats(processes)
+        slowest = sorted(views.items(), key=lambda item: SORT_KEYS[options['sort']](item[1]), reverse=True)
+        repeated = sorted(shapes.items(), key=lambda item: item[1]['extra'], reverse=True)
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'views': [
+                    {
+                        'view': view,
+                        'requests': entry['wall'].count,
+                        'mean_ms': entry['wall'].mean(),
+                        'p50_ms': entry['wall'].percentile(50),
+                        'p95_ms': entry['wall'].percentile(95),
+                        'max_ms': entry['wall'].maximum,
+                        'mean_queries': entry['queries'].mean(),
+                        'max_queries': entry['queries'].maximum,
+                        'sql_ms': entry['sql_ms'],
+                        'duplicate_requests': entry['duplicate_requests'],
+                    }
+                    for view, entry in slowest[:options['limit']]
+                ],
+                'shapes': [{'shape': shape, **entry} for shape, entry in repeated[:options['limit']]],
+                'fragments': fragments,
+                'processes': processes,
+            }, indent=2))
+        else:
+            self.report(processes, slowest[:options['limit']], repeated[:options['limit']], fragments)
+
+        if options['reset']:
+            for filename in os.listdir(directory):
+                if filename.startswith('perf-') and filename.endswith('.json'):
+                    os.remove(os.path.join(directory, filename))
+
+    def report(self, processes, slowest, repeated, fragments):
+        self.stdout.write(f'Slowest views ({len(processes)} snapshot files; percentiles are histogram bucket bounds)')
+        self.stdout.write(
+            f'{"view":<24} {"reqs":>6} {"mean ms":>8} {"p50":>6} {"p95":>6} {"max":>8} '
+            f'{"queries":>8} {"max q":>6} {"sql ms":>7} {"dup reqs":>8}'
+        )
+        for view, entry in slowest:
+            wall, queries = entry['wall'], entry['queries']
+            self.stdout.write(
+                f'{view[:24]:<24} {wall.count:>6} {wall.mean():>8.1f} {wall.percentile(50):>6g} '
+                f'{wall.percentile(95):>6g} {wall.maximum:>8.1f} {queries.mean():>8.1f} {queries.maximum:>6g} '
+                f'{entry["sql_ms"] / wall.count:>7.1f} {entry["duplicate_requests"]:>8}'
+            )
+
+        self.stdout.write('')
+        self.stdout.write('Most repeated query shapes (extra = runs beyond the first in each request)')
+        for shape, entry in repeated:
+            views = ', '.join(f'{view} ({count})' for view, count in
+                              sorted(entry['views'].items(), key=lambda item: -item[1]))
+            self.stdout.write(
+                f'{entry["extra"]:>6} extra in {entry["requests"]} requests, up to {entry["max_per_request"]} '
+                f'per request, {entry["duplicates"]} identical; {views}'
+            )
+            self.stdout.write(f'       from {entry["site"] or "unknown"}')
+            self.stdout.write(f'       {shape[:300]}')
+
+        self.stdout.write('')
+        self.stdout.write('Fragment cache, all processes')
+        self.stdout.write(f'{"fragment":<24} {"hits":>8} {"misses":>8} {"hit rate":>9}')
+        for name, entry in fragments.items():
+            self.stdout.write(f'{name[:24]:<24} {entry["hits"]:>8} {entry["misses"]:>8} {entry["hit_rate"]:>9.1%}')
+
+        self.stdout.write('')
+        self.stdout.write('View counter buffers, as of each process\'s last snapshot')
+        self.stdout.write(f'{"process":<32} {"pending":>8} {"posts":>6} {"lag s":>7} {"flushed":>9} {"last flush":>11}')
+        now = time.time()
+        for process in processes:
+            counter = process['view_counter']
+            if counter is None:
+                continue
+            last_flush = f'{now - counter["last_flush"]:.0f}s ago' if counter['last_flush'] else 'never'
+            self.stdout.write(
+                f'{process["file"][:32]:<32} {counter["pending_views"]:>8} {counter["pending_posts"]:>6} '
+                f'{counter["flush_lag"]:>7.1f} {counter["flushed_views"]:>9} {last_flush:>11}'
+            )
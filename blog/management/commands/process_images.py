@@ -0,0 +1,37 @@
+from concurrent.futures import wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog.images import content_images, process_images
+from blog.models import Post, ProcessedImage, Profile
+from blog.workers import WorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Make resized variants of profile pictures and post images that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'BLOG_IMAGE_WORKERS', 2),
+                            help='Threads resizing at once; 0 works inline.')
+
+    def handle(self, *args, **options):
+        done = set(ProcessedImage.objects.values_list('source', flat=True))
+        sources = {
+            'avatar': set(Profile.objects.exclude(profile_pic='').values_list('profile_pic', flat=True)),
+            'content': {
+                name
+                for content in Post.objects.values_list('content', flat=True).iterator(chunk_size=500)
+                for name in content_images(content)
+            },
+        }
+        workers = WorkerPool(workers=options['workers'], name='blog-images')
+        futures = [
+            workers.submit(process_images, [source], kind)
+            for kind, names in sources.items()
+            for source in sorted(names - done)
+        ]
+        if workers.workers > 0:
+            wait(futures)
+        workers.shutdown()
+        self.stdout.write(self.style.SUCCESS(f'Processed {len(futures)} images.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog import search
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the post search index from scratch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        total = 0
+        for batch in search.document_batches(Post.objects.using(using), options['batch_size']):
+            search.write_documents(batch, using=using)
+            total += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {total} posts ({search.get_backend(using)} backend).'
+        ))
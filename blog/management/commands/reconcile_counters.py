@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Now
+
+from blog.counters import actual_count, engagement_counters
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Recount like/bookmark/comment totals on posts and repair any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Posts checked per pair of queries.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted posts without fixing them.')
+
+    def handle(self, *args, **options):
+        counters = engagement_counters()
+        actual = {f'actual_{field}': actual_count(model) for field, model in counters.items()}
+        drifted_filter = Q()
+        for field in counters:
+            drifted_filter |= ~Q(**{field: F(f'actual_{field}')})
+
+        batch_size = options['batch_size']
+        checked = repaired = 0
+        last_pk = 0
+        while True:
+            # Walk the table by primary key range so each batch is one index scan
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1]
+            checked += len(batch)
+
+            drifted = list(
+                Post.objects.filter(pk__in=batch)
+                .annotate(**actual)
+                .filter(drifted_filter)
+                .values_list('pk', flat=True)
+            )
+            if not drifted:
+                continue
+            repaired += len(drifted)
+            if options['dry_run']:
+                continue
+            with transaction.atomic():
+                Post.objects.filter(pk__in=drifted).update(counters_updated_at=Now(), **{
+                    field: actual_count(model) for field, model in counters.items()
+                })
+
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} posts. {verb} {repaired} with drifted counters.'
+        ))
@@ -0,0 +1,37 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.benchmarks import BENCH_PASSWORD, add_seed_arguments, seed_site
+
+
+class Command(BaseCommand):
+    help = ('Fill the configured database with a synthetic site (users, categories, tags, posts, '
+            'comments, likes and bookmarks) for benchmarking.')
+
+    def add_arguments(self, parser):
+        add_seed_arguments(parser)
+        parser.add_argument('--prefix', default='bench',
+                            help='Usernames, slugs and category names start with it.')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the users made by an earlier run with this prefix, and all their content.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}-user')
+        if existing.exists():
+            if not options['replace']:
+                raise CommandError(f'Users named {prefix}-user* already exist; pass --replace or another --prefix.')
+            deleted, _ = existing.delete()
+            self.stdout.write(f'Deleted {deleted} rows from the previous run.')
+
+        start = time.perf_counter()
+        seed_site(
+            **{name: options[name] for name in ('users', 'categories', 'tags', 'posts', 'comments', 'likes', 'bookmarks')},
+            days=options['days'], seed=options['seed'], batch_size=options['batch_size'], prefix=prefix,
+            log=lambda line: self.stdout.write(f'  {line}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded in {time.perf_counter() - start:.1f}s. Log in as {prefix}-user0 / {BENCH_PASSWORD}.'
+        ))
@@ -0,0 +1,41 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from blog.replicas import replica_aliases
+
+SQLITE = 'django.db.backends.sqlite3'
+
+
+class Command(BaseCommand):
+    help = ('Copy the SQLite primary database onto the SQLite files configured as replicas, '
+            'for trying blog.replicas locally. Real replicas are kept up to date by the database server.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help='Keep copying every this many seconds instead of once.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        targets = [alias for alias in replica_aliases() if connections[alias].settings_dict['ENGINE'] == SQLITE]
+        if primary['ENGINE'] != SQLITE or not targets:
+            raise CommandError('Needs an SQLite primary and at least one SQLite replica in DATABASE_REPLICA_URLS.')
+        while True:
+            started = time.perf_counter()
+            source = sqlite3.connect(primary['NAME'])
+            try:
+                for alias in targets:
+                    target = sqlite3.connect(connections[alias].settings_dict['NAME'])
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            self.stdout.write(f'Copied {primary["NAME"]} to {", ".join(targets)} '
+                              f'in {(time.perf_counter() - started) * 1000:.0f} ms')
+            if not options['every']:
+                break
+            time.sleep(options['every'])
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.related import MAX_DF, RELATED_LIMIT, build, sparse
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the related-posts table from tags, categories and bookmarks. '
+        'Tag, category and status changes are applied as they happen; run this '
+        'now and then (e.g. nightly from cron) to pick up new bookmarks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=RELATED_LIMIT,
+                            help='Related posts kept per post.')
+        parser.add_argument('--max-df', type=int, default=MAX_DF,
+                            help='Ignore tags and readers shared by more posts than this.')
+        parser.add_argument('--engine', choices=['scipy', 'python'],
+                            default='scipy' if sparse is not None else 'python')
+
+    def handle(self, *args, **options):
+        if options['engine'] == 'scipy' and sparse is None:
+            raise CommandError('--engine scipy needs numpy and scipy installed.')
+        result = build(limit=options['limit'], max_df=options['max_df'], engine=options['engine'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {result.rows} related links for {result.posts} posts '
+            f'in {result.duration:.2f}s ({result.engine}).'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blog.trending import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        'Fold new views, likes, bookmarks and comments into the trending scores. '
+        'Run it every few minutes (e.g. from cron) and with --full now and then to '
+        'drop removed likes and comments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild every score from all events instead of adding new ones.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        run = recompute(full=options['full'], chunk_size=options['chunk_size'])
+        kind = 'Rebuilt' if run.full else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{kind} {run.posts} trending scores from {run.events} events in {run.duration:.2f}s.'
+        ))
@@ -0,0 +1,141 @@
+"""Serve uploaded media.
+
+Names that blog.storage derived from content never change, so they go out
+with a year-long ``immutable`` Cache-Control and browsers stop asking;
+older names get an hour and revalidate against ETag/Last-Modified.
+
+With BLOG_MEDIA_SENDFILE set the view only checks the name and sets the
+headers, and the front-end server sends the bytes (and handles Range):
+'x-accel-redirect' for nginx, with an ``internal`` location at
+BLOG_MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT, or 'x-sendfile' for Apache
+mod_xsendfile and lighttpd. Otherwise the file is streamed by FileResponse,
+which WSGI servers with wsgi.file_wrapper hand to sendfile(), and a single
+``Range: bytes=`` range is answered with 206.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from .storage import content_addressed
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """``length`` bytes of an open file from ``start`` on.
+
+    FileResponse reads it in blocks; wsgi.file_wrapper sendfile()s from the
+    current offset for Content-Length bytes.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def byte_range(header, size):
+    """(start, end) of a single-range header; None to send everything, False if unsatisfiable."""
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    first, last = match.groups()
+    if first == '':
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def sendfile_response(name, path):
+    mode = getattr(settings, 'BLOG_MEDIA_SENDFILE', None)
+    if not mode:
+        return None
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'BLOG_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(name)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def file_response(request, path, size, etag, last_modified):
+    file = open(path, 'rb')
+    requested = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if requested and if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        requested = None  # the client's copy is stale, so it gets the whole file
+    span = byte_range(requested, size) if requested else None
+    if span is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if span is None:
+        response = FileResponse(file)
+    else:
+        start, end = span
+        response = FileResponse(FileRange(file, start, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@require_safe
+def serve(request, path):
+    try:
+        full_path = default_storage.path(path)
+        stats = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('No such file')
+    if not stat.S_ISREG(stats.st_mode):
+        raise Http404('No such file')
+
+    etag = quote_etag(f'{stats.st_mtime_ns:x}-{stats.st_size:x}')
+    last_modified = int(stats.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = sendfile_response(path, full_path) or file_response(request, full_path, stats.st_size, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if content_addressed(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=MUTABLE_MAX_AGE)
+    return response
+
@@ -0,0 +1,116 @@
+# Generated by Django 5.2.8 on 2026-10-18 10:00
+
+import html
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+# blog.search as of this migration; the live module may change, this must not
+FTS_TABLE = 'blog_post_fts'
+FIELDS = ('title', 'body', 'category', 'tags')
+FIELD_WEIGHTS = {'title': 10, 'body': 1, 'category': 5, 'tags': 5}
+MAX_TERM_LENGTH = 64
+TOKEN_RE = re.compile(r'\w+')
+BATCH_SIZE = 500
+
+
+def build_document(post):
+    return {
+        'title': post.title or '',
+        'body': html.unescape(strip_tags(post.content or '')),
+        'category': post.category.name if post.category else '',
+        'tags': ' '.join(tag.name for tag in post.tags.all()),
+    }
+
+
+def document_terms(document):
+    weights = Counter()
+    for field, text in document.items():
+        for token in TOKEN_RE.findall(text.lower()):
+            weights[token[:MAX_TERM_LENGTH]] += FIELD_WEIGHTS[field]
+    return weights
+
+
+def write_batch(documents, use_fts, connection, SearchTerm):
+    if use_fts:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FIELDS)}) VALUES (%s, %s, %s, %s, %s)',
+                [[post_id] + [document[field] for field in FIELDS] for post_id, document in documents],
+            )
+    else:
+        SearchTerm.objects.using(connection.alias).bulk_create(
+            [
+                SearchTerm(term=term, post_id=post_id, weight=weight)
+                for post_id, document in documents
+                for term, weight in document_terms(document).items()
+            ],
+            batch_size=1000,
+        )
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    use_fts = False
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"{', '.join(FIELDS)}, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            use_fts = True
+        except Exception:
+            # SQLite built without FTS5; blog.search falls back to SearchTerm
+            pass
+        connection.__dict__.pop('_blog_search_backend', None)
+    backend = getattr(settings, 'BLOG_SEARCH_BACKEND', 'auto')
+    if backend != 'auto':
+        use_fts = backend == 'fts5'
+
+    Post = apps.get_model('blog', 'Post')
+    SearchTerm = apps.get_model('blog', 'SearchTerm')
+    posts = (
+        Post.objects.using(connection.alias)
+        .select_related('category').prefetch_related('tags').order_by('pk')
+    )
+    batch = []
+    for post in posts.iterator(chunk_size=BATCH_SIZE):
+        batch.append((post.pk, build_document(post)))
+        if len(batch) >= BATCH_SIZE:
+            write_batch(batch, use_fts, connection, SearchTerm)
+            batch = []
+    if batch:
+        write_batch(batch, use_fts, connection, SearchTerm)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+        schema_editor.connection.__dict__.pop('_blog_search_backend', None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_alter_like_unique_together_bookmark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='blog.post')),
+            ],
+            options={
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
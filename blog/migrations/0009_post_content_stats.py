@@ -0,0 +1,109 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:30
+
+from html.parser import HTMLParser
+
+from django.db import migrations, models
+
+# blog.content as of this migration; the live module may change, this must not
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 300
+BATCH_SIZE = 500
+SKIP_TAGS = {'script', 'style', 'template', 'head', 'noscript'}
+BREAK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+    'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'img', 'li', 'ol', 'p', 'pre', 'section', 'table', 'td',
+    'th', 'tr', 'ul',
+}
+
+
+class TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.word_count = 0
+        self.words = []
+        self.size = 0
+        self.skip_depth = 0
+        self.in_word = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BREAK_TAGS:
+            self.in_word = False
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BREAK_TAGS:
+            self.in_word = False
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BREAK_TAGS:
+            self.in_word = False
+
+    def handle_data(self, data):
+        if self.skip_depth or not data:
+            return
+        words = data.split()
+        if words:
+            continues_word = self.in_word and not data[0].isspace()
+            self.word_count += len(words) - continues_word
+            for i, word in enumerate(words):
+                if self.size > EXCERPT_LENGTH:
+                    break
+                if i == 0 and continues_word and self.words:
+                    self.words[-1] += word
+                else:
+                    self.words.append(word)
+                self.size += len(word) + 1
+        self.in_word = not data[-1].isspace()
+
+    @property
+    def excerpt(self):
+        excerpt = ' '.join(self.words)
+        if len(excerpt) <= EXCERPT_LENGTH and self.word_count <= len(self.words):
+            return excerpt
+        cut = excerpt[:EXCERPT_LENGTH]
+        cut = cut.rsplit(' ', 1)[0] if ' ' in cut else cut[:-1]
+        return cut + '…'
+
+
+def backfill_content_stats(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    posts = Post.objects.using(schema_editor.connection.alias)
+    batch = []
+    for post in posts.only('pk', 'content').order_by('pk').iterator(chunk_size=BATCH_SIZE):
+        extractor = TextExtractor()
+        extractor.feed(post.content or '')
+        extractor.close()
+        post.word_count = extractor.word_count
+        post.read_time = max(1, round(extractor.word_count / WORDS_PER_MINUTE))
+        post.excerpt = extractor.excerpt
+        batch.append(post)
+        if len(batch) >= BATCH_SIZE:
+            posts.bulk_update(batch, ['word_count', 'read_time', 'excerpt'])
+            batch = []
+    if batch:
+        posts.bulk_update(batch, ['word_count', 'read_time', 'excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_post_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, max_length=300),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_content_stats, migrations.RunPython.noop),
+    ]
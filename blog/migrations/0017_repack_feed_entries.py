@@ -0,0 +1,27 @@
+# Feed entries went from 32-bit to 64-bit ids to hold any BigAutoField pk
+
+from array import array
+
+from django.db import migrations
+
+
+def repack(source, target):
+    def convert(apps, schema_editor):
+        Feed = apps.get_model('blog', 'Feed')
+        feeds = Feed.objects.using(schema_editor.connection.alias)
+        for feed in feeds.only('pk', 'entries').iterator(chunk_size=500):
+            entries = array(source)
+            entries.frombytes(bytes(feed.entries))
+            feeds.filter(pk=feed.pk).update(entries=array(target, entries).tobytes())
+    return convert
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0016_storedfile'),
+    ]
+
+    operations = [
+        migrations.RunPython(repack('I', 'Q'), repack('Q', 'I')),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.utils.text import slugify
+from .slugs import save_with_unique_slug
+from .content import analyze_html, EXCERPT_LENGTH
 from ckeditor_uploader.fields import RichTextUploadingField
 class Category(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -9,17 +10,9 @@ class Category(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.name)
-            unique_slug = base_slug
-            counter = 1
-
-            while Category.objects.filter(slug=unique_slug).exclude(pk=self.pk).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
-
-            self.slug = unique_slug
-        
-        super().save(*args, **kwargs)
+            save_with_unique_slug(self, self.name, super().save, *args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -32,6 +25,16 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+class PostQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Rows for listing pages: related objects joined, the body left in the database."""
+        return (
+            self.select_related('category', 'author')
+            .prefetch_related('tags')
+            .defer('content')
+        )
+
+
 class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
@@ -44,26 +47,63 @@ class Post(models.Model):
     status = models.CharField(max_length=10, choices=[('draft','Draft'),('published','Published')])
     views = models.IntegerField(default=0)
     read_time = models.IntegerField(null=True, blank=True)  # 4 min read
+    # Computed from the HTML-stripped content whenever content changes
+    word_count = models.PositiveIntegerField(default=0)
+    excerpt = models.CharField(max_length=EXCERPT_LENGTH, blank=True)
+    # Denormalized engagement counters, see blog.counters.adjust_counts
+    like_count = models.PositiveIntegerField(default=0)
+    bookmark_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Last change to views or the counters above; updated_at tracks edits,
+    # including renames of the category or author (see blog.signals)
+    counters_updated_at = models.DateTimeField(null=True, blank=True)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # Keyset pagination walks (created_at, id) newest first
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='post_category_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded body so save() can tell whether it changed
+        instance._loaded_content = instance.__dict__.get('content')
+        # and the status, so signals can tell a post that was just published
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def just_published(self):
+        return self.status == 'published' and getattr(self, '_loaded_status', None) != 'published'
+
+    def content_changed(self):
+        if 'content' not in self.__dict__:
+            return False  # deferred and never touched
+        return self._state.adding or self.content != getattr(self, '_loaded_content', None)
 
     def save(self, *args, **kwargs):
+        # Word count, read time and excerpt, only when the body changed
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None or 'content' in update_fields) and self.content_changed():
+            stats = analyze_html(self.content, keep_text=True)
+            self.word_count = stats.word_count
+            self.read_time = stats.read_time  # 200 WPM reading speed
+            self.excerpt = stats.excerpt
+            self._plain_text = stats.text  # reused by the search indexer
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'word_count', 'read_time', 'excerpt'}
+
         # Slug generation (only on first save)
         if not self.slug:
-            base_slug = slugify(self.title)
-            unique_slug = base_slug
-            counter = 1
-
-            while Post.objects.filter(slug=unique_slug).exclude(pk=self.pk).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
-
-            self.slug = unique_slug
-
-        # Read time calculation
-        if self.content:
-            word_count = len(self.content.split())
-            self.read_time = max(1, round(word_count / 200))  # 200 WPM reading speed
-
-        super().save(*args, **kwargs)
+            save_with_unique_slug(self, self.title, super().save, *args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        self._loaded_content = self.__dict__.get('content')
+        self._loaded_status = self.__dict__.get('status')
 
 
 
@@ -74,6 +114,13 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     profile_pic = models.ImageField(upload_to='profiles/', null=True, blank=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored picture so signals can release it when it is replaced
+        instance._loaded_pic = instance.__dict__.get('profile_pic')
+        return instance
+
     def __str__(self):
         return self.user.username
 
@@ -85,6 +132,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # blog_detail pages through a post's comments newest first
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} on {self.post.title}"
@@ -103,4 +154,102 @@ class Bookmark(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ('post', 'user')
\ No newline at end of file
+        unique_together = ('post', 'user')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='bookmark_user_created_idx'),
+        ]
+
+
+class SearchTerm(models.Model):
+    # Inverted index used by blog.search when SQLite FTS5 is not available
+    term = models.CharField(max_length=64, db_index=True)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_terms')
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        unique_together = ('term', 'post')
+
+
+class PostScore(models.Model):
+    # Trending rank of a published post, maintained by blog.trending
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    # Copied from the post so per-category top lists read one index range
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    score = models.FloatField()
+    views_seen = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='postscore_rank_idx'),
+            models.Index(fields=['category', '-score', '-post'], name='postscore_category_rank_idx'),
+        ]
+
+
+class TrendingRun(models.Model):
+    # Events up to ``until`` are included in PostScore
+    until = models.DateTimeField(db_index=True)
+    full = models.BooleanField(default=False)
+    posts = models.PositiveIntegerField(default=0)
+    events = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0)
+
+
+class RelatedPost(models.Model):
+    # One of the best matches for ``post``, precomputed by blog.related
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('post', 'related')
+        indexes = [
+            models.Index(fields=['post', '-score'], name='relatedpost_rank_idx'),
+        ]
+
+
+class Feed(models.Model):
+    # A user's "For you" list, maintained by blog.feeds
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='feed')
+    # Post ids newest first, packed as 64-bit unsigned ints
+    entries = models.BinaryField(default=bytes)
+    built_at = models.DateTimeField()
+    # Last visit; only recent visitors get new posts pushed in
+    seen_at = models.DateTimeField(db_index=True)
+
+
+class FeedInterest(models.Model):
+    # One author, category or tag whose new posts go into ``user``'s Feed
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_interests')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+
+
+class ProcessedImage(models.Model):
+    # Resized variants of an uploaded image, written by blog.images
+    source = models.CharField(max_length=255, unique=True)  # storage name of the original
+    kind = models.CharField(max_length=10, choices=[('avatar', 'Avatar'), ('content', 'Content')])
+    digest = models.CharField(max_length=64)  # SHA-256 of the original's bytes
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    # [{'format', 'width', 'height', 'name', 'size'}, ...], smallest first
+    variants = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['digest', 'kind'], name='processedimage_digest_idx'),
+        ]
+
+
+class StoredFile(models.Model):
+    # A file kept by blog.storage, and how many saves returned its name
+    name = models.CharField(max_length=255, unique=True)
+    digest = models.CharField(max_length=64)  # SHA-256 of the bytes
+    size = models.PositiveBigIntegerField()
+    refs = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
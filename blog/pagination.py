@@ -0,0 +1,204 @@
+"""Keyset (cursor) pagination for listings.
+
+Pages are addressed by the sort key of the row at the page boundary rather
+than an OFFSET, so page 500 costs the same index range scan as page 1. The
+cursor is an opaque token that encodes that key and the paging direction.
+"""
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+POST_ORDERING = ('-created_at', '-id')
+COMMENT_ORDERING = ('-created_at', '-id')
+# Integers past this overflow the database's BIGINT
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def encode_cursor(values, direction):
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {'dt': value.isoformat()}
+        payload.append(value)
+    raw = json.dumps({'v': payload, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def valid_value(model, name, value):
+    """Whether ``value`` can be compared with ordering field ``name`` of ``model``."""
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = models.IntegerField()  # annotations such as search_rank are positions
+    if field.is_relation:
+        field = field.target_field
+    if isinstance(field, models.DateTimeField):
+        return isinstance(value, datetime) and timezone.is_aware(value)
+    if isinstance(value, bool):
+        return False
+    if isinstance(field, models.FloatField):
+        return isinstance(value, (int, float)) and abs(value) <= MAX_INTEGER and math.isfinite(value)
+    if isinstance(field, models.IntegerField):
+        return isinstance(value, int) and abs(value) <= MAX_INTEGER
+    return False
+
+
+def decode_cursor(token, model=None, ordering=None):
+    """Return (values, direction), or None for a missing or mangled token.
+
+    With ``model`` and ``ordering`` the values must also match the ordering
+    fields in number and type, so a tampered cursor reads as no cursor
+    rather than failing in the query.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        values = [
+            datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+            for value in data['v']
+        ]
+        direction = data['d']
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None
+    if direction not in ('next', 'prev'):
+        return None
+    if ordering is not None and (
+        len(values) != len(ordering)
+        or not all(valid_value(model, field.lstrip('-'), value) for field, value in zip(ordering, values))
+    ):
+        return None
+    return values, direction
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """Q matching rows strictly after ``values`` in ``ordering``."""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        condition |= equal & Q(**{f'{name}__{"lt" if descending else "gt"}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def get_page_size(request):
+    default = getattr(settings, 'BLOG_PAGE_SIZE', 20)
+    maximum = getattr(settings, 'BLOG_MAX_PAGE_SIZE', 100)
+    try:
+        size = int(request.GET.get('page_size', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+
+class CursorPage:
+    def __init__(self, items, ordering, has_next, has_previous):
+        self.items = items
+        self.ordering = ordering
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = self._cursor(items[-1], 'next') if has_next and items else None
+        self.previous_cursor = self._cursor(items[0], 'prev') if has_previous and items else None
+        self.next_query = self.previous_query = None
+
+    def _cursor(self, item, direction):
+        values = [getattr(item, field.lstrip('-')) for field in self.ordering]
+        return encode_cursor(values, direction)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def _page_plan(queryset, cursor, page_size, ordering):
+    """Return (queryset slice to fetch, direction) for the requested page."""
+    decoded = decode_cursor(cursor, queryset.model, ordering)
+    if decoded is None:
+        return queryset.order_by(*ordering)[:page_size + 1], None
+
+    values, direction = decoded
+    if direction == 'next':
+        queryset = queryset.filter(keyset_filter(ordering, values)).order_by(*ordering)
+    else:
+        # Walk backwards from the cursor; _build_page restores display order
+        reversed_ordering = [f[1:] if f.startswith('-') else f'-{f}' for f in ordering]
+        queryset = queryset.filter(keyset_filter(ordering, values, reverse=True)).order_by(*reversed_ordering)
+    return queryset[:page_size + 1], direction
+
+
+def _build_page(items, direction, page_size, ordering):
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if direction is None:
+        return CursorPage(items, ordering, has_more, False)
+    if direction == 'next':
+        return CursorPage(items, ordering, has_more, True)
+    return CursorPage(items[::-1], ordering, True, has_more)
+
+
+def paginate(queryset, cursor=None, page_size=20, ordering=POST_ORDERING):
+    """Return one CursorPage of ``queryset`` ordered by ``ordering``.
+
+    The last ordering field must be unique (normally ``id``) so that every
+    row has a distinct key.
+    """
+    page_queryset, direction = _page_plan(queryset, cursor, page_size, ordering)
+    return _build_page(list(page_queryset), direction, page_size, ordering)
+
+
+async def apaginate(queryset, cursor=None, page_size=20, ordering=POST_ORDERING):
+    """Async version of paginate() for async views."""
+    page_queryset, direction = _page_plan(queryset, cursor, page_size, ordering)
+    items = [item async for item in page_queryset]
+    return _build_page(items, direction, page_size, ordering)
+
+
+def add_page_queries(request, page):
+    """Set ``next_query``/``previous_query`` on ``page``, keeping the other GET parameters."""
+    for attribute, cursor in (('next_query', page.next_cursor), ('previous_query', page.previous_cursor)):
+        if cursor:
+            params = request.GET.copy()
+            params['cursor'] = cursor
+            setattr(page, attribute, params.urlencode())
+    return page
+
+
+def paginate_request(request, queryset, ordering=POST_ORDERING):
+    """Paginate from the ``cursor`` and ``page_size`` GET parameters.
+
+    The page gets ``next_query``/``previous_query`` query strings that keep
+    the other GET parameters (search, category filter, ...).
+    """
+    page = paginate(
+        queryset,
+        cursor=request.GET.get('cursor'),
+        page_size=get_page_size(request),
+        ordering=ordering,
+    )
+    return add_page_queries(request, page)
+
+
+async def apaginate_request(request, queryset, ordering=POST_ORDERING):
+    page = await apaginate(
+        queryset,
+        cursor=request.GET.get('cursor'),
+        page_size=get_page_size(request),
+        ordering=ordering,
+    )
+    return add_page_queries(request, page)
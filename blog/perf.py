@@ -0,0 +1,377 @@
+"""Per-request timing and SQL statistics.
+
+PerformanceMiddleware times each request and, through an execute wrapper on
+every database connection, counts its queries and the time spent in them.
+Queries are grouped by shape, their SQL with IN lists and VALUES rows
+collapsed. A request that runs the same SQL with the same parameters twice
+(duplicate), or one shape BLOG_PERF_SIMILAR_THRESHOLD times or more (the
+usual N+1), is logged to ``blog.perf`` with the template line, or else the
+blog code, that triggered the repeat.
+
+Per-view histograms of wall time and query counts, and per-shape repeat
+counts, are aggregated in memory and written as JSON to BLOG_PERF_DIR every
+BLOG_PERF_SNAPSHOT_INTERVAL seconds and at exit, one file per process, along
+with the process's view counter backlog and fragment cache hit counts. The perf_report command merges the
+files. With BLOG_PERF_SERVER_TIMING each
+response also carries a Server-Timing header, which browser dev tools show
+next to the request.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+
+from .caching import fragment_stats
+from .counters import view_counter
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; the last bucket is open-ended
+WALL_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)  # ms
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+MAX_SHAPES = 1000
+MAX_VIEWS_PER_SHAPE = 10
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+VALUES_RE = re.compile(r'(\((?:%s, )*%s\))(?:, \((?:%s, )*%s\))+')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'(?<![\w."])\d+(?![\w"])')
+# Every atomic block outside a transaction repeats the same BEGIN; that is not a repeated query
+TRANSACTION_RE = re.compile(r'^\s*(?:BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+RENDER_CODE = Node.render_annotated.__code__
+
+current_request = ContextVar('blog_perf_request', default=None)
+
+
+def query_shape(sql):
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = VALUES_RE.sub(r'\1, ...', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+def call_site():
+    """Where the running query came from: 'template:line', 'blog/file.py:line', or both."""
+    template = code = None
+    frame = sys._getframe(2)
+    while frame is not None and template is None:
+        if frame.f_code is RENDER_CODE:
+            node = frame.f_locals.get('self')
+            origin = getattr(node, 'origin', None)
+            if origin is not None and node.token is not None:
+                template = f'{origin.template_name or origin.name}:{node.token.lineno}'
+        elif code is None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(APP_DIR) and filename != __file__:
+                code = f'blog/{os.path.relpath(filename, APP_DIR)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return ' via '.join(site for site in (template, code) if site) or None
+
+
+class RequestStats:
+    """The queries of one request; installed as its execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.shapes = Counter()
+        self.exact = Counter()
+        self.sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            if not TRANSACTION_RE.match(sql):
+                self.record(sql, params)
+
+    def record(self, sql, params):
+        shape = query_shape(sql)
+        self.shapes[shape] += 1
+        self.exact[sql, repr(params)] += 1
+        if self.shapes[shape] == 2:
+            self.sites[shape] = call_site()
+
+    def duplicates(self):
+        """{shape: extra runs} of identical SQL and parameters."""
+        extra = Counter()
+        for (sql, _), count in self.exact.items():
+            if count > 1:
+                extra[query_shape(sql)] += count - 1
+        return extra
+
+    def similar(self, threshold):
+        return {shape: count for shape, count in self.shapes.items() if count >= threshold}
+
+
+class Histogram:
+    def __init__(self, bounds, counts=None, total=0.0, maximum=0.0):
+        self.bounds = tuple(bounds)
+        self.counts = list(counts) if counts else [0] * (len(self.bounds) + 1)
+        self.total = total
+        self.maximum = maximum
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.maximum = max(self.maximum, other.maximum)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th percentile, capped at the maximum."""
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.bounds[index], self.maximum) if index < len(self.bounds) else self.maximum
+        return 0.0
+
+    def as_dict(self):
+        return {'bounds': self.bounds, 'counts': self.counts, 'total': self.total, 'max': self.maximum}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['bounds'], data['counts'], data['total'], data['max'])
+
+
+class PerfStats:
+    """Aggregates of every request this process served."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.views = {}
+            self.shapes = {}
+            self.since = time.time()
+            self._snapshot_at = time.monotonic()
+
+    def record(self, view, wall_ms, stats, duplicates):
+        with self._lock:
+            entry = self.views.get(view)
+            if entry is None:
+                entry = self.views[view] = new_view_entry()
+            entry['wall'].add(wall_ms)
+            entry['queries'].add(stats.queries)
+            entry['sql_ms'] += stats.sql_time * 1000
+            entry['duplicate_requests'] += bool(duplicates)
+            for shape, count in stats.shapes.items():
+                if count < 2:
+                    continue
+                shape_entry = self.shapes.get(shape)
+                if shape_entry is None:
+                    if len(self.shapes) >= MAX_SHAPES:
+                        continue
+                    shape_entry = self.shapes[shape] = new_shape_entry()
+                shape_entry['extra'] += count - 1
+                shape_entry['duplicates'] += duplicates.get(shape, 0)
+                shape_entry['requests'] += 1
+                shape_entry['max_per_request'] = max(shape_entry['max_per_request'], count)
+                if view in shape_entry['views'] or len(shape_entry['views']) < MAX_VIEWS_PER_SHAPE:
+                    shape_entry['views'][view] += 1
+                shape_entry['site'] = stats.sites.get(shape) or shape_entry['site']
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'since': self.since,
+                'written': time.time(),
+                'views': {
+                    view: {**entry, 'wall': entry['wall'].as_dict(), 'queries': entry['queries'].as_dict()}
+                    for view, entry in self.views.items()
+                },
+                'shapes': {shape: {**entry, 'views': dict(entry['views'])} for shape, entry in self.shapes.items()},
+                'view_counter': view_counter.stats(),
+                'fragments': fragment_stats(),
+            }
+
+    def snapshot_due(self):
+        interval = getattr(settings, 'BLOG_PERF_SNAPSHOT_INTERVAL', 30)
+        with self._lock:
+            if time.monotonic() - self._snapshot_at < interval:
+                return False
+            self._snapshot_at = time.monotonic()
+            return True
+
+    def write_snapshot(self):
+        directory = getattr(settings, 'BLOG_PERF_DIR', None)
+        if not directory or not self.views:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'perf-{socket.gethostname()}-{os.getpid()}.json')
+        partial = f'{path}.partial'
+        with open(partial, 'w') as handle:
+            json.dump(self.snapshot(), handle)
+        os.replace(partial, path)
+        return path
+
+
+def new_view_entry():
+    return {'wall': Histogram(WALL_BUCKETS), 'queries': Histogram(QUERY_BUCKETS), 'sql_ms': 0.0,
+            'duplicate_requests': 0}
+
+
+def new_shape_entry():
+    return {'extra': 0, 'duplicates': 0, 'requests': 0, 'max_per_request': 0, 'views': Counter(), 'site': None}
+
+
+def load_snapshots(directory):
+    """Merge the snapshot files in ``directory`` into ({view: entry}, {shape: entry}, processes).
+
+    ``processes`` has one entry per file read, with the process's view counter
+    buffer and fragment cache hit counts as of that snapshot.
+    """
+    views, shapes, processes = {}, {}, []
+    if not directory or not os.path.isdir(directory):
+        return views, shapes, processes
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith('perf-') and filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            logger.warning('Skipping unreadable perf snapshot %s', filename)
+            continue
+        processes.append({
+            'file': filename, 'pid': data['pid'], 'written': data['written'],
+            'view_counter': data.get('view_counter'), 'fragments': data.get('fragments') or {},
+        })
+        for view, entry in data['views'].items():
+            merged = views.setdefault(view, new_view_entry())
+            merged['wall'].merge(Histogram.from_dict(entry['wall']))
+            merged['queries'].merge(Histogram.from_dict(entry['queries']))
+            merged['sql_ms'] += entry['sql_ms']
+            merged['duplicate_requests'] += entry['duplicate_requests']
+        for shape, entry in data['shapes'].items():
+            merged = shapes.setdefault(shape, new_shape_entry())
+            for key in ('extra', 'duplicates', 'requests'):
+                merged[key] += entry[key]
+            merged['max_per_request'] = max(merged['max_per_request'], entry['max_per_request'])
+            merged['views'].update(entry['views'])
+            merged['site'] = merged['site'] or entry['site']
+    return views, shapes, processes
+
+
+perf_stats = PerfStats()
+atexit.register(lambda: perf_stats.write_snapshot())
+
+
+def dispatch_query(execute, sql, params, many, context):
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_wrapper(connection, **kwargs):
+    # execute_wrappers lives on the connection object, so this survives reconnects
+    if dispatch_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(dispatch_query)
+
+
+connection_created.connect(install_wrapper)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'BLOG_PERF_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed connection_created
+        for connection in connections.all(initialized_only=True):
+            install_wrapper(connection)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        wall_ms = (time.perf_counter() - stats.started) * 1000
+        match = request.resolver_match
+        view = (match.view_name or match._func_path) if match else '<unresolved>'
+        duplicates = stats.duplicates()
+        similar = stats.similar(getattr(settings, 'BLOG_PERF_SIMILAR_THRESHOLD', 5))
+        for shape in duplicates.keys() | similar.keys():
+            logger.warning(
+                '%s ran %d %s queries from %s: %s',
+                view, stats.shapes[shape], 'duplicate' if shape in duplicates else 'similar',
+                stats.sites.get(shape) or 'unknown', shape,
+            )
+
+        perf_stats.record(view, wall_ms, stats, duplicates)
+        if perf_stats.snapshot_due():
+            try:
+                perf_stats.write_snapshot()
+            except OSError:
+                logger.exception('Writing the perf snapshot failed')
+
+        if getattr(settings, 'BLOG_PERF_SERVER_TIMING', False):
+            timings = [
+                f'app;dur={wall_ms:.1f}',
+                f'sql;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries"',
+            ]
+            if duplicates or similar:
+                timings.append(
+                    f'repeats;desc="{sum(duplicates.values())} duplicate, {len(similar)} N+1 shapes"'
+                )
+            response['Server-Timing'] = ', '.join(timings)
+        return response
@@ -0,0 +1,292 @@
+"""Related posts, precomputed.
+
+Each published post is a sparse vector over its tags and the readers who
+bookmarked it, weighted by inverse document frequency so that a rare tag or
+a reader with a short reading list says more than a popular one. Two posts
+are as related as the cosine of their vectors, raised by CATEGORY_BOOST
+when they share a category. RelatedPost keeps the best RELATED_LIMIT
+matches of every post, and blog_detail reads them back with one query.
+
+Posts only become candidates by sharing a feature, so a category on its own
+never relates two posts, and features carried by more than ``max_df``
+posts are ignored: they say little and the number of pairs they create
+grows with the square of their size.
+
+build() recomputes every row, vectorized with scipy.sparse when it is
+installed and with a pure-Python inverted index otherwise. refresh() redoes
+the posts whose tags, category or status changed and patches them into
+their neighbours' lists; a list that loses a member stays short until the
+next build(). Edits schedule it in a pool of BLOG_RELATED_WORKERS threads
+rather than on the request thread.
+"""
+import atexit
+import heapq
+import math
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Bookmark, Post, RelatedPost
+from .workers import WorkerPool
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:
+    np = sparse = None
+
+RELATED_LIMIT = 5
+MAX_DF = 500
+
+related_workers = WorkerPool('BLOG_RELATED_WORKERS', 1, name='blog-related')
+atexit.register(related_workers.shutdown)
+CATEGORY_BOOST = 0.25
+FEATURE_WEIGHTS = {'tag': 1.0, 'reader': 0.5}
+ROW_BLOCK = 1000
+# Keeps IN (...) lists under every backend's parameter limit
+IN_CHUNK = 900
+
+PostTag = Post.tags.through
+SOURCES = {
+    # feature kind: (model, feature column)
+    'tag': (PostTag, 'tag_id'),
+    'reader': (Bookmark, 'user_id'),
+}
+
+
+class BuildResult:
+    def __init__(self, posts, rows, engine, duration):
+        self.posts = posts
+        self.rows = rows
+        self.engine = engine
+        self.duration = duration
+
+
+def idf(count, total):
+    return math.log(1 + total / count)
+
+
+def vectorize(features, document_frequency, total, max_df):
+    """Unit-length {feature: weight} per post; posts left with no feature are dropped."""
+    vectors = {}
+    for post_id, post_features in features.items():
+        vector = {}
+        for feature in post_features:
+            count = document_frequency.get(feature, 0)
+            if 0 < count <= max_df:
+                vector[feature] = FEATURE_WEIGHTS[feature[0]] * idf(count, total)
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        if norm:
+            vectors[post_id] = {feature: weight / norm for feature, weight in vector.items()}
+    return vectors
+
+
+def chunked(values, size=IN_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def load_features(post_ids=None, features=None):
+    """(post_id, feature) pairs of published posts, all of them or by post or feature.
+
+    A feature is ``(kind, id)``: ``('tag', tag_id)`` or ``('reader', user_id)``.
+    """
+    for kind, (model, column) in SOURCES.items():
+        rows = model.objects.filter(post__status='published').values_list('post_id', column)
+        if post_ids is not None:
+            batches = [rows.filter(post_id__in=chunk) for chunk in chunked(post_ids)]
+        elif features is not None:
+            ids = [pk for k, pk in features if k == kind]
+            batches = [rows.filter(**{f'{column}__in': chunk}) for chunk in chunked(ids)]
+        else:
+            batches = [rows]
+        for batch in batches:
+            for post_id, pk in batch.iterator(chunk_size=5000):
+                yield post_id, (kind, pk)
+
+
+def count_posts(features):
+    """Number of published posts carrying each feature."""
+    counts = {}
+    for kind, (model, column) in SOURCES.items():
+        for ids in chunked(pk for k, pk in features if k == kind):
+            rows = (
+                model.objects.filter(post__status='published', **{f'{column}__in': ids})
+                .values(column).annotate(n=Count('post_id')).order_by().values_list(column, 'n')
+            )
+            counts.update(((kind, pk), n) for pk, n in rows)
+    return counts
+
+
+def similarity(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(feature, 0.0) for feature, weight in a.items())
+
+
+def boosted(score, category_id, other_category_id):
+    if category_id is not None and category_id == other_category_id:
+        return score * (1 + CATEGORY_BOOST)
+    return score
+
+
+def best(scores, limit):
+    """The ``limit`` best (related_id, score) pairs, ties to the newer post."""
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def python_matches(vectors, categories, limit):
+    index = defaultdict(list)
+    for post_id, vector in vectors.items():
+        for feature, weight in vector.items():
+            index[feature].append((post_id, weight))
+    for post_id, vector in vectors.items():
+        scores = defaultdict(float)
+        for feature, weight in vector.items():
+            for other, other_weight in index[feature]:
+                scores[other] += weight * other_weight
+        del scores[post_id]
+        category_id = categories[post_id]
+        for other in scores:
+            scores[other] = boosted(scores[other], category_id, categories[other])
+        yield post_id, best(scores, limit)
+
+
+def sparse_matches(vectors, categories, limit):
+    post_ids = list(vectors)
+    columns = {}
+    rows, cols, data = [], [], []
+    for row, post_id in enumerate(post_ids):
+        for feature, weight in vectors[post_id].items():
+            rows.append(row)
+            cols.append(columns.setdefault(feature, len(columns)))
+            data.append(weight)
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(post_ids), len(columns)))
+    transposed = matrix.T.tocsc()
+    ids = np.array(post_ids)
+    # -1 stands for "no category", which matches nothing
+    category_ids = np.array([categories[post_id] or -1 for post_id in post_ids])
+
+    for start in range(0, len(post_ids), ROW_BLOCK):
+        block = (matrix[start:start + ROW_BLOCK] @ transposed).tocsr()
+        for offset in range(block.shape[0]):
+            row = start + offset
+            begin, end = block.indptr[offset], block.indptr[offset + 1]
+            others, scores = block.indices[begin:end], block.data[begin:end]
+            keep = others != row
+            others, scores = others[keep], scores[keep]
+            if category_ids[row] >= 0:
+                scores = np.where(category_ids[others] == category_ids[row], scores * (1 + CATEGORY_BOOST), scores)
+            # Best score first, ties to the newer post, as in best()
+            top = np.lexsort((ids[others], scores))[::-1][:limit]
+            yield post_ids[row], list(zip(ids[others[top]].tolist(), scores[top].tolist()))
+
+
+def build(limit=RELATED_LIMIT, max_df=MAX_DF, engine=None):
+    """Recompute RelatedPost for every published post."""
+    started = time.perf_counter()
+    engine = engine or ('scipy' if sparse is not None else 'python')
+    categories = dict(Post.objects.filter(status='published').values_list('pk', 'category_id'))
+    features = defaultdict(list)
+    document_frequency = defaultdict(int)
+    for post_id, feature in load_features():
+        features[post_id].append(feature)
+        document_frequency[feature] += 1
+    vectors = vectorize(features, document_frequency, len(categories), max_df)
+
+    matches = sparse_matches if engine == 'scipy' else python_matches
+    rows = [
+        RelatedPost(post_id=post_id, related_id=related_id, score=score)
+        for post_id, related in matches(vectors, categories, limit)
+        for related_id, score in related
+    ]
+    with transaction.atomic():
+        RelatedPost.objects.all().delete()
+        RelatedPost.objects.bulk_create(rows, batch_size=5000)
+    return BuildResult(len(vectors), len(rows), engine, time.perf_counter() - started)
+
+
+def refresh(post_ids, limit=RELATED_LIMIT, max_df=MAX_DF):
+    """Recompute the related lists of ``post_ids`` and patch them into their neighbours'."""
+    post_ids = set(post_ids)
+    categories = dict(Post.objects.filter(pk__in=post_ids, status='published').values_list('pk', 'category_id'))
+    total = Post.objects.filter(status='published').count()
+
+    # The changed posts' features, then every post sharing one of them
+    features = defaultdict(list)
+    for post_id, feature in load_features(post_ids=list(categories)):
+        features[post_id].append(feature)
+    document_frequency = count_posts({f for post_features in features.values() for f in post_features})
+    shared = [feature for feature, count in document_frequency.items() if count <= max_df]
+    neighbours = {post_id for post_id, _ in load_features(features=shared)}
+    neighbours -= post_ids
+
+    # Whole vectors of the neighbours, which also carry features the changed posts lack
+    neighbour_features = defaultdict(list)
+    for post_id, feature in load_features(post_ids=neighbours):
+        neighbour_features[post_id].append(feature)
+    missing = {f for post_features in neighbour_features.values() for f in post_features} - set(document_frequency)
+    if missing:
+        document_frequency.update(count_posts(missing))
+    for chunk in chunked(neighbours):
+        categories.update(Post.objects.filter(pk__in=chunk).values_list('pk', 'category_id'))
+    vectors = vectorize({**features, **neighbour_features}, document_frequency, total, max_df)
+
+    changed = sorted(post_id for post_id in post_ids if post_id in vectors)
+    lists, row_ids = defaultdict(dict), {}
+    for chunk in chunked(neighbours):
+        rows = RelatedPost.objects.filter(post_id__in=chunk).exclude(related_id__in=post_ids)
+        for pk, post_id, related_id, score in rows.values_list('pk', 'post_id', 'related_id', 'score'):
+            lists[post_id][related_id] = score
+            row_ids[post_id, related_id] = pk
+
+    created, touched = [], set()
+    for post_id in changed:
+        scores = {}
+        for other in vectors:
+            if other != post_id:
+                score = similarity(vectors[post_id], vectors[other])
+                if score > 0:
+                    scores[other] = boosted(score, categories[post_id], categories[other])
+        created += [RelatedPost(post_id=post_id, related_id=pk, score=score) for pk, score in best(scores, limit)]
+        # Similarity is symmetric, so the changed post may now belong in a neighbour's list
+        for other, score in scores.items():
+            if other not in post_ids:
+                lists[other][post_id] = score
+                touched.add(other)
+
+    dropped = []
+    for post_id in touched:
+        kept = dict(best(lists[post_id], limit))
+        created += [
+            RelatedPost(post_id=post_id, related_id=pk, score=score)
+            for pk, score in kept.items() if pk in post_ids
+        ]
+        dropped += [row_ids[post_id, pk] for pk in lists[post_id] if pk not in kept and pk not in post_ids]
+
+    with transaction.atomic():
+        RelatedPost.objects.filter(post_id__in=post_ids).delete()
+        RelatedPost.objects.filter(related_id__in=post_ids).delete()
+        for chunk in chunked(dropped):
+            RelatedPost.objects.filter(pk__in=chunk).delete()
+        RelatedPost.objects.bulk_create(created)
+    return len(created)
+
+
+def schedule_refresh(post_ids, using='default'):
+    """Refresh ``post_ids`` in the worker pool once the current transaction commits."""
+    post_ids = set(post_ids)
+    transaction.on_commit(lambda: related_workers.submit(refresh, post_ids), using=using)
+
+
+def related_posts(post, limit=RELATED_LIMIT):
+    """The precomputed matches of ``post``, best first, as a queryset of RelatedPost."""
+    return (
+        RelatedPost.objects.filter(post=post, related__status='published')
+        .select_related('related')
+        .only('score', 'related__title', 'related__slug', 'related__excerpt', 'related__read_time')
+        .order_by('-score', '-related_id')[:limit]
+    )
@@ -0,0 +1,130 @@
+"""Read replica routing.
+
+ReplicaMiddleware makes the request being served visible to ReplicaRouter,
+which sends reads to one of BLOG_DATABASE_REPLICAS when the request is a
+GET or HEAD of one of BLOG_REPLICA_VIEWS. Everything else, and every write,
+goes to the primary. Sessions are always read from the primary: a replica
+that has not caught up with a login would otherwise log the user out.
+
+Read-your-writes: once a request writes, its later reads go to the primary,
+and a POST (or any unsafe method) sets a cookie that keeps the client's
+reads on the primary for BLOG_REPLICA_PIN_SECONDS, longer than replicas are
+expected to lag. A transaction open on the primary also keeps reads there.
+
+Locally a second SQLite file can stand in for a replica:
+
+    DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3 python manage.py sync_replica --every 5
+
+copies the primary to it every five seconds, so it lags like a real one.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'blog_read_primary'
+# Apps whose rows decide who the request is; never read them from a replica
+PRIMARY_APPS = {'sessions'}
+
+current_request = ContextVar('blog_replica_request', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'BLOG_DATABASE_REPLICAS', ())
+
+
+def replica_for(request):
+    """The replica alias this request reads from, or None for the primary."""
+    if getattr(request, '_wrote_primary', False):
+        return None
+    replica = getattr(request, '_read_replica', None)
+    if replica is None:
+        match = request.resolver_match
+        if match is None:
+            return None  # not routed yet; decide once the view is known
+        if (request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES
+                and match.url_name in getattr(settings, 'BLOG_REPLICA_VIEWS', ())):
+            replica = random.choice(replica_aliases())
+        else:
+            replica = ''
+        request._read_replica = replica
+    return replica or None
+
+
+def read_replica():
+    """The replica the request being served has read from, if any.
+
+    Later reads may have moved to the primary, but objects already loaded,
+    and whatever is rendered from them, can still be behind it.
+    """
+    request = current_request.get()
+    return getattr(request, '_read_replica', None) or None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        request = current_request.get()
+        if request is None or model._meta.app_label in PRIMARY_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return replica_for(request)
+
+    def db_for_write(self, model, **hints):
+        request = current_request.get()
+        if request is not None:
+            request._wrote_primary = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A replica holds the primary's rows, so objects read from either may be related
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary
+        return False if db in replica_aliases() else None
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = current_request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response)
+
+    def finish(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=getattr(settings, 'BLOG_REPLICA_PIN_SECONDS', 10),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,245 @@
+"""Full-text search over posts.
+
+On SQLite the index is an FTS5 virtual table whose rowid is the post id.
+Other databases use the SearchTerm inverted index, built in Python from the
+same documents. Both rank results by relevance, with title matches weighing
+more than tag/category matches, which weigh more than body matches.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, transaction
+from django.db.models import Case, IntegerField, Max, Q, Sum, Value, When
+
+from .content import html_to_text
+
+FTS_TABLE = 'blog_post_fts'
+FIELDS = ('title', 'body', 'category', 'tags')
+FIELD_WEIGHTS = {'title': 10, 'body': 1, 'category': 5, 'tags': 5}
+MAX_RESULTS = 1000
+MAX_TERM_LENGTH = 64
+PREFIX_UPPER_BOUND = chr(0x10FFFF)
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def build_document(title, content, category='', tags=(), text=None):
+    """Searchable fields of a post; pass ``text`` when the stripped body is at hand."""
+    return {
+        'title': title or '',
+        'body': html_to_text(content) if text is None else text,
+        'category': category or '',
+        'tags': ' '.join(tags),
+    }
+
+
+def post_document(post):
+    category = post.category.name if post.category_id else ''
+    tags = post.tags.values_list('name', flat=True)
+    # Post.save leaves the text it extracted for word counting on the instance
+    text = getattr(post, '_plain_text', None)
+    return build_document(post.title, post.content, category, tags, text=text)
+
+
+def document_batches(posts, batch_size=500):
+    """Yield lists of (post_id, document) for a queryset of posts."""
+    posts = posts.select_related('category').prefetch_related('tags').order_by('pk')
+    batch = []
+    for post in posts.iterator(chunk_size=batch_size):
+        category = post.category.name if post.category else ''
+        tags = [tag.name for tag in post.tags.all()]
+        batch.append((post.pk, build_document(post.title, post.content, category, tags)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def fts_table_exists(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [FTS_TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def get_backend(using='default'):
+    """Return 'fts5' or 'terms' for the given database alias."""
+    backend = getattr(settings, 'BLOG_SEARCH_BACKEND', 'auto')
+    if backend != 'auto':
+        return backend
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return 'terms'
+    # Cached per database file so the test database gets its own answer
+    cache = connection.__dict__.setdefault('_blog_search_backend', {})
+    name = connection.settings_dict['NAME']
+    if name not in cache:
+        cache[name] = 'fts5' if fts_table_exists(connection) else 'terms'
+    return cache[name]
+
+
+def document_terms(document):
+    weights = Counter()
+    for field, text in document.items():
+        for token in tokenize(text):
+            weights[token[:MAX_TERM_LENGTH]] += FIELD_WEIGHTS[field]
+    return weights
+
+
+def write_documents(documents, using='default', term_model=None):
+    """Replace the index entries for an iterable of (post_id, document)."""
+    documents = list(documents)
+    if not documents:
+        return
+    post_ids = [post_id for post_id, _ in documents]
+
+    if get_backend(using) == 'fts5':
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids
+            )
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, {", ".join(FIELDS)}) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                [[post_id] + [doc[f] for f in FIELDS] for post_id, doc in documents],
+            )
+        return
+
+    if term_model is None:
+        from .models import SearchTerm as term_model
+    term_model.objects.using(using).filter(post_id__in=post_ids).delete()
+    term_model.objects.using(using).bulk_create(
+        [
+            term_model(term=term, post_id=post_id, weight=weight)
+            for post_id, doc in documents
+            for term, weight in document_terms(doc).items()
+        ],
+        batch_size=1000,
+    )
+
+
+def index_post(post, using='default'):
+    write_documents([(post.pk, post_document(post))], using=using)
+
+
+def reindex_posts(post_ids, using='default'):
+    from .models import Post
+
+    posts = Post.objects.using(using).filter(pk__in=list(post_ids))
+    for batch in document_batches(posts):
+        write_documents(batch, using=using)
+
+
+def schedule_index(post_ids, using='default'):
+    """Reindex ``post_ids`` once the current transaction commits.
+
+    A post saved, then retagged, then retagged again in one transaction is
+    written to the index once: ids gather in one pending set per connection
+    until its callback runs.
+    """
+    connection = connections[using]
+    pending = connection.__dict__.get('_blog_search_pending')
+    # A rolled-back transaction drops the callback along with its set
+    if pending is not None and any(entry[1] is pending[1] for entry in connection.run_on_commit):
+        pending[0].update(post_ids)
+        return
+    post_ids = set(post_ids)
+
+    def reindex():
+        if connection.__dict__.get('_blog_search_pending', (None,))[0] is post_ids:
+            del connection._blog_search_pending
+        reindex_posts(post_ids, using=using)
+
+    connection._blog_search_pending = (post_ids, reindex)
+    transaction.on_commit(reindex, using=using)
+
+
+def remove_post(post_id, using='default'):
+    # SearchTerm rows go away with the post through the FK cascade
+    if get_backend(using) == 'fts5':
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def search_post_ids(query, limit=None, using='default', queryset=None):
+    """Return up to ``limit`` post ids matching every word of ``query``, best first.
+
+    ``queryset`` restricts the matches inside the index query, so the limit
+    applies to the caller's posts rather than to the whole site's.
+    """
+    tokens = list(dict.fromkeys(t[:MAX_TERM_LENGTH] for t in tokenize(query)))
+    if not tokens:
+        return []
+    limit = MAX_RESULTS if limit is None else limit
+    candidates = None
+    if queryset is not None:
+        candidates = queryset.order_by().values('pk')
+        if candidates.query.is_empty():
+            return []
+
+    if get_backend(using) == 'fts5':
+        # Prefix match on each word, implicitly ANDed; bm25() is lower-is-better
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(float(FIELD_WEIGHTS[f])) for f in FIELDS)
+        restriction, params = '', [match]
+        if candidates is not None:
+            try:
+                sql, candidate_params = candidates.query.get_compiler(using).as_sql()
+            except EmptyResultSet:
+                return []
+            restriction = f' AND rowid IN ({sql})'
+            params.extend(candidate_params)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s{restriction} '
+                f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+                params + [limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    from .models import SearchTerm
+
+    # Prefix match as a range so the term index is used; LIKE 'x%' isn't
+    # indexable on SQLite
+    any_token = Q()
+    matched = {}
+    for i, token in enumerate(tokens):
+        prefix = Q(term__gte=token, term__lt=token + PREFIX_UPPER_BOUND)
+        any_token |= prefix
+        matched[f'matched_{i}'] = Max(Case(When(prefix, then=1), default=0))
+    terms = SearchTerm.objects.using(using).filter(any_token)
+    if candidates is not None:
+        terms = terms.filter(post_id__in=candidates)
+    rows = (
+        terms.values('post_id')
+        .annotate(rank=Sum('weight'), **matched)
+        .filter(**{name: 1 for name in matched})
+        .order_by('-rank', '-post_id')[:limit]
+    )
+    return [row['post_id'] for row in rows]
+
+
+def search_posts(queryset, query):
+    """Restrict ``queryset`` to posts matching ``query``, ordered by relevance.
+
+    The relevance position is exposed as the ``search_rank`` annotation.
+    """
+    post_ids = search_post_ids(query, using=queryset.db, queryset=queryset)
+    if not post_ids:
+        # Still annotated, so callers can order by search_rank
+        return queryset.none().annotate(search_rank=Value(0, output_field=IntegerField()))
+    ranking = Case(
+        *[When(pk=pk, then=Value(position)) for position, pk in enumerate(post_ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=post_ids).annotate(search_rank=ranking).order_by('search_rank')
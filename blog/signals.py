@@ -1,7 +1,13 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Profile
+from django.utils import timezone
+from .models import Profile, Post, Category, Comment, Like, Bookmark, PostScore
+from . import feeds, images, related, search
+from .caching import invalidate_post, invalidate_posts
+
+SEARCH_FIELDS = {'title', 'content', 'category'}
 
 @receiver(post_save, sender=User)
 def handle_user_profile(sender, instance, created, **kwargs):
@@ -9,3 +15,175 @@ def handle_user_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)   # new user registered
     else:
         instance.profile.save()                # user updated, update profile
+
+
+# Keep the search index in step with posts
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, update_fields=None, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    # Counter-only saves such as save(update_fields=['views']) don't touch the index
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    search.schedule_index([instance.pk], using=using)
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, using='default', **kwargs):
+    search.remove_post(instance.pk, using=using)
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def reindex_post_tags(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        search.schedule_index([instance.pk], using=using)
+    elif pk_set:
+        # Tag side of the relation: instance is a Tag, pk_set holds post ids
+        search.schedule_index(pk_set, using=using)
+
+@receiver(post_save, sender=Category)
+def reindex_category_posts(sender, instance, created, raw=False, using='default', **kwargs):
+    if created or raw:
+        return
+    post_ids = Post.objects.using(using).filter(category=instance).values_list('pk', flat=True)
+    search.schedule_index(post_ids, using=using)
+
+
+# Drop cached blog_detail fragments once the change that affects them commits
+
+@receiver([post_save, post_delete], sender=Post)
+def invalidate_post_fragments(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: invalidate_post(post_id), using=kwargs.get('using'))
+
+@receiver([post_save, post_delete], sender=Comment)
+@receiver([post_save, post_delete], sender=Like)
+@receiver([post_save, post_delete], sender=Bookmark)
+def invalidate_engagement_fragments(sender, instance, **kwargs):
+    post_id = instance.post_id
+    transaction.on_commit(lambda: invalidate_post(post_id), using=kwargs.get('using'))
+
+@receiver(pre_save, sender=User)
+def note_renamed_user(sender, instance, update_fields=None, raw=False, using='default', **kwargs):
+    # Logins save last_login alone; only saves that may change the username look it up
+    instance._renamed = False
+    if raw or instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    old = User.objects.using(using).filter(pk=instance.pk).values_list('username', flat=True).first()
+    instance._renamed = old is not None and old != instance.username
+
+@receiver(post_save, sender=User)
+def invalidate_renamed_user_fragments(sender, instance, using='default', **kwargs):
+    # Post bodies show the author's name and comment lists the commenters'
+    if not getattr(instance, '_renamed', False):
+        return
+    post_ids = set(Post.objects.using(using).filter(author=instance).values_list('pk', flat=True))
+    post_ids.update(Comment.objects.using(using).filter(user=instance).values_list('post_id', flat=True))
+    transaction.on_commit(lambda: invalidate_posts(post_ids), using=using)
+
+
+# The API's ETag and Last-Modified come from updated_at, so stamp it when a
+# post's tags, category name or author name change without the post being saved
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def touch_retagged_posts(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    post_ids = pk_set if reverse else [instance.pk]
+    if post_ids:
+        Post.objects.using(using).filter(pk__in=post_ids).update(updated_at=timezone.now())
+
+@receiver(post_save, sender=Category)
+def touch_category_posts(sender, instance, created, raw=False, using='default', **kwargs):
+    if created or raw:
+        return
+    Post.objects.using(using).filter(category=instance).update(updated_at=timezone.now())
+
+@receiver(post_save, sender=User)
+def touch_renamed_author_posts(sender, instance, using='default', **kwargs):
+    if getattr(instance, '_renamed', False):
+        Post.objects.using(using).filter(author=instance).update(updated_at=timezone.now())
+
+
+# Keep trending rows in step with the post's category and status between
+# recomputes; scores themselves only change in blog.trending
+
+@receiver(post_save, sender=Post)
+def sync_trending_row(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if created or raw:
+        return
+    if update_fields is not None and not {'category', 'status'}.intersection(update_fields):
+        return
+    scores = PostScore.objects.filter(post=instance)
+    if instance.status != 'published':
+        scores.delete()
+    else:
+        scores.update(category_id=instance.category_id)
+
+
+# Redo related-post lists when what they are computed from changes; bookmark
+# churn is left to the periodic update_related rebuild
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_related_tags(sender, instance, action, reverse, pk_set, using='default', **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        related.schedule_refresh([instance.pk], using=using)
+    elif pk_set:
+        related.schedule_refresh(pk_set, using=using)
+
+@receiver(post_save, sender=Post)
+def refresh_related_post(sender, instance, created, update_fields=None, raw=False, using='default', **kwargs):
+    # New posts get their tags, and with them their matches, through m2m_changed
+    if created or raw:
+        return
+    if update_fields is not None and not {'category', 'status'}.intersection(update_fields):
+        return
+    related.schedule_refresh([instance.pk], using=using)
+
+
+# Push newly published posts into the feeds of active users who follow
+# their author, category or tags
+
+@receiver(post_save, sender=Post)
+def fan_out_published_post(sender, instance, raw=False, using='default', **kwargs):
+    if raw or not instance.just_published():
+        return
+    feeds.schedule_fan_out(instance.pk, using=using)
+
+
+# Make resized variants of images newly embedded in a post body
+
+@receiver(post_save, sender=Post)
+def queue_content_images(sender, instance, update_fields=None, raw=False, using='default', **kwargs):
+    if raw or not instance.content_changed():
+        return
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    images.queue_images(images.content_images(instance.content), 'content', post_id=instance.pk, using=using)
+
+
+# Release a profile picture in blog.storage once nothing points at it; the
+# same photo may still be referenced by other profiles
+
+@receiver(pre_save, sender=Profile)
+def note_replaced_picture(sender, instance, raw=False, **kwargs):
+    loaded = getattr(instance, '_loaded_pic', None)
+    picture = instance.profile_pic
+    # A re-upload of the same photo saves another reference under the same name
+    replaced = loaded and (picture.name != loaded or not picture._committed)
+    instance._replaced_pic = loaded if replaced and not raw else None
+
+@receiver(post_save, sender=Profile)
+def release_replaced_picture(sender, instance, **kwargs):
+    replaced, instance._replaced_pic = getattr(instance, '_replaced_pic', None), None
+    if replaced:
+        instance.profile_pic.storage.delete(replaced)
+    instance._loaded_pic = instance.profile_pic.name or None
+
+@receiver(post_delete, sender=Profile)
+def release_picture(sender, instance, **kwargs):
+    if instance.profile_pic:
+        instance.profile_pic.storage.delete(instance.profile_pic.name)
@@ -0,0 +1,114 @@
+"""Unique slug allocation shared by Post and Category.
+
+Instead of probing ``slug``, ``slug-1``, ``slug-2``... with one query each,
+the allocator reads the highest numeric suffix already in use from the index
+range of slugs sharing the prefix, without sorting it. Two concurrent saves
+can still pick the same slug, so the insert is retried on IntegrityError
+rather than trusting a pre-check.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.db.models.functions import Length
+from django.utils.text import slugify
+
+# Room kept free at the end of the column for a "-N" suffix
+SUFFIX_RESERVE = 8
+MAX_ATTEMPTS = 5
+CANDIDATE_CHUNK = 20
+# Keeps the OR of range conditions well under SQLite's expression depth limit
+BULK_BASES_PER_QUERY = 100
+
+
+def base_slug(text, max_length, fallback):
+    base = slugify(text)[:max_length - SUFFIX_RESERVE].strip('-')
+    return base or fallback
+
+
+def next_free_slug(model, base, exclude_pk=None, using='default'):
+    """Return ``base`` if unused, else ``base-N`` one past the highest N in use."""
+    # "base-<digits>" rows sit in the index range ["base-0", "base-:"). The
+    # highest N has the most digits, so find the longest slug in the range and
+    # walk down the index from "base-99..9" at that length: nothing is sorted
+    # and the first numeric tail is the answer. Non-numeric tails such as
+    # "base-2nd-edition" are skipped, falling back to the next length down.
+    taken = model._default_manager.db_manager(using).all()
+    if exclude_pk is not None:
+        taken = taken.exclude(pk=exclude_pk)
+    numbered = taken.filter(slug__gte=f'{base}-0', slug__lt=f'{base}-:').annotate(length=Length('slug'))
+
+    longest = numbered.aggregate(longest=Max('length'))['longest']
+    while longest is not None:
+        digits = longest - len(base) - 1
+        walk = (
+            numbered.filter(length=longest, slug__lte=f'{base}-{"9" * digits}')
+            .order_by('-slug').values_list('slug', flat=True)
+        )
+        for slug in walk.iterator(chunk_size=CANDIDATE_CHUNK):
+            number = slug[len(base) + 1:]
+            if number.isascii() and number.isdigit():
+                return f'{base}-{int(number) + 1}'
+        longest = numbered.filter(length__lt=longest).aggregate(longest=Max('length'))['longest']
+    return f'{base}-1' if taken.filter(slug=base).exists() else base
+
+
+def save_with_unique_slug(instance, text, save, *args, **kwargs):
+    """Give ``instance`` a unique slug derived from ``text`` and call ``save``.
+
+    ``save`` is the model's real save method (usually ``super().save``).
+    """
+    model = type(instance)
+    max_length = model._meta.get_field('slug').max_length
+    base = base_slug(text, max_length, fallback=model._meta.model_name)
+    using = kwargs.get('using') or instance._state.db or 'default'
+
+    for attempt in range(MAX_ATTEMPTS):
+        instance.slug = next_free_slug(model, base, exclude_pk=instance.pk, using=using)
+        try:
+            with transaction.atomic(using=using):
+                return save(*args, **kwargs)
+        except IntegrityError:
+            # Only retry when someone else took the slug in the meantime
+            clash = model._default_manager.db_manager(using).filter(slug=instance.slug).exclude(pk=instance.pk)
+            if attempt == MAX_ATTEMPTS - 1 or not clash.exists():
+                instance.slug = ''
+                raise
+
+
+def allocate_slugs(model, texts, fallback=None, using='default'):
+    """Return one unique slug per entry of ``texts`` for rows about to be bulk created.
+
+    Slugs already in the table are read with one range query per group of
+    bases; duplicates within ``texts`` get successive suffixes. Rows inserted
+    concurrently can still clash, so callers retry the insert on IntegrityError.
+    """
+    max_length = model._meta.get_field('slug').max_length
+    fallback = fallback or model._meta.model_name
+    bases = [base_slug(text, max_length, fallback) for text in texts]
+
+    # Highest suffix in use per base; -1 means the bare base is free
+    highest = {base: -1 for base in bases}
+    unique = list(highest)
+    for start in range(0, len(unique), BULK_BASES_PER_QUERY):
+        group = unique[start:start + BULK_BASES_PER_QUERY]
+        taken = Q(slug__in=group)
+        for base in group:
+            taken |= Q(slug__gte=f'{base}-0', slug__lt=f'{base}-:')
+        for slug in model._default_manager.db_manager(using).filter(taken).values_list('slug', flat=True).iterator():
+            base, sep, number = slug.rpartition('-')
+            if slug in highest:
+                highest[slug] = max(highest[slug], 0)
+            if sep and number.isdigit() and base in highest:
+                highest[base] = max(highest[base], int(number))
+
+    slugs = []
+    used = set()
+    for base in bases:
+        # "a" then "a-1" in the same batch would otherwise both get "a-1"
+        while True:
+            suffix = highest[base] = highest[base] + 1
+            slug = f'{base}-{suffix}' if suffix else base
+            if slug not in used:
+                break
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
@@ -0,0 +1,117 @@
+"""Content-addressed media storage.
+
+Uploads are stored under the SHA-256 of their bytes, keeping only the top
+directory they were uploaded to: ``profiles/3f/3fa4...e1.jpg``. The same
+photo uploaded by two authors is written once, and a StoredFile row counts
+the saves that returned its name; delete() drops one reference and removes
+the file with the last one.
+
+Names derived from a stored file, CKEditor's ``<digest>_thumb.jpg``
+thumbnails and the ``variants/3f/<digest>/content-480.webp`` files of
+blog.images, are kept as asked. Either way the bytes behind a name never
+change once written, which is what lets blog.media serve them as immutable.
+When the last stored copy of an image goes, its variants go with it.
+
+Files saved before this backend was configured have no StoredFile row and
+behave as with FileSystemStorage.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import shutil
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .images import VARIANT_DIR
+from .models import ProcessedImage, StoredFile
+
+OBJECT_RE = re.compile(r'^(?:[^/]+/)?([0-9a-f]{2})/(\1[0-9a-f]{62})(?:\.[a-z0-9]+)?$')
+# Thumbnails and variants; get_available_name() suffixes a derived name that
+# is already taken by other bytes with _ and seven characters
+DERIVED_RE = re.compile(
+    r'^(?:(?:[^/]+/)?([0-9a-f]{2})/\1[0-9a-f]{62}_thumb'
+    rf'|{VARIANT_DIR}/([0-9a-f]{{2}})/\2[0-9a-f]{{62}}/(?:avatar|content)-\d+)'
+    r'(?:_[a-zA-Z0-9]{7})?(?:\.[a-z0-9]+)?$'
+)
+
+
+def file_digest(content):
+    sha = hashlib.sha256()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def content_addressed(name):
+    """Whether the bytes behind ``name`` are fixed by a digest in it."""
+    return bool(OBJECT_RE.match(name) or DERIVED_RE.match(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def object_name(self, name, digest):
+        if DERIVED_RE.match(name):
+            return name
+        directory, _, rest = name.partition('/')
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(directory if rest else '', digest[:2], digest + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Names are picked in _save, once the content has been hashed
+        return name
+
+    def _save(self, name, content):
+        digest = file_digest(content)
+        derived = DERIVED_RE.match(name) is not None
+        name = self.object_name(name, digest)
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is not None and stored.digest == digest:
+                if not self.exists(name):
+                    self._write(name, content)
+                StoredFile.objects.filter(pk=stored.pk).update(refs=F('refs') + 1)
+                return name
+            if derived and (stored is not None or self.exists(name)):
+                # A derived name already holding other bytes
+                name = super().get_available_name(name)
+            self._write(name, content)
+            try:
+                with transaction.atomic():
+                    StoredFile.objects.create(name=name, digest=digest, size=content.size, refs=1)
+            except IntegrityError:
+                # Saved concurrently by another process
+                StoredFile.objects.filter(name=name).update(refs=F('refs') + 1)
+        return name
+
+    def _write(self, name, content):
+        # Written aside and renamed into place, so the name never shows a partial file
+        partial = super()._save(f'{name}.{uuid.uuid4().hex}.partial', content)
+        os.replace(self.path(partial), self.path(name))
+
+    def delete(self, name):
+        if not name:
+            raise ValueError('The name must be given to delete().')
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(name=name).first()
+            if stored is not None and stored.refs > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(refs=F('refs') - 1)
+                return
+            if stored is not None:
+                stored.delete()
+                if OBJECT_RE.match(name):
+                    self.release_variants(name, stored.digest)
+            remove = super().delete
+            transaction.on_commit(lambda: remove(name))
+
+    def release_variants(self, name, digest):
+        """Remove the blog.images variants of ``digest`` unless another image still has them."""
+        ProcessedImage.objects.filter(source=name).delete()
+        if StoredFile.objects.filter(digest=digest).exists() or ProcessedImage.objects.filter(digest=digest).exists():
+            return
+        directory = f'{VARIANT_DIR}/{digest[:2]}/{digest}'
+        StoredFile.objects.filter(name__startswith=f'{directory}/').delete()
+        path = self.path(directory)
+        transaction.on_commit(lambda: shutil.rmtree(path, ignore_errors=True))
@@ -0,0 +1,70 @@
+"""Bulk tag and category handling for the post create/edit forms.
+
+Tags typed into ``new_tags`` are resolved with one ``IN`` query, the missing
+ones are created with a single ``bulk_create`` and attached along with the
+tags picked in the form by one ``tags.set()``, so saving a post costs the
+same number of queries whether it has one new tag or twenty.
+"""
+from django.db import IntegrityError, transaction
+
+from .models import Category, Post, Tag
+
+TAG_MAX_LENGTH = Tag._meta.get_field('name').max_length
+
+
+def normalize_tag_names(raw):
+    """Split a comma-separated string into unique, whitespace-collapsed names."""
+    names = []
+    for name in (raw or '').split(','):
+        name = ' '.join(name.split())[:TAG_MAX_LENGTH]
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def resolve_tags(names, user):
+    """Return Tag objects for ``names`` in order, creating missing ones owned by ``user``."""
+    if not names:
+        return []
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [Tag(name=name, user=user) for name in names if name not in tags]
+    if missing:
+        # Upserting tolerates a concurrent request creating the same tag and,
+        # where the backend returns rows from bulk inserts, sets every pk;
+        # elsewhere read back the rows left without one
+        Tag.objects.bulk_create(missing, update_conflicts=True, unique_fields=['name'], update_fields=['name'])
+        tags.update((tag.name, tag) for tag in missing if tag.pk is not None)
+        unsaved = [tag.name for tag in missing if tag.pk is None]
+        if unsaved:
+            tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=unsaved))
+    return [tags[name] for name in names if name in tags]
+
+
+def resolve_category(name, user):
+    name = ' '.join(name.split())
+    category = Category.objects.filter(name=name).first()
+    if category is not None:
+        return category
+    try:
+        with transaction.atomic():
+            return Category.objects.create(name=name, user=user)
+    except IntegrityError:
+        # Lost a race with another request creating the same category
+        return Category.objects.get(name=name)
+
+
+def save_post_form(form, author):
+    """Save a valid PostForm together with its new category and tags."""
+    with transaction.atomic():
+        post = form.save(commit=False)
+        post.author = author
+        new_category = form.cleaned_data.get('new_category')
+        if new_category:
+            post.category = resolve_category(new_category, author)
+        post.save()
+        # One set() for the picked and the new tags, so m2m_changed listeners
+        # (search index, related posts) hear about the change once
+        new_tags = resolve_tags(normalize_tag_names(form.cleaned_data.get('new_tags')), author)
+        form.cleaned_data['tags'] = list({tag.pk: tag for tag in [*form.cleaned_data['tags'], *new_tags]}.values())
+        form.save_m2m()
+    return post
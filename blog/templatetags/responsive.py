@@ -0,0 +1,90 @@
+"""Serve the image variants made by blog.images.
+
+``{% avatar profile.profile_pic 130 %}`` renders an avatar for a 130px slot
+and ``{{ html|responsive_images }}`` rewrites the <img> tags of a post body.
+Both offer WebP with a JPEG/PNG fallback through srcset, so browsers fetch
+the smallest variant that covers the slot at their pixel density. Images
+without variants yet are left as they are.
+"""
+import html
+import re
+
+from django import template
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from ..images import CONTENT_WIDTH, content_images, media_name
+from ..models import ProcessedImage
+
+register = template.Library()
+
+CONTENT_SIZES = f'(max-width: {CONTENT_WIDTH}px) 100vw, {CONTENT_WIDTH}px'
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'''([^\s=/>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s"'>]+))?''')
+
+
+def parse_attrs(tag):
+    attrs = {}
+    for name, value in ATTR_RE.findall(tag[len('<img'):]):
+        if value[:1] in ('"', "'"):
+            value = value[1:-1]
+        attrs[name.lower()] = html.unescape(value)
+    return attrs
+
+
+def srcset(variants):
+    return ', '.join(f'{default_storage.url(variant["name"])} {variant["width"]}w' for variant in variants)
+
+
+def picture(image, attrs, sizes, slot):
+    """<picture> for a ProcessedImage; ``attrs`` end up on the <img>."""
+    webp = [variant for variant in image.variants if variant['format'] == 'webp']
+    fallback = [variant for variant in image.variants if variant['format'] != 'webp']
+    # Browsers without srcset get the smallest fallback that fills the slot
+    src = next((variant for variant in fallback if variant['width'] >= slot), fallback[-1])
+    attrs = {
+        **attrs,
+        'src': default_storage.url(src['name']),
+        'srcset': srcset(fallback),
+        'sizes': sizes,
+    }
+    attrs.setdefault('width', src['width'])
+    attrs.setdefault('height', src['height'])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}"><img{}></picture>',
+        srcset(webp), sizes, flatatt(attrs),
+    )
+
+
+@register.simple_tag
+def avatar(image_field, size, **attrs):
+    if not image_field:
+        return ''
+    attrs = {'alt': '', 'width': size, 'height': size, **attrs}
+    image = ProcessedImage.objects.filter(source=image_field.name).first()
+    if image is None or not image.variants:
+        return format_html('<img src="{}"{}>', image_field.url, flatatt(attrs))
+    return picture(image, attrs, f'{size}px', size)
+
+
+@register.filter(is_safe=True)
+def responsive_images(value):
+    names = content_images(value)
+    if not names:
+        return value
+    images = {image.source: image for image in ProcessedImage.objects.filter(source__in=names) if image.variants}
+    if not images:
+        return value
+
+    def rewrite(match):
+        attrs = parse_attrs(match.group(0))
+        image = images.get(media_name(attrs.get('src', '')))
+        if image is None:
+            return match.group(0)
+        attrs.setdefault('loading', 'lazy')
+        attrs.setdefault('decoding', 'async')
+        return picture(image, attrs, CONTENT_SIZES, CONTENT_WIDTH)
+
+    return mark_safe(IMG_RE.sub(rewrite, value))
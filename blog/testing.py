@@ -0,0 +1,70 @@
+"""Test helpers for keeping SQL query counts in check.
+
+Use QueryBudgetMixin in a TestCase to assert that a block, or a request made
+through the test client, runs no more than a fixed number of queries. Seed
+more rows than a listing page holds so that an N+1 pattern blows the budget:
+
+    class MyTests(QueryBudgetMixin, TestCase):
+        def test_home(self):
+            self.assertViewQueryBudget(self.client.get, '/', budget=4)
+
+        @query_budget(2)
+        def test_lookup(self):
+            ...
+
+BlogTestRunner, the project's TEST_RUNNER, keeps blog.perf's middleware off
+so the suite neither logs repeated queries nor writes perf snapshots; tests
+of the middleware turn it back on with override_settings.
+"""
+import functools
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class QueryBudgetMixin:
+    @contextmanager
+    def assertMaxQueries(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f'{executed} queries executed, budget is {budget}\nCaptured queries were:\n{queries}')
+
+    def assertViewQueryBudget(self, method, url, budget, data=None, **extra):
+        """Make a request with a test client method and check its query count."""
+        with self.assertMaxQueries(budget):
+            response = method(url, data, **extra)
+            if response.streaming:
+                # Streamed bodies run their queries while being consumed
+                response.streaming_content = list(response.streaming_content)
+        self.assertLess(response.status_code, 400, f'{url} returned {response.status_code}')
+        return response
+
+
+def query_budget(budget, using='default'):
+    """Decorate a QueryBudgetMixin test method to cap the queries it runs."""
+    def decorator(test_method):
+        @functools.wraps(test_method)
+        def wrapper(self, *args, **kwargs):
+            with self.assertMaxQueries(budget, using=using):
+                return test_method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class BlogTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._perf_settings = override_settings(BLOG_PERF_ENABLED=False, BLOG_PERF_DIR=None)
+        self._perf_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._perf_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1532 @@
-from django.test import TestCase
+import csv
+import html
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.models.signals import m2m_changed
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import (
+    benchmarks, caching, content, feeds, images, media, perf, related, replicas, search, slugs, storage, taxonomy, transfer,
+    urls,
+)
+from .models import (
+    Bookmark, Category, Comment, Feed, Like, Post, PostScore, ProcessedImage, Profile, RelatedPost, StoredFile, Tag,
+)
+from .counters import ViewCounter, adjust_counts
+from .management.commands import bench_routes
+from .engagement import set_engagement
+from .pagination import COMMENT_ORDERING, POST_ORDERING, decode_cursor, encode_cursor, paginate
+from .trending import decayed, recompute, top_posts
+from .search import search_posts
+from .testing import QueryBudgetMixin
+
+# More rows than a listing page holds, so per-row queries exceed any budget
+ROWS = 30
+
+
+def seed_posts(author, count, prefix='post'):
+    categories = [Category.objects.create(name=f'{prefix}-category-{i}', user=author) for i in range(3)]
+    tags = [Tag.objects.create(name=f'{prefix}-tag-{i}', user=author) for i in range(5)]
+    posts = []
+    for i in range(count):
+        post = Post.objects.create(
+            author=author,
+            title=f'{prefix} {i}',
+            content=f'<p>Body of {prefix} {i}</p>',
+            category=categories[i % len(categories)],
+            status='published',
+        )
+        post.tags.set(tags[i % 3:i % 3 + 3])
+        posts.append(post)
+    # The signals index on commit, which never comes inside a TestCase
+    search.reindex_posts([post.pk for post in posts])
+    return posts
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.other = User.objects.create_user('other')
+
+    def post(self, title, content='<p>Nothing to see</p>', author=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=author or self.author, title=title, content=content, status='published')
+
+    def ids(self, queryset, query):
+        return list(search.search_posts(queryset, query).values_list('pk', flat=True))
+
+    def test_backends_rank_title_above_body_and_match_prefixes(self):
+        for backend in ('fts5', 'terms'):
+            with self.subTest(backend=backend), override_settings(BLOG_SEARCH_BACKEND=backend):
+                body = self.post(f'Notes {backend}', '<p>All about <b>gardening</b> tools</p>')
+                title = self.post(f'Gardening {backend}')
+                unrelated = self.post(f'Cooking {backend}')
+                self.assertEqual(self.ids(Post.objects.filter(title__endswith=backend), 'garden'), [title.pk, body.pk])
+                # Every word has to match
+                self.assertEqual(self.ids(Post.objects.filter(title__endswith=backend), 'garden tools'), [body.pk])
+                self.assertEqual(self.ids(Post.objects.filter(pk=unrelated.pk), 'garden'), [])
+
+    def test_edits_and_rebuild_reindex(self):
+        for backend in ('fts5', 'terms'):
+            with self.subTest(backend=backend), override_settings(BLOG_SEARCH_BACKEND=backend):
+                post = self.post(f'Sailing {backend}')
+                post.title = f'Climbing {backend}'
+                with self.captureOnCommitCallbacks(execute=True):
+                    post.save()
+                posts = Post.objects.filter(pk=post.pk)
+                self.assertEqual(self.ids(posts, 'sailing'), [])
+                self.assertEqual(self.ids(posts, 'climbing'), [post.pk])
+
+                # Rows written behind the signals' back are found after a rebuild
+                Post.objects.filter(pk=post.pk).update(title=f'Rowing {backend}')
+                self.assertEqual(self.ids(posts, 'rowing'), [])
+                call_command('rebuild_search_index', stdout=io.StringIO())
+                self.assertEqual(self.ids(posts, 'rowing'), [post.pk])
+
+                post.delete()
+                self.assertEqual(search.search_post_ids('rowing'), [])
+
+    def test_changes_in_one_transaction_reindex_once(self):
+        tag = Tag.objects.create(name='paddling')
+        with mock.patch.object(search, 'write_documents', wraps=search.write_documents) as write:
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(author=self.author, title='Canoe', content='<p>x</p>', status='published')
+                post.tags.add(tag)
+                post.title = 'Canoe trip'
+                post.save()
+                write.assert_not_called()
+        write.assert_called_once()
+        self.assertEqual(self.ids(Post.objects.all(), 'paddling trip'), [post.pk])
+
+        # Ids gathered in a rolled-back savepoint don't swallow later changes
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            post.tags.remove(tag)
+            raise DatabaseError
+        with self.captureOnCommitCallbacks(execute=True):
+            post.title = 'Kayak trip'
+            post.save()
+        self.assertEqual(self.ids(Post.objects.all(), 'kayak'), [post.pk])
+
+    def test_restriction_applies_before_the_limit(self):
+        for backend in ('fts5', 'terms'):
+            with self.subTest(backend=backend), override_settings(BLOG_SEARCH_BACKEND=backend):
+                # Other authors' posts rank higher and fill the site-wide limit
+                for i in range(4):
+                    self.post(f'Kayak kayak {backend} {i}', '<p>kayak</p>', author=self.other)
+                own = [self.post(f'Trip {backend} {i}', '<p>kayak</p>') for i in range(2)]
+                mine = Post.objects.filter(author=self.author, title__contains=backend)
+                with mock.patch.object(search, 'MAX_RESULTS', 3):
+                    self.assertEqual(set(self.ids(mine, 'kayak')), {post.pk for post in own})
+                    self.assertEqual(self.ids(mine.none(), 'kayak'), [])
+
+
+def tampered_cursors():
+    """Well-formed cursors whose values don't fit a (created_at, id) ordering."""
+    now = timezone.now()
+    return {
+        'strings': encode_cursor(['x', 'y'], 'next'),
+        'string id': encode_cursor([now, 'abc'], 'next'),
+        'integers': encode_cursor([1, 2], 'prev'),
+        'naive datetime': encode_cursor([now.replace(tzinfo=None), 1], 'next'),
+        'boolean id': encode_cursor([now, True], 'next'),
+        'huge id': encode_cursor([now, 2 ** 70], 'next'),
+        'too few values': encode_cursor([now], 'next'),
+        'nested': encode_cursor([[now.isoformat()], {'x': 1}], 'next'),
+    }
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class PaginationTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        seed_posts(self.author, 3, prefix='garden')
+
+    def test_decode_cursor_checks_value_types(self):
+        now = timezone.now()
+        token = encode_cursor([now, 5], 'next')
+        self.assertEqual(decode_cursor(token, Post, POST_ORDERING), ([now, 5], 'next'))
+        self.assertEqual(decode_cursor(encode_cursor([3, 5], 'prev'), Post, ('search_rank', 'id')), ([3, 5], 'prev'))
+        self.assertEqual(decode_cursor(encode_cursor([2.5, 5], 'next'), PostScore, ('-score', '-post_id'))[0], [2.5, 5])
+        for name, token in tampered_cursors().items():
+            with self.subTest(name):
+                self.assertIsNone(decode_cursor(token, Post, POST_ORDERING))
+
+    def test_tampered_cursor_serves_the_first_page(self):
+        for url in (reverse('home'), reverse('blog_list'), reverse('blog_list') + '?q=garden'):
+            for name, token in tampered_cursors().items():
+                with self.subTest(url=url, cursor=name):
+                    response = self.client.get(url, {'cursor': token})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(len(response.context['blogs']), 3)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=3600, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        self.posts = seed_posts(User.objects.create_user('author'), 3)
+        self.counter = ViewCounter()
+
+    def views(self):
+        return [post.views for post in Post.objects.order_by('pk')]
+
+    def test_views_are_buffered_and_flushed_in_batches(self):
+        with mock.patch.object(self.counter, '_ensure_thread'):
+            for post, count in zip(self.posts, (2, 2, 5)):
+                for _ in range(count):
+                    self.counter.record(post.pk)
+        self.assertEqual(self.views(), [0, 0, 0])
+        self.assertEqual(self.counter.pending_for(self.posts[2].pk), 5)
+        self.assertEqual(self.counter.stats()['pending_views'], 9)
+
+        # One UPDATE per distinct increment, inside one transaction
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.counter.flush(), 3)
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 2)
+        self.assertEqual(self.views(), [2, 2, 5])
+        stats = self.counter.stats()
+        self.assertEqual((stats['pending_views'], stats['flushed_views'], stats['flush_lag']), (0, 9, 0.0))
+        self.assertIsNotNone(stats['last_flush'])
+        self.assertEqual(self.counter.flush(), 0)
+
+    def test_failed_flush_requeues_the_batch(self):
+        with mock.patch.object(self.counter, '_ensure_thread'):
+            self.counter.record(self.posts[0].pk, 3)
+        with mock.patch.object(self.counter, '_write', side_effect=DatabaseError('locked')):
+            with self.assertLogs('blog.counters', 'ERROR'):
+                self.assertEqual(self.counter.flush(), 0)
+        self.assertEqual(self.counter.pending_for(self.posts[0].pk), 3)
+        self.assertGreater(self.counter.flush_lag(), 0)
+        self.assertEqual(self.counter.stats()['flushed_views'], 0)
+
+        self.counter.record(self.posts[0].pk)
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(self.views()[0], 4)
+
+    def test_shutdown_stops_the_thread_and_flushes(self):
+        self.counter.record(self.posts[1].pk, 2)
+        thread = self.counter._thread
+        self.assertTrue(thread.is_alive())
+        self.counter.shutdown()
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(self.views()[1], 2)
+
+    @override_settings(BLOG_VIEW_FLUSH_INTERVAL=0)
+    def test_zero_interval_writes_through(self):
+        self.counter.record(self.posts[0].pk)
+        self.assertEqual(self.views()[0], 1)
+        self.assertIsNone(self.counter._thread)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        self.post, = seed_posts(self.author, 1)
+
+    def assertBumps(self, change):
+        before = caching.post_version(self.post.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(caching.post_version(self.post.pk), before)
+
+    def test_changes_bump_the_post_version(self):
+        self.assertBumps(lambda: self.post.save())
+        comment = Comment.objects.create(post=self.post, user=self.reader, content='Hi')
+        self.assertBumps(lambda: Comment.objects.create(post=self.post, user=self.reader, content='Again'))
+        self.assertBumps(comment.delete)
+        self.assertBumps(lambda: Like.objects.create(post=self.post, user=self.reader))
+        self.assertBumps(Like.objects.get().delete)
+        self.assertBumps(lambda: Bookmark.objects.create(post=self.post, user=self.reader))
+        self.assertBumps(Bookmark.objects.get().delete)
+
+    def test_renaming_a_user_drops_fragments_that_show_the_name(self):
+        Comment.objects.create(post=self.post, user=self.reader, content='Hi')
+        detail = reverse('blog_detail', args=[self.post.slug])
+        self.assertContains(self.client.get(detail), 'reader')
+        self.assertContains(self.client.get(detail), 'By author')
+
+        # Logins only save last_login, which no fragment shows
+        version = caching.post_version(self.post.pk)
+        self.reader.last_login = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.save(update_fields=['last_login'])
+        self.assertEqual(caching.post_version(self.post.pk), version)
+
+        for user, name in ((self.reader, 'renamed-reader'), (self.author, 'renamed-author')):
+            user.username = name
+            with self.captureOnCommitCallbacks(execute=True):
+                user.save()
+        response = self.client.get(detail)
+        self.assertContains(response, 'renamed-reader')
+        self.assertContains(response, 'By renamed-author')
+
+    def test_stats_count_hits_and_misses(self):
+        with mock.patch.object(caching, '_stats', Counter()):
+            render = mock.Mock(return_value='<p>body</p>')
+            for _ in range(3):
+                self.assertEqual(caching.cached_fragment(self.post.pk, 'body', render), '<p>body</p>')
+            caching.cached_fragment(self.post.pk, 'comments', lambda: '')
+            caching.invalidate_post(self.post.pk)
+            caching.cached_fragment(self.post.pk, 'body', render)
+            stats = caching.fragment_stats()
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(stats['body'], {'hits': 2, 'misses': 2, 'hit_rate': 0.5})
+        self.assertEqual(stats['comments'], {'hits': 0, 'misses': 1, 'hit_rate': 0.0})
+        self.assertEqual(stats['total'], {'hits': 2, 'misses': 3, 'hit_rate': 0.4})
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class SlugTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+
+    def post(self, slug):
+        return Post.objects.create(author=self.author, title='x', slug=slug, content='x', status='draft')
+
+    def test_next_free_slug_goes_one_past_the_highest_suffix(self):
+        self.assertEqual(slugs.next_free_slug(Post, 'trip'), 'trip')
+        first = self.post('trip')
+        self.assertEqual(slugs.next_free_slug(Post, 'trip'), 'trip-1')
+        self.assertEqual(slugs.next_free_slug(Post, 'trip', exclude_pk=first.pk), 'trip')
+        for slug in ('trip-2', 'trip-10', 'trip-9', 'tripod', 'trips-40'):
+            self.post(slug)
+        # Longest length, then a walk down the index that stops at "trip-10"
+        with self.assertNumQueries(2):
+            self.assertEqual(slugs.next_free_slug(Post, 'trip'), 'trip-11')
+        # Longer non-numeric tails are passed over
+        self.post('trip-2nd-edition')
+        self.post('trip-99-notes')
+        self.assertEqual(slugs.next_free_slug(Post, 'trip'), 'trip-11')
+        # Numbered slugs without the bare one still continue the numbering
+        Post.objects.filter(slug='trip').delete()
+        self.assertEqual(slugs.next_free_slug(Post, 'trip'), 'trip-11')
+
+    def test_save_retries_when_the_slug_is_taken_meanwhile(self):
+        self.post('race')
+        real = slugs.next_free_slug
+        picks = iter(['race'])  # what a concurrent save would have seen
+
+        def stale_then_real(*args, **kwargs):
+            return next(picks, None) or real(*args, **kwargs)
+
+        with mock.patch.object(slugs, 'next_free_slug', side_effect=stale_then_real) as allocator:
+            post = Post.objects.create(author=self.author, title='Race', content='x', status='draft')
+        self.assertEqual(post.slug, 'race-1')
+        self.assertEqual(allocator.call_count, 2)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        Category.objects.create(name='Travel')
+        category = Category(name='Travel')
+        with mock.patch.object(slugs, 'next_free_slug', wraps=slugs.next_free_slug) as allocator:
+            with self.assertRaises(IntegrityError):
+                category.save()
+        self.assertEqual(allocator.call_count, 1)
+        self.assertEqual(category.slug, '')
+
+    def test_allocate_slugs_numbers_duplicates_in_a_batch(self):
+        self.post('news')
+        self.post('news-4')
+        self.assertEqual(
+            slugs.allocate_slugs(Post, ['News', 'news', 'Other', '']),
+            ['news-5', 'news-6', 'other', 'post'],
+        )
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class ContentStatsTests(TestCase):
+    def test_words_split_by_inline_tags_count_once(self):
+        stats = content.analyze_html(
+            '<p>Hel<b>lo</b> wor<i>ld</i>!</p><p>next</p>para<br>line'
+            '<script>var skipped = 1;</script><style>p { color: red }</style>'
+        )
+        self.assertEqual(stats.word_count, 5)
+        self.assertEqual(stats.excerpt, 'Hello world! next para line')
+        self.assertEqual(stats.read_time, 1)
+
+    def test_words_cut_by_a_chunk_boundary_count_once(self):
+        body = '<p>' + 'x' * (content.CHUNK_SIZE - 3) + 'yz tail</p>'
+        self.assertEqual(content.analyze_html(body).word_count, 2)
+
+    def test_excerpt_stops_at_a_word_boundary(self):
+        stats = content.analyze_html('<p>' + 'lorem ipsum ' * 20 + '</p>', excerpt_length=30)
+        self.assertEqual(stats.word_count, 40)
+        self.assertEqual(stats.excerpt, 'lorem ipsum lorem ipsum lorem…')
+        self.assertLessEqual(len(stats.excerpt), 30)
+        self.assertEqual(content.analyze_html('<p>' + 'x' * 50 + '</p>', excerpt_length=30).excerpt, 'x' * 29 + '…')
+        # Short bodies are kept whole, without an ellipsis
+        self.assertEqual(content.analyze_html('<p>lorem ipsum</p>', excerpt_length=30).excerpt, 'lorem ipsum')
+
+    def test_migration_backfills_existing_posts(self):
+        author = User.objects.create_user('author')
+        body = '<p>Hel<b>lo</b> world</p>' + '<p>word</p>' * 200
+        post = Post.objects.create(author=author, title='Old', content=body, status='draft')
+        Post.objects.filter(pk=post.pk).update(word_count=0, read_time=None, excerpt='')
+
+        migration = importlib.import_module('blog.migrations.0009_post_content_stats')
+        migration.backfill_content_stats(django_apps, connection.schema_editor())
+        post.refresh_from_db()
+        stats = content.analyze_html(body)
+        self.assertEqual((post.word_count, post.read_time, post.excerpt), (stats.word_count, stats.read_time, stats.excerpt))
+        self.assertEqual(post.word_count, 202)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    # Maximum queries per request for every route in blog/urls.py. Adding a
+    # route without a budget fails test_every_route_has_a_budget.
+    BUDGETS = {
+        'home': 6,
+        'blog_list': 8,
+        'blog_detail': 13,
+        'create_blog': 4,
+        'update_blog': 6,
+        'delete_blog': 13,
+        'register': 0,
+        'login': 0,
+        'logout': 4,
+        'view_profile': 3,
+        'edit_profile': 3,
+        'change_password': 2,
+        'user_posts': 6,
+        'user_dashboard': 6,
+        'export_dashboard': 3,
+        'like_post': 11,
+        'add_bookmark': 11,
+        'saved_posts': 4,
+        'api_post_list': 3,
+        'api_post_detail': 3,
+        'api_like_post': 11,
+        'api_bookmark_post': 11,
+        'comment_page': 2,
+        'trending': 3,
+        'feed': 7,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass12345')
+        cls.readers = [User.objects.create_user(f'reader{i}', password='pass12345') for i in range(ROWS)]
+        cls.posts = seed_posts(cls.author, ROWS)
+        cls.post = cls.posts[0]
+        cls.doomed = Post.objects.create(author=cls.author, title='Doomed', content='<p>x</p>', status='draft')
+        for reader in cls.readers:
+            Comment.objects.create(post=cls.post, user=reader, content='Nice post')
+            Like.objects.create(post=cls.post, user=reader)
+        for post in cls.posts:
+            Bookmark.objects.create(post=post, user=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        recompute(full=True)
+        related.build()
+        feeds.build_feed(self.author)
+
+    def requests(self):
+        """(route name, client method name, url, data) for every route."""
+        post, doomed = self.post, self.doomed
+        return [
+            ('home', 'get', reverse('home'), None),
+            ('blog_list', 'get', reverse('blog_list'), None),
+            ('trending', 'get', reverse('trending'), None),
+            ('feed', 'get', reverse('feed'), None),
+            ('blog_detail', 'get', reverse('blog_detail', args=[post.slug]), None),
+            ('comment_page', 'get', reverse('comment_page', args=[post.slug]), {'cursor': self.comment_cursor()}),
+            ('create_blog', 'get', reverse('create_blog'), None),
+            ('update_blog', 'get', reverse('update_blog', args=[post.pk]), None),
+            ('delete_blog', 'get', reverse('delete_blog', args=[doomed.pk]), None),
+            ('register', 'get', reverse('register'), None),
+            ('login', 'get', reverse('login'), None),
+            ('logout', 'get', reverse('logout'), None),
+            ('view_profile', 'get', reverse('view_profile'), None),
+            ('edit_profile', 'get', reverse('edit_profile'), None),
+            ('change_password', 'get', reverse('change_password'), None),
+            ('user_posts', 'get', reverse('user_posts'), None),
+            ('user_dashboard', 'get', reverse('user_dashboard'), None),
+            ('export_dashboard', 'get', reverse('export_dashboard'), None),
+            ('like_post', 'get', reverse('like_post', args=[post.pk]), None),
+            ('add_bookmark', 'get', reverse('add_bookmark', args=[post.pk]), None),
+            ('saved_posts', 'get', reverse('saved_posts'), None),
+            ('api_post_list', 'get', reverse('api_post_list'), None),
+            ('api_post_detail', 'get', reverse('api_post_detail', args=[post.slug]), None),
+            ('api_like_post', 'post', reverse('api_like_post', args=[post.pk]), None),
+            ('api_bookmark_post', 'post', reverse('api_bookmark_post', args=[post.pk]), None),
+        ]
+
+    def comment_cursor(self):
+        return paginate(self.post.comments.all(), ordering=COMMENT_ORDERING).next_cursor
+
+    def test_every_route_has_a_budget(self):
+        routes = {pattern.name for pattern in urls.urlpatterns}
+        self.assertEqual(routes, set(self.BUDGETS))
+        self.assertEqual(routes, {name for name, *_ in self.requests()})
+
+    def test_route_query_budgets(self):
+        for name, method, url, data in self.requests():
+            with self.subTest(route=name):
+                client = Client()
+                if name not in ('register', 'login'):
+                    client.force_login(self.author)
+                self.assertViewQueryBudget(getattr(client, method), url, self.BUDGETS[name], data)
+
+    def test_search_query_budget(self):
+        self.client.force_login(self.author)
+        self.assertViewQueryBudget(self.client.get, reverse('blog_list'), 9, {'q': 'post'})
+        self.assertViewQueryBudget(self.client.get, reverse('user_posts'), 7, {'q': 'post'})
+
+    def test_second_page_costs_the_same(self):
+        self.client.force_login(self.author)
+        first = self.assertViewQueryBudget(self.client.get, reverse('home'), self.BUDGETS['home'])
+        cursor = first.context['blogs'].next_cursor
+        self.assertViewQueryBudget(self.client.get, reverse('home'), self.BUDGETS['home'], {'cursor': cursor})
+
+    def test_feed_pages_come_from_the_precomputed_list(self):
+        # reader0 liked self.post, so the author's other posts make the feed
+        reader = self.readers[0]
+        feeds.build_feed(reader)
+        self.client.force_login(reader)
+        first = self.assertViewQueryBudget(self.client.get, reverse('feed'), self.BUDGETS['feed'])
+        page = first.context['blogs']
+        self.assertEqual(len(page), 20)
+        self.assertNotIn(self.post, page.items)
+        self.assertTrue(all(post.is_liked is False for post in page))
+        second = self.assertViewQueryBudget(
+            self.client.get, reverse('feed'), self.BUDGETS['feed'], {'cursor': page.next_cursor}
+        )
+        self.assertEqual(len(second.context['blogs']), ROWS - 21)
+        self.assertFalse(second.context['blogs'].has_next)
+
+    def test_listings_show_user_state_at_constant_cost(self):
+        self.client.force_login(self.author)
+        before = self.assertViewQueryBudget(self.client.get, reverse('home'), self.BUDGETS['home'])
+        self.assertFalse(any(blog.is_liked for blog in before.context['blogs']))
+        Like.objects.bulk_create([Like(post=post, user=self.author) for post in self.posts])
+        after = self.assertViewQueryBudget(self.client.get, reverse('home'), self.BUDGETS['home'])
+        states = {blog.pk: (blog.is_liked, blog.is_bookmarked) for blog in after.context['blogs']}
+        self.assertEqual(states.pop(self.doomed.pk), (False, False))
+        self.assertEqual(set(states.values()), {(True, True)})
+        self.assertContains(after, 'Liked')
+
+    @override_settings(BLOG_COMMENT_PAGE_SIZE=12)
+    def test_comments_load_by_page(self):
+        url = reverse('blog_detail', args=[self.post.slug])
+        body = self.assertViewQueryBudget(self.client.get, url, self.BUDGETS['blog_detail']).content.decode()
+        pages = [body.count('Nice post')]
+        while 'data-load-more' in body:
+            href = html.unescape(re.search(r'href="([^"]+)" data-load-more', body).group(1))
+            body = self.assertViewQueryBudget(self.client.get, href, self.BUDGETS['comment_page']).content.decode()
+            pages.append(body.count('Nice post'))
+        self.assertEqual(pages, [12, 12, 6])
+        self.assertEqual(self.client.get(reverse('comment_page', args=[self.post.slug])).status_code, 400)
+
+    def test_dashboard_export_streams_engagement_counts(self):
+        # The seed rows skip the views that maintain the counters
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('export_dashboard'), {'format': 'json'})
+        self.assertTrue(response.streaming)
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), ROWS + 1)
+        row = next(row for row in rows if row['id'] == self.post.pk)
+        self.assertEqual((row['like_count'], row['comment_count'], row['bookmark_count']), (ROWS, ROWS, 1))
+
+        response = self.client.get(reverse('export_dashboard'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), transfer.STATS_FIELDS)
+        self.assertEqual(len(lines), ROWS + 2)
+
+    def test_api_conditional_get(self):
+        newest = self.posts[-1]
+        for url in (reverse('api_post_list'), reverse('api_post_detail', args=[newest.slug])):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                with self.assertMaxQueries(1):
+                    unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(unchanged.status_code, 304)
+                self.assertEqual(unchanged.content, b'')
+
+                adjust_counts(newest.pk, like_count=1)
+                changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                self.assertEqual(changed.status_code, 200)
+                self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_api_notices_renames_and_retagging(self):
+        newest = self.posts[-1]
+        newest.category = Category.objects.create(name='Before', user=self.author)
+        newest.save()
+        author = newest.author
+
+        def rename_category():
+            newest.category.name += '!'
+            newest.category.save()
+
+        def rename_author():
+            author.username += '!'
+            author.save()
+
+        def retag():
+            newest.tags.add(Tag.objects.create(name=f'retag-{Tag.objects.count()}', user=author))
+
+        for url in (reverse('api_post_list'), reverse('api_post_detail', args=[newest.slug])):
+            for change in (rename_category, rename_author, retag):
+                with self.subTest(url=url, change=change.__name__):
+                    first = self.client.get(url)
+                    change()
+                    changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+                    self.assertEqual(changed.status_code, 200)
+                    self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_api_list_notices_removed_posts(self):
+        url = reverse('api_post_list')
+        newest = self.posts[-1]
+        first = self.client.get(url)
+        # Dates can't show a post leaving the page, so the list only has an ETag
+        self.assertFalse(first.has_header('Last-Modified'))
+        self.assertTrue(self.client.get(reverse('api_post_detail', args=[newest.slug])).has_header('Last-Modified'))
+
+        Post.objects.filter(pk=newest.pk).update(status='draft')
+        later = http_date(timezone.now().timestamp() + 60)
+        for headers in ({'HTTP_IF_NONE_MATCH': first['ETag']}, {'HTTP_IF_MODIFIED_SINCE': later}):
+            with self.subTest(headers=list(headers)):
+                response = self.client.get(url, **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(newest.slug, {row['slug'] for row in response.json()['results']})
+
+    def test_api_list_ignores_tampered_cursors(self):
+        url = reverse('api_post_list')
+        first_page = self.client.get(url, {'fields': 'slug'}).json()
+        for name, token in tampered_cursors().items():
+            with self.subTest(name):
+                response = self.client.get(url, {'fields': 'slug', 'cursor': token})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['results'], first_page['results'])
+
+    def test_api_sparse_fields_and_cursor(self):
+        url = reverse('api_post_list')
+        data = self.client.get(url, {'fields': 'slug,tags', 'page_size': 10}).json()
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(set(data['results'][0]), {'slug', 'tags'})
+        following = self.client.get(data['next']).json()
+        self.assertEqual(set(following['results'][0]), {'slug', 'tags'})
+        self.assertNotIn(
+            following['results'][0]['slug'], {row['slug'] for row in data['results']}
+        )
+        self.assertEqual(self.client.get(url, {'fields': 'slug,password'}).status_code, 400)
+        # Drafts aren't exposed
+        self.assertEqual(self.client.get(reverse('api_post_detail', args=[self.doomed.slug])).status_code, 404)
+
+    def create_post_queries(self, slug, tag_count):
+        self.client.force_login(self.author)
+        data = {
+            'title': slug,
+            'slug': slug,
+            'content': '<p>Tagged</p>',
+            'status': 'published',
+            'new_category': f'{slug}-category',
+            'new_tags': ', '.join(f'{slug}-tag-{i}' for i in range(tag_count)),
+        }
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(reverse('create_blog'), data)
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get(slug=slug)
+        self.assertEqual(post.tags.count(), tag_count)
+        self.assertEqual(post.category.name, f'{slug}-category')
+        return len(context)
+
+    def test_post_save_queries_do_not_grow_with_tags(self):
+        self.assertEqual(self.create_post_queries('few', 2), self.create_post_queries('many', 20))
+
+    def test_post_save_notifies_tag_listeners_once(self):
+        picked = Tag.objects.create(name='picked', user=self.author)
+        changes = []
+
+        def listener(action, pk_set, **kwargs):
+            changes.append((action, pk_set))
+        m2m_changed.connect(listener, sender=Post.tags.through)
+        self.addCleanup(m2m_changed.disconnect, listener, sender=Post.tags.through)
+        self.client.force_login(self.author)
+        self.client.post(reverse('create_blog'), {
+            'title': 'Once', 'slug': 'once', 'content': '<p>Once</p>', 'status': 'published',
+            'tags': [picked.pk], 'new_tags': 'picked, fresh',
+        })
+        fresh = Tag.objects.get(name='fresh')
+        self.assertEqual(changes, [('pre_add', {picked.pk, fresh.pk}), ('post_add', {picked.pk, fresh.pk})])
+
+    def test_resolve_tags_does_not_read_back_new_tags(self):
+        Tag.objects.create(name='old', user=self.author)
+        with self.assertNumQueries(2):
+            tags = taxonomy.resolve_tags(['old', 'new-1', 'new-2'], self.author)
+        self.assertEqual([tag.name for tag in tags], ['old', 'new-1', 'new-2'])
+        self.assertEqual([tag.pk for tag in tags], list(Tag.objects.filter(
+            name__in=['old', 'new-1', 'new-2']).order_by('pk').values_list('pk', flat=True)))
+
+    def test_listings_do_not_load_post_bodies(self):
+        self.client.force_login(self.author)
+        for name in ('home', 'blog_list', 'user_dashboard', 'user_posts', 'saved_posts'):
+            with self.subTest(route=name), CaptureQueriesContext(connection) as context:
+                self.client.get(reverse(name))
+                for query in context.captured_queries:
+                    self.assertNotIn('"blog_post"."content"', query['sql'])
+
+    def test_detail_lists_related_posts(self):
+        body = self.client.get(reverse('blog_detail', args=[self.post.slug])).content.decode()
+        for link in related.related_posts(self.post):
+            self.assertIn(reverse('blog_detail', args=[link.related.slug]), body)
+        self.assertTrue(RelatedPost.objects.filter(post=self.post).exists())
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0, BLOG_COMMENT_PAGE_SIZE=2)
+class AsyncViewTests(TestCase):
+    """The async views served through AsyncClient, as under ASGI."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author')
+        cls.reader = User.objects.create_user('reader')
+        cls.post = Post.objects.create(author=cls.author, title='Async', content='<p>Served async</p>', status='published')
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_detail_get_renders_and_counts_one_view_per_session(self):
+        url = reverse('blog_detail', args=[self.post.slug])
+        response = await self.async_client.get(url)
+        self.assertContains(response, 'Served async')
+        self.assertFalse(response.context['is_liked'])
+        await self.async_client.get(url)
+        await self.post.arefresh_from_db(fields=['views'])
+        self.assertEqual(self.post.views, 1)
+
+    async def test_detail_post_adds_a_comment(self):
+        url = reverse('blog_detail', args=[self.post.slug])
+        anonymous = await self.async_client.post(url, {'content': 'Hello'})
+        self.assertRedirects(anonymous, reverse('login'), fetch_redirect_response=False)
+
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.post(url, {'content': 'First!'})
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        await self.post.arefresh_from_db(fields=['comment_count'])
+        self.assertEqual(self.post.comment_count, 1)
+        self.assertContains(await self.async_client.get(url), 'First!')
+
+    async def test_comment_page(self):
+        for i in range(3):
+            await Comment.objects.acreate(post=self.post, user=self.reader, content=f'Comment {i}')
+        first = await sync_to_async(paginate)(self.post.comments.all(), page_size=2, ordering=COMMENT_ORDERING)
+        url = reverse('comment_page', args=[self.post.slug])
+        response = await self.async_client.get(url, {'cursor': first.next_cursor})
+        self.assertContains(response, 'Comment 0')
+        self.assertNotContains(response, 'Comment 2')
+        self.assertEqual((await self.async_client.get(url)).status_code, 400)
+
+    async def test_dashboard_export_streams_without_buffering(self):
+        for i in range(5):
+            await Post.objects.acreate(author=self.author, title=f'Row {i}', content='<p>x</p>', status='draft')
+        await self.async_client.aforce_login(self.author)
+        for format, parse in (('json', json.loads), ('csv', lambda body: list(csv.DictReader(io.StringIO(body))))):
+            with self.subTest(format):
+                response = await self.async_client.get(reverse('export_dashboard'), {'format': format})
+                # A sync iterator would be read whole before the first chunk went out
+                self.assertTrue(response.is_async)
+                rows = parse(b''.join([chunk async for chunk in response.streaming_content]).decode())
+                self.assertEqual(len(rows), 6)
+                self.assertEqual([row['title'] for row in rows[:2]], ['Row 4', 'Row 3'])
+
+    async def test_comment_page_rejects_tampered_cursors(self):
+        url = reverse('comment_page', args=[self.post.slug])
+        for name, token in tampered_cursors().items():
+            with self.subTest(name):
+                response = await self.async_client.get(url, {'cursor': token})
+                self.assertEqual(response.status_code, 400)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class TransferTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+
+    def export(self, format):
+        stream = io.StringIO()
+        write = transfer.write_csv if format == 'csv' else transfer.write_jsonl
+        write(transfer.export_records(Post.objects.all()), stream)
+        stream.seek(0)
+        return stream
+
+    def test_round_trip_duplicates_posts_with_fresh_slugs(self):
+        posts = seed_posts(self.author, 3)
+        Comment.objects.create(post=posts[0], user=self.reader, content='Nice')
+        for format in ('jsonl', 'csv'):
+            with self.subTest(format=format):
+                stream = self.export(format)
+                before = Post.objects.count()
+                result = transfer.import_posts(transfer.read_records(stream, format), batch_size=2)
+                self.assertEqual((result.posts, result.errors), (before, []))
+                copy = Post.objects.filter(title=posts[0].title).latest('pk')
+                self.assertNotEqual(copy.slug, posts[0].slug)
+                self.assertEqual(copy.created_at, posts[0].created_at)
+                self.assertEqual(copy.category, posts[0].category)
+                self.assertEqual(set(copy.tags.all()), set(posts[0].tags.all()))
+                self.assertEqual(copy.word_count, posts[0].word_count)
+                # CSV has no comments column
+                self.assertEqual(copy.comments.count(), copy.comment_count)
+                self.assertEqual(copy.comment_count, int(format == 'jsonl'))
+        self.assertEqual(Post.objects.count(), 12)
+
+    def test_import_skips_invalid_records_and_indexes_the_rest(self):
+        lines = [
+            '{"title": "Bulk one", "content": "<p>quokka</p>", "author": "author", "tags": ["x", "y"]}',
+            'not json',
+            '{"title": "", "author": "author"}',
+            '{"title": "Nobody", "author": "ghost"}',
+            '{"title": "Bulk one", "content": "<p>two</p>", "author": "author", "category": "New"}',
+        ]
+        result = transfer.import_posts(transfer.read_records(io.StringIO('\n'.join(lines)), 'jsonl'))
+        self.assertEqual(result.posts, 2)
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4])
+        self.assertEqual(sorted(Post.objects.values_list('slug', flat=True)), ['bulk-one', 'bulk-one-1'])
+        self.assertEqual(Category.objects.get(name='New').slug, 'new')
+        self.assertEqual([post.slug for post in search_posts(Post.objects.all(), 'quokka')], ['bulk-one'])
+
+    def test_import_rejects_non_string_usernames_per_record(self):
+        lines = [
+            '{"title": "Listed", "author": ["author"]}',
+            '{"title": "Mapped", "author": "author", "comments": [{"user": {"name": "author"}, "content": "Hi"}]}',
+            '{"title": "Kept", "author": "author", "comments": [{"user": "author", "content": "Hi"}]}',
+            '{"title": "Loose", "author": "author", "comments": ["Hi"]}',
+        ]
+        result = transfer.import_posts(transfer.read_records(io.StringIO('\n'.join(lines)), 'jsonl'))
+        self.assertEqual((result.posts, result.comments), (1, 1))
+        self.assertEqual(result.errors, [
+            (1, 'author must be a username, not list'),
+            (2, 'comment user must be a username, not dict'),
+            (4, 'comment must be an object, not str'),
+        ])
+        self.assertEqual(Post.objects.get(title='Kept').comment_count, 1)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class EngagementToggleTests(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 5
+
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.users = [User.objects.create_user(f'clicker{i}') for i in range(self.THREADS)]
+        self.post = Post.objects.create(author=self.author, title='Hot', content='<p>x</p>', status='published')
+
+    def test_set_is_idempotent(self):
+        user = self.users[0]
+        self.assertEqual(set_engagement('like', self.post.pk, user, True), (True, 1))
+        self.assertEqual(set_engagement('like', self.post.pk, user, True), (True, 1))
+        self.assertEqual(set_engagement('like', self.post.pk, user), (False, 0))
+        self.assertEqual(set_engagement('like', self.post.pk, user, False), (False, 0))
+
+    def test_json_toggle(self):
+        client = Client()
+        url = reverse('api_like_post', args=[self.post.pk])
+        self.assertEqual(client.post(url).status_code, 401)
+        client.force_login(self.users[0])
+        self.assertEqual(client.post(url).json(), {'post': self.post.pk, 'like': True, 'count': 1})
+        self.assertEqual(client.post(url, {'state': 'on'}).json()['count'], 1)
+        self.assertEqual(client.post(url).json(), {'post': self.post.pk, 'like': False, 'count': 0})
+        self.assertEqual(client.get(url).status_code, 405)
+
+    def test_concurrent_toggles_keep_counts_consistent(self):
+        barrier = threading.Barrier(self.THREADS * 2)
+        errors = []
+
+        def hammer(user, state):
+            try:
+                barrier.wait()
+                for _ in range(self.ROUNDS):
+                    set_engagement('like', self.post.pk, user, state)
+                    set_engagement('bookmark', self.post.pk, user)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        # Two threads per user: one toggling, one insisting on "liked"
+        threads = [
+            threading.Thread(target=hammer, args=(user, state))
+            for user in self.users for state in (None, True)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, Like.objects.filter(post=self.post).count())
+        self.assertEqual(self.post.bookmark_count, Bookmark.objects.filter(post=self.post).count())
+        # Each user toggled the bookmark an even number of times
+        self.assertEqual(self.post.bookmark_count, 0)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class TrendingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(10)]
+        self.old, self.fresh, self.quiet = seed_posts(self.author, 3)
+        self.now = timezone.now()
+
+    def like(self, post, readers, age):
+        likes = Like.objects.bulk_create([Like(post=post, user=reader) for reader in readers])
+        Like.objects.filter(pk__in=[like.pk for like in likes]).update(created_at=self.now - age)
+
+    def test_recent_engagement_outranks_older_engagement(self):
+        self.like(self.old, self.readers, timedelta(days=5))
+        self.like(self.fresh, self.readers[:3], timedelta(hours=1))
+        recompute(full=True, now=self.now)
+        self.assertEqual(top_posts(), [self.fresh, self.old])
+        # 10 likes five half-lives ago weigh 10 * 4 / 32
+        self.assertAlmostEqual(decayed(PostScore.objects.get(pk=self.old.pk).score, self.now), 1.25, delta=0.05)
+        self.assertEqual(top_posts(category_id=self.old.category_id), [self.old])
+
+    def test_incremental_runs_match_a_full_rebuild(self):
+        self.like(self.old, self.readers[:5], timedelta(hours=30))
+        recompute(full=True, now=self.now - timedelta(hours=2))
+        self.like(self.old, self.readers[5:], timedelta(hours=1))
+        self.like(self.fresh, self.readers[:2], timedelta(minutes=30))
+        run = recompute(now=self.now)
+        self.assertFalse(run.full)
+        self.assertEqual(run.posts, 2)
+        incremental = dict(PostScore.objects.values_list('post_id', 'score'))
+        recompute(full=True, now=self.now)
+        for post_id, score in PostScore.objects.values_list('post_id', 'score'):
+            self.assertAlmostEqual(incremental[post_id], score)
+
+    def test_unpublished_posts_leave_the_ranking(self):
+        self.like(self.old, self.readers, timedelta(hours=1))
+        recompute(full=True, now=self.now)
+        self.old.status = 'draft'
+        self.old.save()
+        self.assertEqual(top_posts(), [])
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class RelatedPostTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.readers = [User.objects.create_user(f'reader{i}') for i in range(4)]
+        self.category = Category.objects.create(name='Python')
+        self.tags = {name: Tag.objects.create(name=name) for name in ('django', 'orm', 'async', 'css', 'cooking')}
+        self.posts = {}
+        for title, tags in (
+            ('queries', ['django', 'orm']),
+            ('migrations', ['django', 'orm']),
+            ('views', ['django', 'async']),
+            ('layout', ['css']),
+            ('bread', ['cooking']),
+        ):
+            post = Post.objects.create(author=self.author, title=title, content='<p>x</p>', status='published')
+            post.tags.set([self.tags[name] for name in tags])
+            self.posts[title] = post
+
+    def matches(self, title):
+        return [link.related.title for link in related.related_posts(self.posts[title])]
+
+    def lists(self):
+        return {
+            (post_id, related_id): score
+            for post_id, related_id, score in RelatedPost.objects.values_list('post_id', 'related_id', 'score')
+        }
+
+    def test_shared_tags_readers_and_category_rank_matches(self):
+        related.build(engine='python')
+        self.assertEqual(self.matches('queries'), ['migrations', 'views'])
+        self.assertEqual(self.matches('bread'), [])
+        # Same tags: a shared category breaks the tie
+        self.posts['views'].tags.set([self.tags['django'], self.tags['orm']])
+        Post.objects.filter(pk__in=[self.posts['queries'].pk, self.posts['views'].pk]).update(category=self.category)
+        related.build(engine='python')
+        self.assertEqual(self.matches('queries'), ['views', 'migrations'])
+        # A common reader relates posts without a tag in common
+        Bookmark.objects.create(post=self.posts['layout'], user=self.readers[0])
+        Bookmark.objects.create(post=self.posts['bread'], user=self.readers[0])
+        related.build(engine='python')
+        self.assertEqual(self.matches('bread'), ['layout'])
+
+    @skipIf(related.sparse is None, 'scipy is not installed')
+    def test_engines_agree(self):
+        Bookmark.objects.create(post=self.posts['layout'], user=self.readers[1])
+        Bookmark.objects.create(post=self.posts['views'], user=self.readers[1])
+        related.build(engine='python')
+        expected = self.lists()
+        related.build(engine='scipy')
+        actual = self.lists()
+        self.assertEqual(set(actual), set(expected))
+        for pair, score in expected.items():
+            self.assertAlmostEqual(actual[pair], score)
+
+    def test_tag_changes_refresh_both_sides(self):
+        related.build()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts['bread'].tags.add(self.tags['orm'])
+        self.assertIn('bread', self.matches('queries'))
+        self.assertIn('queries', self.matches('bread'))
+        refreshed = self.lists()
+        related.build()
+        self.assertEqual(set(refreshed), set(self.lists()))
+
+    def test_refresh_runs_in_its_own_worker_pool(self):
+        with mock.patch.object(images.image_workers, 'submit') as image_submit, \
+                mock.patch.object(related.related_workers, 'submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.posts['bread'].tags.add(self.tags['orm'])
+        # The committing request only hands the posts over
+        submit.assert_called_once_with(related.refresh, {self.posts['bread'].pk})
+        image_submit.assert_not_called()
+
+    def test_unpublished_posts_leave_related_lists(self):
+        related.build()
+        self.posts['migrations'].status = 'draft'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.posts['migrations'].save()
+        self.assertEqual(self.matches('queries'), ['views'])
+        self.assertFalse(RelatedPost.objects.filter(post=self.posts['migrations']).exists())
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class FeedTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        self.lapsed = User.objects.create_user('lapsed')
+        self.posts = seed_posts(self.author, 3)
+        self.now = timezone.now()
+        for user in (self.reader, self.lapsed):
+            Like.objects.create(post=self.posts[0], user=user)
+        feeds.build_feed(self.reader, now=self.now)
+        feeds.build_feed(self.lapsed, now=self.now - feeds.FEED_ACTIVE_FOR - timedelta(days=1))
+
+    def entries(self, user):
+        return list(feeds.unpack(Feed.objects.get(user=user).entries))
+
+    def publish(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(author=self.author, title='Fresh', content='<p>x</p>', **fields)
+
+    def test_feed_holds_matching_posts_newest_first(self):
+        self.assertEqual(self.entries(self.reader), [self.posts[2].pk, self.posts[1].pk])
+
+    def test_publishing_pushes_into_active_feeds_only(self):
+        post = self.publish(status='published')
+        self.assertEqual(self.entries(self.reader)[0], post.pk)
+        self.assertNotIn(post.pk, self.entries(self.lapsed))
+        # A lapsed user catches up when they come back
+        self.assertIn(post.pk, feeds.unpack(feeds.get_feed(self.lapsed).entries))
+
+    def test_drafts_are_pushed_when_published(self):
+        draft = self.publish(status='draft')
+        self.assertNotIn(draft.pk, self.entries(self.reader))
+        draft.status = 'published'
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.save()
+        self.assertEqual(self.entries(self.reader)[0], draft.pk)
+        # Saving it again doesn't push it again
+        with mock.patch.object(feeds, 'schedule_fan_out') as schedule:
+            draft.save()
+        schedule.assert_not_called()
+
+    def test_entries_stay_sorted_and_capped(self):
+        entries = feeds.unpack(feeds.pack(range(2 * feeds.FEED_LENGTH, 0, -2)))
+        self.assertTrue(feeds.insert_entry(entries, 501))
+        self.assertFalse(feeds.insert_entry(entries, 501))
+        self.assertEqual(len(entries), feeds.FEED_LENGTH)
+        self.assertEqual(list(entries), sorted(entries, reverse=True))
+
+    def test_entries_hold_big_ids(self):
+        self.assertEqual(list(feeds.unpack(feeds.pack([2 ** 40, 2 ** 32, 7]))), [2 ** 40, 2 ** 32, 7])
+
+
+def image_file(width, height, fmt='JPEG', mode='RGB', orientation=None):
+    buffer = io.BytesIO()
+    image = Image.new(mode, (width, height), 'teal')
+    exif = Image.Exif()
+    if orientation:
+        exif[images.ORIENTATION_TAG] = orientation
+    image.save(buffer, fmt, exif=exif)
+    return ContentFile(buffer.getvalue())
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class ImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp(prefix='blog-media-')
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user('author')
+
+    def widths(self, image, fmt):
+        return [variant['width'] for variant in image.variants if variant['format'] == fmt]
+
+    def test_variants_are_smaller_and_never_upscaled(self):
+        name = default_storage.save('uploads/wide.jpg', image_file(1600, 900))
+        image = images.process_image(name, 'content')
+        self.assertEqual((image.width, image.height), (1600, 900))
+        self.assertEqual(self.widths(image, 'webp'), [480, 960, 1440, 1600])
+        self.assertEqual(self.widths(image, 'jpeg'), [480, 960, 1440, 1600])
+        self.assertLess(image.variants[0]['size'], image.size)
+
+    def test_rotated_photos_are_decoded_large_enough(self):
+        # A portrait phone photo: stored landscape, turned upright by EXIF
+        name = default_storage.save('uploads/portrait.jpg', image_file(4032, 3024, orientation=6))
+        image = images.process_image(name, 'content')
+        self.assertEqual((image.width, image.height), (3024, 4032))
+        self.assertEqual(self.widths(image, 'jpeg'), [480, 960, 1440, 1920])
+        largest = image.variants[-1]
+        self.assertEqual((largest['width'], largest['height']), (1920, 2560))
+
+    def test_transparent_images_fall_back_to_png(self):
+        name = default_storage.save('profiles/logo.png', image_file(200, 300, 'PNG', 'RGBA'))
+        image = images.process_image(name, 'avatar')
+        self.assertEqual(self.widths(image, 'png'), [48, 96, 160, 200])
+        self.assertTrue(all(variant['width'] == variant['height'] for variant in image.variants))
+
+    def test_same_photo_is_only_processed_once(self):
+        original = default_storage.save('uploads/a.jpg', image_file(800, 600))
+        # Stored before content addressing, under a name of its own
+        copy = FileSystemStorage().save('uploads/b.jpg', image_file(800, 600))
+        first = images.process_image(original, 'content')
+        with mock.patch.object(images, 'render_variants') as render:
+            second = images.process_image(copy, 'content')
+        render.assert_not_called()
+        self.assertEqual(second.variants, first.variants)
+
+    def test_post_images_are_served_as_pictures(self):
+        name = default_storage.save('uploads/photo.jpg', image_file(1200, 800))
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(
+                author=self.author, title='Photo', slug='photo', status='published',
+                content=f'<p><img alt="A photo" src="{default_storage.url(name)}"></p>',
+            )
+        self.assertTrue(ProcessedImage.objects.filter(source=name).exists())
+        body = self.client.get(reverse('blog_detail', args=[post.slug])).content.decode()
+        self.assertIn('<source type="image/webp"', body)
+        self.assertIn('alt="A photo"', body)
+        self.assertIn('loading="lazy"', body)
+        self.assertRegex(body, r'srcset="[^"]*content-960\.jpeg 960w')
+
+    def test_avatar_tag(self):
+        profile = self.author.profile
+        profile.profile_pic = default_storage.save('profiles/me.jpg', image_file(400, 400))
+        profile.save()
+        template = Template('{% load responsive %}{% avatar pic 96 class="round" %}')
+        plain = template.render(Context({'pic': profile.profile_pic}))
+        self.assertIn(f'src="{profile.profile_pic.url}"', plain)
+        images.process_images([profile.profile_pic.name], 'avatar')
+        rendered = template.render(Context({'pic': profile.profile_pic}))
+        self.assertIn('sizes="96px"', rendered)
+        self.assertIn('avatar-96.webp 96w', rendered)
+        self.assertIn('class="round"', rendered)
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp(prefix='blog-media-')
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media_root, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def save(self, name, data=b'same bytes'):
+        return default_storage.save(name, ContentFile(data))
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.save('uploads/2026/10/18/a.JPG')
+        second = self.save('uploads/2026/10/19/b.jpg')
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^uploads/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(StoredFile.objects.get(name=first).refs, 2)
+        self.assertNotEqual(self.save('uploads/c.jpg', b'other bytes'), first)
+
+    def test_last_reference_removes_the_file(self):
+        name = self.save('profiles/a.png')
+        self.save('profiles/b.png')
+        default_storage.delete(name)
+        self.assertTrue(default_storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(name)
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+    def test_derived_names_are_kept(self):
+        name = self.save('uploads/photo.jpg')
+        thumb = name.replace('.jpg', '_thumb.jpg')
+        self.assertEqual(self.save(thumb, b'thumbnail'), thumb)
+        # Other bytes under a taken derived name get a name of their own
+        self.assertNotEqual(self.save(thumb, b'another thumbnail'), thumb)
+
+    def test_only_generated_names_count_as_content_addressed(self):
+        digest = 'ab' + 'c' * 62
+        for name in (f'uploads/ab/{digest}.jpg', f'ab/{digest}', f'uploads/ab/{digest}_thumb.jpg',
+                     f'uploads/ab/{digest}_thumb_Xy12Z9q.jpg', f'variants/ab/{digest}/content-480.webp'):
+            self.assertTrue(storage.content_addressed(name), name)
+        for name in (f'uploads/{digest}.jpg', f'uploads/cd/{digest}.jpg', f'notes/ab/{digest}-draft.txt',
+                     f'a/b/ab/{digest}.jpg', f'variants/ab/{digest}/../../secret.jpg', f'uploads/ab/{digest}_x.jpg'):
+            self.assertFalse(storage.content_addressed(name), name)
+        # A user-chosen name that merely contains a digest is hashed like any other
+        self.assertRegex(self.save(f'uploads/{digest}.jpg'), r'^uploads/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+
+    def test_last_reference_releases_variants(self):
+        name = default_storage.save('uploads/photo.jpg', image_file(800, 600))
+        copy = default_storage.save('profiles/photo.jpg', image_file(800, 600))
+        processed = images.process_image(name, 'content')
+        images.process_image(copy, 'avatar')
+        variants = [variant['name'] for variant in processed.variants]
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(name)
+        # The profile copy has the same bytes, so the shared variants stay
+        self.assertTrue(all(default_storage.exists(variant) for variant in variants))
+        self.assertFalse(ProcessedImage.objects.filter(source=name).exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            default_storage.delete(copy)
+        self.assertFalse(any(default_storage.exists(variant) for variant in variants))
+        self.assertFalse(ProcessedImage.objects.exists())
+        self.assertEqual(list(StoredFile.objects.all()), [])
+
+    def test_replacing_a_profile_picture_releases_the_old_one(self):
+        profile = User.objects.create_user('author').profile
+        profile.profile_pic = ContentFile(b'first', name='me.jpg')
+        profile.save()
+        old = profile.profile_pic.name
+        profile = Profile.objects.get(pk=profile.pk)
+        profile.profile_pic = ContentFile(b'second', name='me.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertFalse(default_storage.exists(old))
+        self.assertEqual(StoredFile.objects.get(name=profile.profile_pic.name).refs, 1)
+        # Uploading the same photo again doesn't leak a reference
+        profile.profile_pic = ContentFile(b'second', name='again.jpg')
+        profile.save()
+        self.assertEqual(StoredFile.objects.get(name=profile.profile_pic.name).refs, 1)
+
+    def test_content_addressed_files_are_immutable(self):
+        name = self.save('uploads/photo.jpg', b'0123456789')
+        url = default_storage.url(name)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        legacy = FileSystemStorage().save('uploads/old.jpg', ContentFile(b'x'))
+        self.assertNotIn('immutable', self.client.get(default_storage.url(legacy))['Cache-Control'])
+
+    def test_ranges(self):
+        url = default_storage.url(self.save('uploads/clip.mp4', b'0123456789'))
+        response = self.client.get(url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        suffix = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(suffix.streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=10-').status_code, 416)
+        stale = self.client.get(url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(media.byte_range('bytes=0-1,4-5', 10), None)
+
+    def test_sendfile_handoff(self):
+        name = self.save('uploads/photo.jpg')
+        with override_settings(BLOG_MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(default_storage.url(name))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{name}')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+        with override_settings(BLOG_MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(default_storage.url(name))
+        self.assertEqual(response['X-Sendfile'], default_storage.path(name))
+
+    def test_outside_media_root_is_not_found(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.get('/media/uploads/').status_code, 404)
+
+
+def posts_with_authors(request):
+    # No select_related: one author query per post
+    template = Template('{% for post in posts %}\n{{ post.author.username }}{% endfor %}')
+    return HttpResponse(template.render(Context({'posts': Post.objects.order_by('pk')[:6]})))
+
+
+urlpatterns = [path('n-plus-one/', posts_with_authors, name='n_plus_one')]
+
+
+@override_settings(
+    ROOT_URLCONF='blog.tests', BLOG_PERF_ENABLED=True, BLOG_PERF_SIMILAR_THRESHOLD=5, BLOG_VIEW_FLUSH_INTERVAL=0,
+    BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0,
+)
+class PerfTests(TestCase):
+    def setUp(self):
+        authors = [User.objects.create_user(f'author{i}') for i in range(6)]
+        for author in authors:
+            seed_posts(author, 1, prefix=author.username)
+        perf.perf_stats.reset()
+        # Nothing left for the exit-time snapshot to write
+        self.addCleanup(perf.perf_stats.reset)
+
+    def test_query_shapes(self):
+        self.assertEqual(
+            perf.query_shape('SELECT "a" FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            'SELECT "a" FROM "t" WHERE "id" IN (...) LIMIT ?',
+        )
+        self.assertEqual(perf.query_shape('INSERT INTO "t" VALUES (%s, %s), (%s, %s)'), 'INSERT INTO "t" VALUES (%s, %s), ...')
+
+    def test_n_plus_one_is_flagged_with_its_template_line(self):
+        with self.assertLogs('blog.perf', 'WARNING') as logs:
+            self.client.get('/n-plus-one/')
+        self.assertIn('n_plus_one ran 6 similar queries from <unknown source>:2', logs.output[0])
+        entry = perf.perf_stats.views['n_plus_one']
+        self.assertEqual((entry['wall'].count, entry['queries'].maximum), (1, 7))
+        shape, = perf.perf_stats.shapes
+        self.assertIn('"auth_user"', shape)
+        self.assertEqual(perf.perf_stats.shapes[shape]['extra'], 5)
+
+    def test_server_timing(self):
+        with self.assertLogs('blog.perf', 'WARNING'):
+            with override_settings(BLOG_PERF_SERVER_TIMING=True):
+                response = self.client.get('/n-plus-one/')
+            self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+, sql;dur=[\d.]+;desc="7 queries", repeats;')
+            with override_settings(BLOG_PERF_SERVER_TIMING=False):
+                self.assertNotIn('Server-Timing', self.client.get('/n-plus-one/'))
+
+    def test_report_merges_snapshots(self):
+        directory = tempfile.mkdtemp(prefix='blog-perf-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with self.assertLogs('blog.perf', 'WARNING'):
+            self.client.get('/n-plus-one/')
+        with override_settings(BLOG_PERF_DIR=directory):
+            perf.perf_stats.write_snapshot()
+        with open(os.path.join(directory, os.listdir(directory)[0])) as source:
+            with open(os.path.join(directory, 'perf-other-1.json'), 'w') as copy:
+                copy.write(source.read())
+        output = io.StringIO()
+        call_command('perf_report', dir=directory, json=True, stdout=output)
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['views'][0]['view'], 'n_plus_one')
+        self.assertEqual(report['views'][0]['requests'], 2)
+        self.assertEqual(report['shapes'][0]['extra'], 10)
+        self.assertTrue(report['shapes'][0]['site'].startswith('<unknown source>:2'))
+        self.assertEqual(len(report['processes']), 2)
+        self.assertEqual(report['processes'][0]['view_counter']['pending_views'], 0)
+
+    def test_report_shows_view_counter_backlog(self):
+        directory = tempfile.mkdtemp(prefix='blog-perf-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with self.assertLogs('blog.perf', 'WARNING'):
+            self.client.get('/n-plus-one/')
+        backlog = {'pending_posts': 2, 'pending_views': 7, 'flush_lag': 4.5, 'flushed_views': 30, 'last_flush': None}
+        with override_settings(BLOG_PERF_DIR=directory), mock.patch.object(perf.view_counter, 'stats', return_value=backlog):
+            perf.perf_stats.write_snapshot()
+        output = io.StringIO()
+        call_command('perf_report', dir=directory, stdout=output)
+        self.assertRegex(output.getvalue(), r'perf-\S+\.json +7 +2 +4\.5 +30 +never')
+
+    def test_report_adds_up_fragment_hits(self):
+        directory = tempfile.mkdtemp(prefix='blog-perf-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with self.assertLogs('blog.perf', 'WARNING'):
+            self.client.get('/n-plus-one/')
+        stats = {'body': {'hits': 3, 'misses': 1, 'hit_rate': 0.75}, 'total': {'hits': 3, 'misses': 1, 'hit_rate': 0.75}}
+        with override_settings(BLOG_PERF_DIR=directory), mock.patch.object(perf, 'fragment_stats', return_value=stats):
+            perf.perf_stats.write_snapshot()
+        with open(os.path.join(directory, os.listdir(directory)[0])) as source:
+            with open(os.path.join(directory, 'perf-other-1.json'), 'w') as copy:
+                copy.write(source.read())
+        output = io.StringIO()
+        call_command('perf_report', dir=directory, json=True, stdout=output)
+        fragments = json.loads(output.getvalue())['fragments']
+        self.assertEqual(fragments['body'], {'hits': 6, 'misses': 2, 'hit_rate': 0.75})
+        self.assertEqual(list(fragments), ['body', 'total'])
+        output = io.StringIO()
+        call_command('perf_report', dir=directory, stdout=output)
+        self.assertRegex(output.getvalue(), r'body +6 +2 +75\.0%')
+
+
+@override_settings(BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0)
+class BenchmarkTests(TestCase):
+    def test_seed_site_keeps_counters_consistent(self):
+        benchmarks.seed_site(users=5, categories=2, tags=6, posts=40, comments=60, likes=80, bookmarks=30)
+        self.assertEqual(User.objects.filter(username__startswith='bench-').count(), 5)
+        self.assertEqual(Profile.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(Comment.objects.count(), 60)
+        self.assertEqual(Like.objects.count(), 80)
+        for post in Post.objects.all():
+            self.assertEqual(post.like_count, post.likes.count())
+            self.assertEqual(post.comment_count, post.comments.count())
+            self.assertEqual(post.bookmark_count, Bookmark.objects.filter(post=post).count())
+        post = Post.objects.first()
+        self.assertIn(post, search_posts(Post.objects.all(), post.title.split()[0]))
+        self.assertTrue(PostScore.objects.exists())
+
+    def test_runs_with_different_prefixes_coexist(self):
+        counts = {'users': 3, 'categories': 2, 'tags': 12, 'posts': 5, 'comments': 5, 'likes': 5, 'bookmarks': 5}
+        benchmarks.seed_site(**counts)
+        benchmarks.seed_site(**counts, prefix='other')
+        self.assertEqual(Tag.objects.count(), 24)
+        self.assertEqual(Tag.objects.filter(name__contains='-other').count(), 12)
+        self.assertEqual(Post.objects.count(), 10)
+        self.assertEqual(benchmarks.tag_name('x' * 40, 'bench', 149), 'x' * 21 + '-bench149')
+        with self.assertRaises(ValueError):
+            benchmarks.tag_name('word', 'a-very-long-benchmark-prefix', 1)
+
+    def test_compare_flags_regressions(self):
+        def report(p50, queries):
+            return {'meta': {'revision': 'abc'}, 'routes': {
+                'home': {'status': 200, 'p50_ms': p50, 'queries': queries, 'peak_bytes': 100_000},
+            }}
+
+        command = bench_routes.Command(stdout=io.StringIO())
+        command.compare(report(20.0, 5), report(20.5, 5), threshold=0.2)
+        with self.assertRaisesMessage(CommandError, '1 routes regressed: home'):
+            command.compare(report(20.0, 5), report(20.0, 6), threshold=0.2)
+        with self.assertRaisesMessage(CommandError, '1 routes regressed: home'):
+            command.compare(report(20.0, 5), report(30.0, 5), threshold=0.2)
+
+
+@override_settings(
+    BLOG_DATABASE_REPLICAS=['replica'], BLOG_VIEW_FLUSH_INTERVAL=0, BLOG_IMAGE_WORKERS=0, BLOG_RELATED_WORKERS=0,
+)
+class ReplicaTests(TransactionTestCase):
+    # Resolved in setUpClass, once the replica alias below exists
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite file stands in for the replica, as DATABASE_REPLICA_URLS would add
+        directory = tempfile.mkdtemp(prefix='blog-replica-')
+        cls.addClassCleanup(shutil.rmtree, directory, ignore_errors=True)
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict, 'NAME': os.path.join(directory, 'replica.sqlite3'),
+        }
+        cls.addClassCleanup(connections.settings.pop, 'replica')
+        cls.addClassCleanup(connections.__delitem__, 'replica')
+        cls.addClassCleanup(lambda: connections['replica'].close())
+        super().setUpClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='pw')
+        self.post, = seed_posts(self.author, 1)
+        call_command('sync_replica', stdout=io.StringIO())
+        # The replica has not caught up with this yet
+        Post.objects.filter(pk=self.post.pk).update(title='Renamed on the primary')
+        self.client.force_login(self.author)
+
+    def request(self, method, name):
+        request = getattr(RequestFactory(), method)('/')
+        request.resolver_match = mock.Mock(url_name=name)
+        return request
+
+    def test_reads_follow_the_replica_until_the_client_posts(self):
+        detail = reverse('blog_detail', kwargs={'slug': self.post.slug})
+        self.assertNotContains(self.client.get(detail), 'Renamed on the primary')
+        self.assertNotContains(self.client.get(reverse('blog_list')), 'Renamed on the primary')
+        # Other views read the primary
+        self.assertContains(self.client.get(reverse('user_posts')), 'Renamed on the primary')
+
+        response = self.client.post(detail, {'content': 'First!'})
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+        response = self.client.get(detail)
+        self.assertContains(response, 'Renamed on the primary')
+        self.assertContains(response, 'First!')
+
+    def test_fragments_rendered_from_a_lagging_replica_are_not_cached(self):
+        detail = reverse('blog_detail', kwargs={'slug': self.post.slug})
+        self.post.content = '<p>Edited on the primary</p>'
+        self.post.save()
+        # Rendered from the replica, which predates the edit
+        self.assertNotContains(self.client.get(detail), 'Edited on the primary')
+        self.client.cookies[replicas.PIN_COOKIE] = '1'
+        self.assertContains(self.client.get(detail), 'Edited on the primary')
+
+        # Once the lag window is over, replica renders are cached again
+        call_command('sync_replica', stdout=io.StringIO())
+        del self.client.cookies[replicas.PIN_COOKIE]
+        cache.clear()
+        with override_settings(BLOG_REPLICA_PIN_SECONDS=0):
+            before = caching.fragment_stats().get('body', {}).get('hits', 0)
+            self.client.get(detail)
+            self.assertContains(self.client.get(detail), 'Edited on the primary')
+            self.assertEqual(caching.fragment_stats()['body']['hits'], before + 1)
+
+    def test_slugs_are_allocated_on_the_alias_being_saved_to(self):
+        # Only the replica file still holds the "travel" slug
+        Category.objects.create(name='Travel')
+        call_command('sync_replica', stdout=io.StringIO())
+        Category.objects.filter(name='Travel').delete()
+        category = Category(name='Travel!')
+        category.save(using='replica')
+        self.assertEqual(category.slug, 'travel-1')
+
+    def test_router_decisions(self):
+        router = replicas.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post))  # outside a request
+
+        def reads(request, model=Post):
+            token = replicas.current_request.set(request)
+            try:
+                return router.db_for_read(model)
+            finally:
+                replicas.current_request.reset(token)
+
+        self.assertEqual(reads(self.request('get', 'blog_detail')), 'replica')
+        self.assertIsNone(reads(self.request('get', 'user_posts')))
+        self.assertIsNone(reads(self.request('post', 'blog_detail')))
+        self.assertIsNone(reads(self.request('get', 'blog_detail'), model=Session))
+        pinned = self.request('get', 'blog_detail')
+        pinned.COOKIES[replicas.PIN_COOKIE] = '1'
+        self.assertIsNone(reads(pinned))
+
+        request = self.request('get', 'blog_list')
+        with transaction.atomic():
+            self.assertIsNone(reads(request))
+        self.assertEqual(reads(request), 'replica')
+        token = replicas.current_request.set(request)
+        try:
+            self.assertEqual(router.db_for_write(Post), 'default')
+        finally:
+            replicas.current_request.reset(token)
+        self.assertIsNone(reads(request))
+
+        replica_post = Post.objects.using('replica').get(pk=self.post.pk)
+        self.assertTrue(router.allow_relation(replica_post, self.author))
+        self.assertFalse(router.allow_migrate('replica', 'blog'))
@@ -0,0 +1,382 @@
+"""Bulk import and export of posts as JSON Lines or CSV.
+
+Both directions stream: records are read and written one at a time and
+handled in fixed-size batches, so memory stays flat however large the dump.
+A batch of imported posts costs a constant number of queries: authors,
+categories, tags and slugs are resolved with ``IN``/range queries and rows
+go in with ``bulk_create``. ``bulk_create`` skips ``Post.save`` and the
+signals, so the content stats and search index are filled in here.
+
+Record fields: title, slug, content, status, author (username), category
+(name), tags (list of names; comma-separated in CSV), created_at (ISO 8601),
+and in JSON Lines only, comments (list of {user, content, created_at}).
+"""
+import csv
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import search
+from .content import analyze_html
+from .models import Category, Comment, Post
+from .slugs import MAX_ATTEMPTS, allocate_slugs
+from .taxonomy import normalize_tag_names, resolve_tags
+
+FORMATS = ('jsonl', 'csv')
+CSV_FIELDS = ['title', 'slug', 'content', 'status', 'author', 'category', 'tags', 'created_at']
+STATUSES = {value for value, _ in Post._meta.get_field('status').choices}
+TITLE_MAX_LENGTH = Post._meta.get_field('title').max_length
+CATEGORY_MAX_LENGTH = Category._meta.get_field('name').max_length
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def guess_format(path):
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+def read_records(stream, format):
+    """Yield (line number, record dict or InvalidRecord) from a text stream."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            row['tags'] = (row.get('tags') or '').split(',')
+            # line_num counts physical lines, so quoted newlines are accounted for
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield number, InvalidRecord(f'invalid JSON: {exc}')
+            continue
+        if not isinstance(record, dict):
+            yield number, InvalidRecord('expected a JSON object')
+            continue
+        yield number, record
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise InvalidRecord(f'bad created_at {value!r}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def clean_record(record, authors, default_author):
+    title = ' '.join(str(record.get('title') or '').split())[:TITLE_MAX_LENGTH]
+    if not title:
+        raise InvalidRecord('missing title')
+    status = record.get('status') or 'published'
+    if status not in STATUSES:
+        raise InvalidRecord(f'unknown status {status!r}')
+    username = record.get('author')
+    author = authors.get(username) if username else default_author
+    if author is None:
+        raise InvalidRecord(f'unknown author {username!r}' if username else 'missing author')
+    tags = record.get('tags') or []
+    if isinstance(tags, str):
+        tags = [tags]
+    comments = record.get('comments') or []
+    return {
+        'title': title,
+        'slug': record.get('slug') or title,
+        'content': record.get('content') or '',
+        'status': status,
+        'author': author,
+        'category': ' '.join(str(record.get('category') or '').split())[:CATEGORY_MAX_LENGTH],
+        'tags': normalize_tag_names(','.join(str(tag) for tag in tags)),
+        'created_at': parse_timestamp(record.get('created_at')),
+        'comments': [
+            (comment.get('user'), comment.get('content') or '', parse_timestamp(comment.get('created_at')))
+            for comment in comments
+        ],
+    }
+
+
+class ImportResult:
+    def __init__(self):
+        self.posts = 0
+        self.comments = 0
+        self.errors = []  # (line number, message)
+
+
+def import_posts(records, batch_size=500, default_author=None, progress=None):
+    """Create posts from ``(line, record)`` pairs in batches of ``batch_size``.
+
+    Invalid records are skipped and listed in the result's ``errors``.
+    ``progress`` is called with the result after each batch.
+    """
+    result = ImportResult()
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            break
+        import_batch(batch, default_author, result)
+        if progress:
+            progress(result)
+    return result
+
+
+def record_usernames(record):
+    """Return the usernames ``record`` names as author and commenters."""
+    author = record.get('author')
+    if author is not None and not isinstance(author, str):
+        raise InvalidRecord(f'author must be a username, not {type(author).__name__}')
+    comments = record.get('comments') or []
+    if not isinstance(comments, list):
+        raise InvalidRecord(f'comments must be a list, not {type(comments).__name__}')
+    usernames = {author} if author else set()
+    for comment in comments:
+        if not isinstance(comment, dict):
+            raise InvalidRecord(f'comment must be an object, not {type(comment).__name__}')
+        user = comment.get('user')
+        if user is not None and not isinstance(user, str):
+            raise InvalidRecord(f'comment user must be a username, not {type(user).__name__}')
+        if user:
+            usernames.add(user)
+    return usernames
+
+
+def import_batch(batch, default_author, result):
+    errors = []
+    checked = []
+    usernames = set()
+    for line, record in batch:
+        try:
+            if isinstance(record, InvalidRecord):
+                raise record
+            usernames |= record_usernames(record)
+            checked.append((line, record))
+        except InvalidRecord as exc:
+            errors.append((line, str(exc)))
+    users = {user.username: user for user in User.objects.filter(username__in=usernames)}
+
+    rows = []
+    for line, record in checked:
+        try:
+            rows.append(clean_record(record, users, default_author))
+        except (InvalidRecord, AttributeError, TypeError) as exc:
+            errors.append((line, str(exc)))
+    result.errors.extend(sorted(errors))
+    if not rows:
+        return
+
+    for row in rows:
+        row['stats'] = analyze_html(row['content'], keep_text=True)
+
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                posts = insert_rows(rows, users, default_author)
+            break
+        except IntegrityError:
+            # A slug or category taken between allocation and insert; the
+            # next attempt reads the table again
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+    result.posts += len(posts)
+    result.comments += sum(post.comment_count for post in posts)
+
+
+def insert_rows(rows, users, default_author):
+    categories = resolve_categories({row['category'] for row in rows if row['category']}, default_author)
+    tags = {
+        tag.name: tag
+        for tag in resolve_tags(list(dict.fromkeys(name for row in rows for name in row['tags'])), default_author)
+    }
+    slugs = allocate_slugs(Post, [row['slug'] for row in rows])
+
+    posts = []
+    for row, slug in zip(rows, slugs):
+        stats = row['stats']
+        posts.append(Post(
+            author=row['author'],
+            title=row['title'],
+            slug=slug,
+            content=row['content'],
+            status=row['status'],
+            category=categories.get(row['category']),
+            word_count=stats.word_count,
+            read_time=stats.read_time,
+            excerpt=stats.excerpt,
+            comment_count=sum(1 for user, _, _ in row['comments'] if user in users),
+        ))
+    Post.objects.bulk_create(posts)
+
+    # created_at is auto_now_add, which bulk_create applies too
+    dated = []
+    for row, post in zip(rows, posts):
+        if row['created_at']:
+            post.created_at = row['created_at']
+            dated.append(post)
+    if dated:
+        Post.objects.bulk_update(dated, ['created_at'])
+
+    through = Post.tags.through
+    through.objects.bulk_create([
+        through(post_id=post.pk, tag_id=tags[name].pk)
+        for row, post in zip(rows, posts)
+        for name in row['tags'] if name in tags
+    ])
+
+    comments = []
+    comment_dates = []
+    for row, post in zip(rows, posts):
+        for username, content, created_at in row['comments']:
+            if username in users:
+                comments.append(Comment(post=post, user=users[username], content=content))
+                comment_dates.append(created_at)
+    Comment.objects.bulk_create(comments)
+    dated = []
+    for comment, created_at in zip(comments, comment_dates):
+        if created_at:
+            comment.created_at = created_at
+            dated.append(comment)
+    if dated:
+        Comment.objects.bulk_update(dated, ['created_at'])
+
+    search.write_documents([
+        (post.pk, search.build_document(
+            post.title, post.content, row['category'], row['tags'], text=row['stats'].text,
+        ))
+        for row, post in zip(rows, posts)
+    ])
+    return posts
+
+
+def resolve_categories(names, user):
+    """Return {name: Category} for ``names``, bulk creating the missing ones."""
+    if not names:
+        return {}
+    categories = {category.name: category for category in Category.objects.filter(name__in=names)}
+    missing = sorted(names - set(categories))
+    if missing:
+        Category.objects.bulk_create([
+            Category(name=name, slug=slug, user=user)
+            for name, slug in zip(missing, allocate_slugs(Category, missing))
+        ])
+        categories.update((c.name, c) for c in Category.objects.filter(name__in=missing))
+    return categories
+
+
+def export_records(posts, chunk_size=500, comments=True):
+    """Yield one record dict per post, reading ``chunk_size`` posts at a time."""
+    posts = posts.select_related('author', 'category').order_by('pk')
+    prefetch = ['tags']
+    if comments:
+        prefetch.append(Prefetch(
+            'comments',
+            queryset=Comment.objects.select_related('user').order_by('created_at', 'id'),
+        ))
+    for post in posts.prefetch_related(*prefetch).iterator(chunk_size=chunk_size):
+        record = {
+            'title': post.title,
+            'slug': post.slug,
+            'content': post.content,
+            'status': post.status,
+            'author': post.author.username,
+            'category': post.category.name if post.category else '',
+            'tags': [tag.name for tag in post.tags.all()],
+            # isoformat keeps microseconds, which the JSON encoder would drop
+            'created_at': post.created_at.isoformat(),
+        }
+        if comments:
+            record['comments'] = [
+                {'user': c.user.username, 'content': c.content, 'created_at': c.created_at.isoformat()}
+                for c in post.comments.all()
+            ]
+        yield record
+
+
+def write_jsonl(records, stream):
+    count = 0
+    for record in records:
+        stream.write(json.dumps(record, ensure_ascii=False))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+def write_csv(records, stream):
+    writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    count = 0
+    for record in records:
+        record['tags'] = ','.join(record['tags'])
+        writer.writerow(record)
+        count += 1
+    return count
+
+
+# Per-author stats export for the dashboard
+
+# Chunks produced per hop to the sync thread when streaming to an ASGI server
+ASYNC_BATCH_SIZE = 200
+STATS_FIELDS = [
+    'id', 'title', 'slug', 'status', 'created_at', 'updated_at',
+    'views', 'like_count', 'bookmark_count', 'comment_count', 'word_count',
+]
+
+
+def author_stats(author, chunk_size=2000):
+    """Yield one dict of engagement numbers per post by ``author``, newest first.
+
+    The counts are the denormalized counter columns, so this is a single
+    query without joins; iterator() streams it through a server-side cursor
+    where the database supports one.
+    """
+    rows = Post.objects.filter(author=author).order_by('-created_at', '-id').values(*STATS_FIELDS)
+    return rows.iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    """File-like object whose write() hands back the line, for csv.writer."""
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([row[field] for field in fields])
+
+
+def iter_json(rows):
+    """Encode ``rows`` as a JSON array one element at a time."""
+    yield '['
+    separator = ''
+    for row in rows:
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ',\n'
+    yield ']\n'
+
+
+async def aiter_chunks(chunks, batch_size=ASYNC_BATCH_SIZE):
+    """Serve a sync chunk iterator, such as iter_csv(), to an ASGI server.
+
+    Given a sync iterator, Django under ASGI reads it to the end before
+    sending a byte. This pulls a batch at a time in the thread that owns the
+    database connection, so the download streams while rows are fetched.
+    """
+    chunks = iter(chunks)
+    while batch := await sync_to_async(list)(itertools.islice(chunks, batch_size)):
+        for chunk in batch:
+            yield chunk
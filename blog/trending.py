@@ -0,0 +1,172 @@
+"""Trending posts: time-decayed engagement scores, precomputed.
+
+Every event (view, like, bookmark, comment) is worth its weight halved every
+BLOG_TRENDING_HALF_LIFE_HOURS. A post's trending score is the sum over its
+events. Decaying every score on every run would rewrite the whole table, so
+PostScore stores the score against a fixed epoch instead,
+``log2(sum(weight * 2 ** ((t - EPOCH) / half_life)))``. Ordering by it is
+the same as ordering by the decayed score at any moment. An incremental run
+therefore only touches posts with new events since the previous run and
+adds them with a log-sum-exp. Unlikes and deleted comments can't be
+subtracted that way; a periodic ``--full`` run rebuilds everything.
+
+Likes, bookmarks and comments are counted per post and hour in SQL, so a
+run reads one row per (post, hour) rather than one per event. Views carry
+no timestamp: new views are dated to the run (the post's creation on a full
+rebuild).
+
+Top lists read PostScore in index order and stop after a page, whatever
+the number of posts.
+"""
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Bookmark, Comment, Like, Post, PostScore, TrendingRun
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+WEIGHTS = {'view': 1.0, 'like': 4.0, 'comment': 6.0, 'bookmark': 8.0}
+EVENT_MODELS = {'like': Like, 'bookmark': Bookmark, 'comment': Comment}
+TRENDING_ORDERING = ('-score', '-post_id')
+RUNS_KEPT = 50
+
+
+def half_life():
+    return timedelta(hours=getattr(settings, 'BLOG_TRENDING_HALF_LIFE_HOURS', 24))
+
+
+def exponent(when, half_life_seconds):
+    return (when - EPOCH).total_seconds() / half_life_seconds
+
+
+def log_add(a, b):
+    """log2(2**a + 2**b) without overflow; None stands for an empty sum."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def decayed(score, now=None):
+    """The score decayed to ``now``, i.e. the weighted event total as of now."""
+    return 2 ** (score - exponent(now or timezone.now(), half_life().total_seconds()))
+
+
+class ScoreAccumulator:
+    def __init__(self):
+        self.half_life_seconds = half_life().total_seconds()
+        self.scores = defaultdict(lambda: None)
+        self.events = 0
+
+    def add(self, post_id, kind, count, when):
+        if count <= 0:
+            return
+        value = math.log2(WEIGHTS[kind] * count) + exponent(when, self.half_life_seconds)
+        self.scores[post_id] = log_add(self.scores[post_id], value)
+        self.events += count
+
+
+def add_engagement(accumulator, since, until, chunk_size):
+    middle = timedelta(minutes=30)
+    for kind, model in EVENT_MODELS.items():
+        events = model.objects.order_by().filter(created_at__lte=until)
+        if since is not None:
+            events = events.filter(created_at__gt=since)
+        rows = events.values('post_id', hour=TruncHour('created_at')).annotate(n=Count('pk'))
+        for row in rows.iterator(chunk_size=chunk_size):
+            accumulator.add(row['post_id'], kind, row['n'], row['hour'] + middle)
+
+
+def recompute(full=False, now=None, chunk_size=2000):
+    """Bring PostScore up to ``now`` and return the TrendingRun recorded."""
+    started = time.perf_counter()
+    now = now or timezone.now()
+    last = TrendingRun.objects.order_by('-until').first()
+    if last is None:
+        full = True
+    since = None if full else last.until
+
+    accumulator = ScoreAccumulator()
+    add_engagement(accumulator, since, now, chunk_size)
+
+    # Posts whose view count moved since the last run, plus every post with new events
+    posts = Post.objects.filter(status='published')
+    if not full:
+        posts = posts.filter(counters_updated_at__gt=since)
+    post_ids = set(posts.values_list('pk', flat=True).iterator(chunk_size=chunk_size))
+    post_ids.update(accumulator.scores)
+
+    touched = 0
+    post_ids = sorted(post_ids)
+    with transaction.atomic():
+        if full:
+            PostScore.objects.all().delete()
+        for start in range(0, len(post_ids), chunk_size):
+            touched += save_scores(post_ids[start:start + chunk_size], accumulator, full, now)
+        run = TrendingRun.objects.create(
+            until=now,
+            full=full,
+            posts=touched,
+            events=accumulator.events,
+            duration=time.perf_counter() - started,
+        )
+        old_runs = TrendingRun.objects.order_by('-until').values_list('pk', flat=True)[RUNS_KEPT:]
+        TrendingRun.objects.filter(pk__in=list(old_runs)).delete()
+    return run
+
+
+def save_scores(post_ids, accumulator, full, now):
+    posts = Post.objects.filter(pk__in=post_ids).values('pk', 'status', 'category_id', 'views', 'created_at')
+    existing = {} if full else PostScore.objects.in_bulk(post_ids)
+    created, updated, dropped = [], [], []
+    for post in posts:
+        pk = post['pk']
+        row = existing.get(pk)
+        if post['status'] != 'published':
+            if row is not None:
+                dropped.append(pk)
+            continue
+        new_views = post['views'] - (row.views_seen if row else 0)
+        accumulator.add(pk, 'view', new_views, post['created_at'] if full or row is None else now)
+        score = log_add(row.score if row else None, accumulator.scores.get(pk))
+        if score is None:
+            continue
+        if row is None:
+            created.append(PostScore(post_id=pk, category_id=post['category_id'], score=score, views_seen=post['views']))
+        else:
+            row.score, row.category_id, row.views_seen = score, post['category_id'], max(row.views_seen, post['views'])
+            updated.append(row)
+    PostScore.objects.bulk_create(created)
+    if updated:
+        # One prepared UPDATE run per row; bulk_update's CASE per column
+        # costs more to build in Python than to execute
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {PostScore._meta.db_table} SET score = %s, category_id = %s, views_seen = %s '
+                f'WHERE post_id = %s',
+                [(row.score, row.category_id, row.views_seen, row.pk) for row in updated],
+            )
+    PostScore.objects.filter(pk__in=dropped).delete()
+    return len(created) + len(updated) + len(dropped)
+
+
+def trending_scores(category_id=None):
+    """PostScore rows best first, with the posts joined for listing."""
+    scores = PostScore.objects.select_related('post__author', 'post__category').prefetch_related('post__tags')
+    scores = scores.defer('post__content')
+    if category_id:
+        scores = scores.filter(category_id=category_id)
+    return scores
+
+
+def top_posts(limit=10, category_id=None):
+    return [score.post for score in trending_scores(category_id).order_by(*TRENDING_ORDERING)[:limit]]
@@ -1,10 +1,13 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.index, name='home'),
     path('blog/', views.blog_list, name='blog_list'),
+    path('trending/', views.trending, name='trending'),
+    path('for-you/', views.feed, name='feed'),
     path('blog/<slug:slug>',views.blog_detail,name='blog_detail'),
+    path('blog/<slug:slug>/comments/',views.comment_page,name='comment_page'),
     path('add/blog/',views.create_blog,name= 'create_blog'),
     path('edit/blog/<int:pk>',views.update_blog,name= 'update_blog'),
     path('delete/blog/<int:pk>',views.delete_blog,name= 'delete_blog'),
@@ -16,9 +19,14 @@ urlpatterns = [
     path('profile/change-password/', views.change_password, name='change_password'),
     path('my-posts/', views.user_posts, name='user_posts'),
     path('dashboard',views.user_dashboard,name='user_dashboard'),
+    path('dashboard/export/',views.export_dashboard,name='export_dashboard'),
     path('post/<int:post_id>/like/', views.like_post, name='like_post'),
     path('post/<int:post_id>/bookmark/', views.bookmark_post, name='add_bookmark'),
     path('saved-posts/', views.saved_posts, name='saved_posts'),
+    path('api/posts/', api.post_list, name='api_post_list'),
+    path('api/posts/<slug:slug>/', api.post_detail, name='api_post_detail'),
+    path('api/posts/<int:post_id>/like/', api.toggle_engagement, {'kind': 'like'}, name='api_like_post'),
+    path('api/posts/<int:post_id>/bookmark/', api.toggle_engagement, {'kind': 'bookmark'}, name='api_bookmark_post'),
 
 
 
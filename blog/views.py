@@ -1,5 +1,7 @@
-from django.shortcuts import render,redirect,get_object_or_404
-from .models import Post,Category,Tag,Like,Bookmark
+import asyncio
+from asgiref.sync import sync_to_async
+from django.shortcuts import render,redirect,get_object_or_404,aget_object_or_404
+from .models import Post,Category,Comment,Like,Bookmark
 from .forms import PostForm,RegisterForm,LoginForm,ProfileUpdateForm,CommentForm
 from django.contrib.auth import login,logout
 from django.contrib.auth.decorators import login_required
@@ -8,7 +10,41 @@ from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
-from django.db.models import Q
+from .search import search_posts
+from .pagination import paginate, paginate_request, apaginate_request, add_page_queries, decode_cursor, get_page_size, POST_ORDERING, COMMENT_ORDERING
+from .counters import view_counter, adjust_counts
+from .engagement import set_engagement, aattach_user_state
+from django.db import transaction
+from django.template.loader import render_to_string
+from .caching import cached_fragment
+from .taxonomy import save_post_form
+from .transfer import STATS_FIELDS, aiter_chunks, author_stats, iter_csv, iter_json
+from .trending import TRENDING_ORDERING, trending_scores
+from .related import related_posts
+from .feeds import feed_page
+from .images import queue_images
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.conf import settings
+
+# Async views render in a worker thread: templates may still touch lazy
+# sync-only objects such as request.user or the messages storage
+arender = sync_to_async(render)
+
+async def alist(queryset):
+    return [item async for item in queryset]
+
+async def aresult(value):
+    return value
+
+@sync_to_async
+def aget_user(request):
+    # request.auser() caches separately from the lazy request.user the
+    # templates read, so load request.user itself and share one lookup
+    request.user.is_authenticated
+    return request.user
 
 def register_view(request):
     if request.method == 'POST':
@@ -26,6 +62,9 @@ def register_view(request):
             profile = user.profile  # auto created from signal
             profile.profile_pic = form.cleaned_data.get('profile_pic')
             profile.save()
+            if profile.profile_pic:
+                # Resized off-request once the upload is committed
+                queue_images([profile.profile_pic.name], 'avatar')
 
             login(request, user)
             messages.success(request,'Registration succesful. You are now logged in.')
@@ -55,31 +94,40 @@ def logout_view(request):
     messages.success(request,'You are now logged out.')
     return redirect('login')
 
-def index(request):
-    blogs = Post.objects.all().order_by('-created_at')
-    return render(request, 'blog/index.html',{'blogs' : blogs})
-
-def blog_list(request):
-    blogs = Post.objects.select_related('category', 'author').prefetch_related('tags')
-    categories = Category.objects.values('id','name').distinct()
+async def index(request):
+    blogs, user = await asyncio.gather(
+        apaginate_request(request, Post.objects.for_listing()),
+        aget_user(request),
+    )
+    await aattach_user_state(blogs, user)
+    return await arender(request, 'blog/index.html',{'blogs' : blogs})
+
+async def blog_list(request):
+    user = await aget_user(request)
+    blogs = Post.objects.for_listing()
     query = request.GET.get('q')
     category_id = request.GET.get('category')
+    ordering = POST_ORDERING
 
     if category_id:
         blogs = blogs.filter(category_id=category_id)
     if query:
-        blogs = blogs.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(tags__name__icontains=query)
-        ).distinct()
+        # Search results page by relevance rather than date
+        blogs = await sync_to_async(search_posts)(blogs, query)
+        ordering = ('search_rank', 'id')
 
     # Count only user's own posts
-    if request.user.is_authenticated:
-        user_posts_count = Post.objects.filter(author=request.user).count()
+    if user.is_authenticated:
+        user_posts_count = Post.objects.filter(author=user).acount()
     else:
-        user_posts_count = 0
+        user_posts_count = aresult(0)
+
+    blogs, categories, user_posts_count = await asyncio.gather(
+        apaginate_request(request, blogs, ordering=ordering),
+        alist(Category.objects.values('id','name').distinct()),
+        user_posts_count,
+    )
+    await aattach_user_state(blogs, user)
 
     context = {
         'blogs': blogs,
@@ -87,32 +135,75 @@ def blog_list(request):
         'user_posts_count': user_posts_count,
         'current_year': timezone.now().year,
     }
-    return render(request, 'blog/blog_list.html', context)
-
-def blog_detail(request, slug):
+    return await arender(request, 'blog/blog_list.html', context)
 
-    blog = get_object_or_404(Post, slug=slug)
-    comments = blog.comments.all()
-
-    # Check if user already liked this post
-    is_liked = False
-    if request.user.is_authenticated:
-        is_liked = Like.objects.filter(post=blog, user=request.user).exists()
+async def trending(request):
+    category_id = request.GET.get('category')
+    if category_id and not category_id.isdigit():
+        category_id = None
+    scores, categories = await asyncio.gather(
+        apaginate_request(request, trending_scores(category_id), ordering=TRENDING_ORDERING),
+        alist(Category.objects.values('id','name')),
+    )
+    context = {
+        'scores': scores,
+        'categories': categories,
+        'current_category': int(category_id) if category_id else None,
+    }
+    return await arender(request, 'blog/trending.html', context)
 
-    # Check if user already boomarked this post
-    is_bookmarked = False
-    if request.user.is_authenticated:
-        is_bookmarked = Bookmark.objects.filter(post=blog, user=request.user).exists()
+@login_required
+async def feed(request):
+    # Posts from the authors, categories and tags the user likes and saves.
+    # login_required already loaded auser() and the template doesn't read
+    # request.user, so reuse that rather than aget_user()
+    user = await request.auser()
+    blogs = await sync_to_async(feed_page)(user, request.GET.get('cursor'), get_page_size(request))
+    add_page_queries(request, blogs)
+    await aattach_user_state(blogs, user)
+    return await arender(request, 'blog/feed.html', {'blogs': blogs})
+
+def add_comment(blog, user, form):
+    comment = form.save(commit=False)
+    comment.post = blog
+    comment.user = user
+    with transaction.atomic():
+        comment.save()
+        adjust_counts(blog.id, comment_count=1)
+    return comment
+
+def render_comments(template, blog, cursor=None):
+    # One page of comments; later pages come from comment_page
+    comments = paginate(
+        blog.comments.select_related('user'),
+        cursor=cursor,
+        page_size=getattr(settings, 'BLOG_COMMENT_PAGE_SIZE', 20),
+        ordering=COMMENT_ORDERING,
+    )
+    return render_to_string(template, {'blog': blog, 'comments': comments})
+
+async def comment_page(request, slug):
+    cursor = request.GET.get('cursor')
+    if decode_cursor(cursor, Comment, COMMENT_ORDERING) is None:
+        return HttpResponseBadRequest('Missing or invalid cursor')
+    blog = await aget_object_or_404(Post.objects.only('id', 'slug', 'comment_count'), slug=slug)
+    # Cached like the first page, and dropped with it when a comment changes
+    html = await sync_to_async(cached_fragment)(blog.id, f'comments:{cursor}', lambda: render_comments(
+        'blog/comment_page.html', blog, cursor
+    ))
+    return HttpResponse(html)
+
+async def blog_detail(request, slug):
+
+    blog = await aget_object_or_404(Post.objects.select_related('author'), slug=slug)
+    user = await aget_user(request)
 
     # Handle comment form submission
     if request.method == "POST":
-        if request.user.is_authenticated:
+        if user.is_authenticated:
             form = CommentForm(request.POST)
             if form.is_valid():
-                comment = form.save(commit=False)
-                comment.post = blog
-                comment.user = request.user
-                comment.save()
+                await sync_to_async(add_comment)(blog, user, form)
                 return redirect('blog_detail', slug=blog.slug)
         else:
             return redirect('login')
@@ -121,26 +212,67 @@ def blog_detail(request, slug):
 
     # View counter
     session_key = f'post_viewed_{blog.id}'
-    if not request.session.get(session_key, False):
-        blog.views = blog.views + 1
-        blog.save(update_fields=['views'])
-        request.session[session_key] = True
+    if not await request.session.aget(session_key, False):
+        await sync_to_async(view_counter.record)(blog.id)
+        await request.session.aset(session_key, True)
+
+    # Check if user already liked / bookmarked this post
+    if user.is_authenticated:
+        is_liked = Like.objects.filter(post=blog, user=user).aexists()
+        is_bookmarked = Bookmark.objects.filter(post=blog, user=user).aexists()
+    else:
+        is_liked = is_bookmarked = aresult(False)
+
+    # Shared fragments are cached per post; only the like/bookmark state is per user
+    post_body = sync_to_async(cached_fragment)(blog.id, 'body', lambda: render_to_string(
+        'blog/post_body.html', {'blog': blog}
+    ))
+    comment_list = sync_to_async(cached_fragment)(blog.id, 'comments', lambda: render_comments(
+        'blog/comment_list.html', blog
+    ))
+
+    is_liked, is_bookmarked, post_body, comment_list, related = await asyncio.gather(
+        is_liked, is_bookmarked, post_body, comment_list, alist(related_posts(blog))
+    )
 
     context = {
         'blog': blog,
-        'comments': comments,
+        'post_body': post_body,
+        'comment_list': comment_list,
+        'related': related,
         'form': form,
         'is_liked': is_liked, 
         'is_bookmarked': is_bookmarked, 
-        'total_likes': blog.likes.count(),  # optional but good
+        'total_likes': blog.like_count,
     }
-    return render(request, 'blog/blog_detail.html', context)
+    return await arender(request, 'blog/blog_detail.html', context)
 
 
 @login_required
 def user_dashboard(request):
-    blogs = Post.objects.filter(author=request.user)
-    return render(request,'blog/user_dashboard.html',{'blogs': blogs})
+    posts = Post.objects.filter(author=request.user)
+    blogs = paginate_request(request, posts.for_listing())
+    totals = posts.aggregate(
+        posts=Count('id'),
+        views=Coalesce(Sum('views'), 0),
+        likes=Coalesce(Sum('like_count'), 0),
+        bookmarks=Coalesce(Sum('bookmark_count'), 0),
+        comments=Coalesce(Sum('comment_count'), 0),
+    )
+    return render(request,'blog/user_dashboard.html',{'blogs': blogs, 'totals': totals})
+
+@login_required
+def export_dashboard(request):
+    rows = author_stats(request.user)
+    if request.GET.get('format') == 'json':
+        chunks, content_type, filename = iter_json(rows), 'application/json', 'posts.json'
+    else:
+        chunks, content_type, filename = iter_csv(rows, STATS_FIELDS), 'text/csv', 'posts.csv'
+    if isinstance(request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
     
 @login_required
 def create_blog(request):
@@ -148,32 +280,7 @@ def create_blog(request):
         form = PostForm(request.POST, request.FILES, user=request.user)
         
         if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-
-            # Handle new category BEFORE saving post
-            new_category = form.cleaned_data.get('new_category')
-            if new_category:
-                category_obj, created = Category.objects.get_or_create(
-                    name=new_category, 
-                    user=request.user
-                )
-                post.category = category_obj
-
-            post.save()  # Save after assigning category
-
-            form.save_m2m()  # Save selected tags from form
-            # Now handle tags AFTER post.save()
-            new_tags = form.cleaned_data.get('new_tags')
-            if new_tags:
-                tag_list = [tag.strip() for tag in new_tags.split(',')]
-                for tag_name in tag_list:
-                    tag_obj, created = Tag.objects.get_or_create(
-                        name=tag_name, 
-                        user=request.user
-                    )
-                    post.tags.add(tag_obj)
-
+            save_post_form(form, request.user)
             return redirect('blog_list')
 
     else:
@@ -188,32 +295,7 @@ def update_blog(request, pk):
     if request.method == 'POST':
         form = PostForm(request.POST, instance=blog,user = request.user)   # bind instance
         if form.is_valid():
-            post = form.save(commit=False)
-            post.author = request.user
-            post.save()
-
-            # Handle new category
-            new_category = form.cleaned_data.get('new_category')
-            if new_category:
-                category_obj, created = Category.objects.get_or_create(
-                    name=new_category,
-                    user=request.user
-                )
-                post.category = category_obj
-                post.save()
-
-            # Handle new tags
-            new_tags = form.cleaned_data.get('new_tags')
-            if new_tags:
-                tag_list = [tag.strip() for tag in new_tags.split(',')]
-                for tag_name in tag_list:
-                    tag_obj, created = Tag.objects.get_or_create(
-                        name=tag_name,
-                        user=request.user
-                    )
-                    post.tags.add(tag_obj)
-
-            form.save_m2m()
+            save_post_form(form, request.user)
             return redirect('blog_list')
     else:
         form = PostForm(instance=blog,user = request.user)  # Pre-filled form in GET
@@ -252,6 +334,8 @@ def edit_profile_view(request):
             if form.cleaned_data.get('profile_pic'):
                 profile.profile_pic = form.cleaned_data.get('profile_pic')
             profile.save()
+            if form.cleaned_data.get('profile_pic'):
+                queue_images([profile.profile_pic.name], 'avatar')
 
             messages.success(request, "Profile updated successfully!")
             return redirect('blog_list')
@@ -271,7 +355,7 @@ def edit_profile_view(request):
 
 @login_required
 def user_posts(request):
-    posts = Post.objects.filter(author=request.user)
+    posts = Post.objects.filter(author=request.user).for_listing()
     categories = Category.objects.values('id','name').distinct()
     query = request.GET.get('q')
     category_id = request.GET.get('category')
@@ -279,12 +363,9 @@ def user_posts(request):
         posts = posts.filter(category_id=category_id)
     
     if query:
-        posts = posts.filter(
-            Q(title__icontains=query) |
-            Q(content__icontains=query) |
-            Q(category__name__icontains=query) |
-            Q(tags__name__icontains=query)
-        ).distinct()
+        posts = paginate_request(request, search_posts(posts, query), ordering=('search_rank', 'id'))
+    else:
+        posts = paginate_request(request, posts)
     return render(request, 'blog/user_posts.html', {'posts': posts,'categories': categories})
 
 @login_required
@@ -305,44 +386,30 @@ def like_post(request, post_id):
     if not request.user.is_authenticated:
         return redirect('login')
 
-    post = get_object_or_404(Post, id=post_id)
-
-    # Check if the user already liked the post
-    existing_like = Like.objects.filter(post=post, user=request.user).first()
-
-    if existing_like:
-        # Unlike
-        existing_like.delete()
-    else:
-        # Like
-        Like.objects.create(post=post, user=request.user)
-
+    post = get_object_or_404(Post.objects.only('id', 'slug'), id=post_id)
+    set_engagement('like', post.id, request.user)  # Like or unlike
     return redirect('blog_detail', slug=post.slug)
 
 def bookmark_post(request, post_id):
     if not request.user.is_authenticated:
         return redirect('login')
 
-    post = get_object_or_404(Post, id=post_id)
-
-    # Check if the user already liked the post
-    existing_bookmark = Bookmark.objects.filter(post=post, user=request.user).first()
-
-    if existing_bookmark:
-        # Unlike
-        existing_bookmark.delete()
-    else:
-        # Like
-        Bookmark.objects.create(post=post, user=request.user)
-
+    post = get_object_or_404(Post.objects.only('id', 'slug'), id=post_id)
+    set_engagement('bookmark', post.id, request.user)  # Save or unsave
     return redirect('blog_detail', slug=post.slug)
 
 @login_required
-def saved_posts(request):
-    # get all posts saved by this user
-    saved = Bookmark.objects.filter(user=request.user).select_related("post")
+async def saved_posts(request):
+    # get all posts saved by this user; like feed, reuse login_required's
+    # auser() since the template doesn't read request.user
+    user = await request.auser()
+    saved = await apaginate_request(
+        request, Bookmark.objects.filter(user=user).select_related("post").defer("post__content")
+    )
+    # Every post here is bookmarked; only the like state needs looking up
+    await aattach_user_state([item.post for item in saved], user, kinds=('like',))
 
     context = {
         "saved_posts": saved
     }
-    return render(request, "blog/saved_posts.html", context)
\ No newline at end of file
+    return await arender(request, "blog/saved_posts.html", context)
\ No newline at end of file
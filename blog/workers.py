@@ -0,0 +1,59 @@
+"""Background thread pools for work that runs after a request commits.
+
+Each pool reads its size from a setting when it starts, so tests can set it
+to 0 to run the work inline. blog.images resizes uploads in one pool
+(BLOG_IMAGE_WORKERS) and blog.related refreshes related posts in another
+(BLOG_RELATED_WORKERS), so a burst of uploads doesn't hold up related lists
+and the other way round.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """A lazily started thread pool, restarted in forked processes."""
+
+    def __init__(self, setting=None, default=1, workers=None, name='blog-workers'):
+        self.setting = setting
+        self.default = default
+        self.name = name
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    @property
+    def workers(self):
+        if self._workers is not None:
+            return self._workers
+        return getattr(settings, self.setting, self.default) if self.setting else self.default
+
+    def submit(self, func, *args):
+        if self.workers <= 0:
+            return func(*args)
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+            return self._executor.submit(self._run, func, *args)
+
+    def _run(self, func, *args):
+        try:
+            return func(*args)
+        except Exception:
+            logger.exception('Background task %s failed', func.__name__)
+        finally:
+            connection.close()
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=wait)
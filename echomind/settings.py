@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+
+from .databases import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.perf.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'blog.replicas.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'echomind.urls'
@@ -75,12 +80,70 @@ WSGI_APPLICATION = 'echomind.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# DATABASE_URL picks the primary (see echomind.databases for the URL forms) and
+# DATABASE_REPLICA_URLS, comma-separated, adds read replicas as replica1, replica2...
+# blog.replicas.ReplicaRouter sends the BLOG_REPLICA_VIEWS' GET reads to them
+
+SQLITE_OPTIONS = {
+    # Concurrent writers wait for the lock instead of failing with
+    # "database is locked"; IMMEDIATE takes it at BEGIN so a
+    # transaction never has to upgrade a read lock mid-way
+    'timeout': 20,
+    'transaction_mode': 'IMMEDIATE',
+    # In WAL mode readers no longer block the writer, nor it them
+    'init_command': 'PRAGMA journal_mode=WAL;',
+}
+# Seconds a connection is reused across requests; health checks replace one
+# the server dropped instead of failing the request
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 60))
+
+
+def database(url):
+    return database_config(url, BASE_DIR, conn_max_age=DATABASE_CONN_MAX_AGE, sqlite_options=SQLITE_OPTIONS)
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database(os.environ.get('DATABASE_URL', 'sqlite:///db.sqlite3')),
 }
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['TEST'] = {
+        # A file rather than shared-cache memory, whose table locks
+        # fail immediately, so threaded tests see real SQLite locking
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    }
+
+BLOG_DATABASE_REPLICAS = []
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    alias = f'replica{number}'
+    DATABASES[alias] = database(url.strip())
+    # Tests run against the primary alone
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    BLOG_DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['blog.replicas.ReplicaRouter']
+BLOG_REPLICA_VIEWS = ['blog_list', 'blog_detail']
+# After a POST the client reads from the primary for this long, covering replication lag
+BLOG_REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; CACHE_BACKEND=file shares the cache between processes
+
+if os.environ.get('CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / '.django_cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'echomind',
+        }
+    }
 
 
 # Password validation
@@ -124,6 +187,12 @@ STATIC_ROOT = BASE_DIR / 'static'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploads are stored by content hash and reference-counted (see blog.storage)
+STORAGES = {
+    'default': {'BACKEND': 'blog.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 CKEDITOR_UPLOAD_PATH = 'uploads/'
 CKEDITOR_IMAGE_BACKEND = "pillow"
 CKEDITOR_JQUERY_URL = '//ajax.googleapis.com/ajax/libs/jquery/2.1.1/jquery.min.js' 
@@ -143,3 +212,65 @@ CKEDITOR_CONFIGS = {
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Blog listings
+# Page size for cursor-paginated listings; ?page_size= may lower or raise it up to the max
+
+BLOG_PAGE_SIZE = 20
+BLOG_MAX_PAGE_SIZE = 100
+
+# Comments on blog_detail load this many at a time
+BLOG_COMMENT_PAGE_SIZE = 20
+
+# Post views are buffered in memory and written every N seconds; 0 writes each view immediately
+BLOG_VIEW_FLUSH_INTERVAL = 5
+
+# Seconds a cached blog_detail fragment lives; edits invalidate it sooner
+BLOG_FRAGMENT_CACHE_TIMEOUT = 600
+
+# Trending scores lose half their weight every N hours (see blog.trending)
+BLOG_TRENDING_HALF_LIFE_HOURS = 24
+
+# Threads resizing uploaded images into variants (see blog.images) and
+# refreshing related posts after edits (see blog.related); 0 works inline
+BLOG_IMAGE_WORKERS = 2
+BLOG_RELATED_WORKERS = 1
+
+# Media files are sent by the front-end server when set: 'x-accel-redirect'
+# (nginx, internal location at BLOG_MEDIA_ACCEL_PREFIX) or 'x-sendfile';
+# None streams them from Django (see blog.media)
+BLOG_MEDIA_SENDFILE = None
+BLOG_MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Per-view timing and SQL statistics (see blog.perf); perf_report reads the
+# snapshots written to BLOG_PERF_DIR. On with DEBUG unless the
+# BLOG_PERF_ENABLED environment variable (0 or 1) says otherwise; the test
+# runner turns it off. Server-Timing headers expose timings to clients, so
+# they follow DEBUG
+BLOG_PERF_ENABLED = bool(int(os.environ.get('BLOG_PERF_ENABLED', DEBUG)))
+BLOG_PERF_DIR = BASE_DIR / 'perf'
+BLOG_PERF_SNAPSHOT_INTERVAL = 30
+BLOG_PERF_SIMILAR_THRESHOLD = 5
+BLOG_PERF_SERVER_TIMING = DEBUG
+
+# Repeated-query warnings from blog.perf, with their template line
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'timestamped': {'format': '{asctime} {levelname} {name}: {message}', 'style': '{'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'timestamped'},
+    },
+    'loggers': {
+        'blog.perf': {
+            'handlers': ['console'],
+            'level': os.environ.get('BLOG_PERF_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+TEST_RUNNER = 'blog.testing.BlogTestRunner'
@@ -14,12 +14,15 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf.urls.static import static
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from ckeditor_uploader import views as ckeditor_views
+from blog import media
 urlpatterns = [
     path('admin/', admin.site.urls),
     # FIX: remove Django-admin login requirement for CKEditor upload
@@ -27,10 +30,10 @@ urlpatterns = [
     path('ckeditor/browse/', login_required(ckeditor_views.browse), name='ckeditor_browse'),
 
     path('ckeditor/', include('ckeditor_uploader.urls')),
+    # Media is served with cache headers by blog.media (or handed to the front-end server)
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), media.serve, name='media'),
     path('',include('blog.urls')),  
 ]
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 if settings.DEBUG:
     urlpatterns+=static(settings.STATIC_URL,document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 